@@ -1,107 +1,1172 @@
+from functools import partial
 from pathlib import Path
+import argparse
 import importlib.util
 import sys
 import subprocess
+import tempfile
+import time
 import json
 
+from src.utils import faults
+from src.utils import fingerprint
+from src.utils import fleet
 from src.utils import helper
+from src.utils import histogram
+from src.utils import history
+from src.utils import isolation
+from src.utils import linearizability
+from src.utils import loadgen
+from src.utils import metrics
+from src.utils import netem
+from src.utils import pipeline
+from src.utils import plan
+from src.utils import profiling
+from src.utils import replicas
+from src.utils import resources
+from src.utils import snapshot
+from src.utils import steady
+from src.utils import store
+from src.utils import sweep
+from src.utils import trials
+from src.utils import workloads
+from src.utils import ycsb
 
 YCSB_DIR = Path("./src/ycsb")
 YCSB_BIN = Path("./bin/ycsb")
 YCSB_WORKLOAD_DIR = Path("./workloads")
-WORKLOADS = ["read-heavy", "update-heavy"]
+YCSB_WORKLOADS = ["read-heavy", "update-heavy"]
+# YCSB's workload files, then the library of src/utils/workloads.py
+WORKLOADS = [*YCSB_WORKLOADS, *workloads.names()]
+ENGINES = ["ycsb", "native"]
+NATIVE_RATE = 1000
 DATA = "data.local.json"
+RESULTS_DB = store.RESULTS_DB
+TAIL_PERCENTILES = (99.9, 99.99)
 
 selected_project = None
+selected_module = None
 
 
 def main() -> None:
     """
-    List out all directories in sut/ for user to pick.
+    Without arguments, list out all directories in sut/ for user to pick.
     The chosen directory will have its run.py script called
     to setup the protocol instance before running YCSB benchmark.
+
+    With --plan or --sut, run every SUT x protocol x workload cell of the
+    plan unattended, see src/utils/plan.py.
     """
-    global selected_project
-    systems_under_test = Path("./sut")
-    systems = [p for p in systems_under_test.iterdir() if p.is_dir()]
-    systems.sort()
+    global selected_project, selected_module
+    args = parse_args(sys.argv[1:])
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    if args.plan or args.sut:
+        run_plan(plan.load_plan(args.plan) if args.plan
+                 else plan.plan_from_args(args), dry_run=args.dry_run)
+        return
+
+    systems = list_systems()
 
     options = [{"num": i, "text": sys.name}
                for i, sys in enumerate(systems, start=1)]
     num = helper.get_option(1, len(options), options)
 
     selected_project = systems[num-1]
-    path = "." / selected_project / "run.py"
-    spec = importlib.util.spec_from_file_location(f"{selected_project.name}",
-                                                  path)
+    module = load_sut(selected_project)
+    selected_module = module
+
+    print(module)
+    module.main(run_ycsb)
+
+
+def parse_args(argv) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the systems under test in sut/. Runs "
+                    "interactively when no plan or SUT is given.")
+    parser.add_argument("--plan", help="TOML run plan to execute unattended")
+    parser.add_argument("--sut", help="SUT directory name, or * for all")
+    parser.add_argument("--protocol", nargs="+",
+                        help="protocols to run (default: all)")
+    parser.add_argument("--workload", nargs="+", choices=WORKLOADS,
+                        help="workloads to run (default: all)")
+    parser.add_argument("--engine", choices=ENGINES,
+                        help="load generator (default: ycsb)")
+    parser.add_argument("--rate", type=float,
+                        help="target rate in ops/sec for the native engine")
+    parser.add_argument("--sweep", action="store_true",
+                        help="sweep offered load to find the saturation point")
+    parser.add_argument("--slo-us", type=int,
+                        help="p99 latency SLO in microseconds for --sweep")
+    parser.add_argument("--windows", type=int, nargs="+",
+                        help="run closed-loop with HTTP pipelining at each "
+                             "of these in-flight windows (native engine)")
+    parser.add_argument("--batch", type=int,
+                        help="operations per request with --windows, where "
+                             "the SUT's API batches them")
+    parser.add_argument("--pipeline-connections", type=int,
+                        help="connections per client with --windows")
+    parser.add_argument("--replicas", type=int, nargs="+",
+                        help="run on clusters of these sizes instead of "
+                             "the SUT's default")
+    parser.add_argument("--steady-window", type=float,
+                        help="repeat the run with more operations until its "
+                             "steady state, warm-up trimmed, lasts this many "
+                             "seconds")
+    parser.add_argument("--fault-at", type=float,
+                        help="crash the leader this many seconds into the run")
+    parser.add_argument("--fault-action", choices=list(faults.ACTIONS),
+                        default="kill", help="how the leader is crashed")
+    parser.add_argument("--restart-after", type=float,
+                        help="restart or resume the leader after this delay")
+    parser.add_argument("--profile", action="store_true",
+                        help="take CPU profiles of the replicas during the "
+                             "run, see src/utils/profiling.py")
+    parser.add_argument("--profile-at", type=float,
+                        help="start profiling this many seconds into the run "
+                             f"(default: {profiling.AT:g})")
+    parser.add_argument("--profile-seconds", type=float,
+                        help="length of the profiles "
+                             f"(default: {profiling.SECONDS:g})")
+    parser.add_argument("--sample-hz", type=float,
+                        help="replica resource sampling rate, 0 to disable "
+                             f"(default: {resources.SAMPLE_HZ})")
+    parser.add_argument("--clients", type=int,
+                        help="number of concurrent load client processes")
+    parser.add_argument("--placement", choices=fleet.PLACEMENTS,
+                        help="pin each client to one replica or spread it "
+                             "over all of them (default: pinned)")
+    parser.add_argument("--isolate", action="store_true",
+                        help="pin the replicas and the load client to "
+                             "disjoint CPU sets")
+    parser.add_argument("--replica-cpus", type=int,
+                        help="CPUs of each replica with --isolate "
+                             "(default: an equal share)")
+    parser.add_argument("--client-cpus", type=int,
+                        help="CPUs of the load client with --isolate")
+    parser.add_argument("--cgroup", action="store_true",
+                        help="with --isolate, also limit every replica's "
+                             "memory and CPU in a cgroup v2 group")
+    parser.add_argument("--memory-limit",
+                        help="memory limit of a replica with --cgroup "
+                             f"(default: {isolation.MEMORY_LIMIT})")
+    parser.add_argument("--topology",
+                        help="TOML topology of delays, bandwidth and "
+                             "partitions between replicas, see "
+                             "src/utils/netem.py")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="load once, then restore a snapshot of the "
+                             "loaded data directories instead of loading")
+    parser.add_argument("--history", action="store_true",
+                        help="record every operation of the native engine "
+                             "and check the history for linearizability")
+    parser.add_argument("--trials", type=int,
+                        help="run every configuration this many times and "
+                             "report confidence intervals")
+    parser.add_argument("--baseline",
+                        help="compare the trials against this saved baseline")
+    parser.add_argument("--save-baseline",
+                        help="save the trials as a baseline under this name")
+    parser.add_argument("--metrics-port", type=int, nargs="?",
+                        const=metrics.METRICS_PORT,
+                        help="serve live Prometheus metrics on this port "
+                             f"(default: {metrics.METRICS_PORT})")
+    parser.add_argument("--rerun", action="store_true",
+                        help="run cells again even when the results store "
+                             "holds enough runs of the same binaries, "
+                             "configs and workload")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only print the cells that would run")
+    return parser.parse_args(argv)
+
+
+def list_systems() -> list[Path]:
+    systems_under_test = Path("./sut")
+    systems = [p for p in systems_under_test.iterdir() if p.is_dir()]
+    systems.sort()
+    return systems
+
+
+def load_sut(project):
+    """
+    Imports the run.py script of a SUT directory.
+
+    :param project: Path to the SUT directory.
+    :type project: Path
+    :return: The loaded module.
+    :rtype: module
+    """
+    path = "." / project / "run.py"
+    spec = importlib.util.spec_from_file_location(f"{project.name}", path)
     module = importlib.util.module_from_spec(spec)
 
-    sys.modules[selected_project.name] = module
+    sys.modules[project.name] = module
     spec.loader.exec_module(module)
+    return module
 
-    print(module)
-    module.main(run_ycsb)
+
+def run_plan(sweep, dry_run=False) -> None:
+    """
+    Runs every cell of a plan unattended: start the cluster, load, run and
+    stop it. A failing cell is reported and the sweep moves on. With
+    trials, a single-mode cell is run that many times on a fresh cluster
+    and the trials are summarised, see evaluate_trials. Stored runs with
+    the fingerprint of a single-mode cell count as its trials, so only the
+    missing ones run, see src/utils/fingerprint.py.
+
+    :param sweep: Plan, see src/utils/plan.py.
+    :type sweep: dict[str...]
+    :param dry_run: Only print the cells.
+    :type dry_run: bool
+    """
+    projects = {p.name: p for p in list_systems()}
+    modules = {name: load_sut(p) for name, p in projects.items()}
+    # Library workloads are only run when named, not all of them
+    # suit every engine
+    cells = plan.expand(sweep, modules, WORKLOADS, YCSB_WORKLOADS)
+
+    for i, cell in enumerate(cells, start=1):
+        size = f", {cell['replicas']} replicas" if cell["replicas"] else ""
+        print(f"[{i}/{len(cells)}] {cell['sut']} {cell['protocol']} "
+              f"{cell['workload']} ({cell['engine']}, {cell['mode']}{size})")
+    if dry_run:
+        return
+
+    outcomes = []
+    for i, cell in enumerate(cells, start=1):
+        module = modules[cell["sut"]]
+        print(f"\n=== [{i}/{len(cells)}] {cell['sut']} {cell['protocol']} "
+              f"{cell['workload']} ===")
+        try:
+            replicas.resize(module, cell["replicas"])
+        except ValueError as e:
+            print(f"Error: {e}")
+            outcomes.append((cell, f"FAILED: {e}"))
+            continue
+        args = (projects[cell["sut"]], module,
+                module.get_protocol(cell["protocol"]), module.INTERFACE,
+                workload_file(cell["workload"]), cell["engine"])
+        trial_count = cell["trials"] if cell["mode"] == "single" else 1
+        group = time.time()
+        runs = []
+        if cell["mode"] == "single" and cell["cache"]:
+            runs = cached_runs(cell, projects[cell["sut"]].name, module,
+                               args[4])[-trial_count:]
+            if runs:
+                print(f"{len(runs)}/{trial_count} runs already stored "
+                      f"with the same fingerprint")
+        for trial in range(len(runs), trial_count):
+            extra_config = None
+            if trial_count > 1:
+                print(f"\n--- trial {trial + 1}/{trial_count} ---")
+                extra_config = {"trials": {"group": group, "index": trial,
+                                           "of": trial_count}}
+            network = None
+            try:
+                if cell["topology"]:
+                    network = start_network(module, cell["topology"])
+                outcome = run_cell(cell, args, extra_config, network)
+                if cell["mode"] == "sweep":
+                    saturation = outcome["saturation"]
+                    outcomes.append((cell, "saturation " + (
+                        f"{saturation['throughput']:.0f} ops/sec"
+                        if saturation else "not reached")))
+                elif cell["mode"] == "pipeline":
+                    best = outcome["best"]
+                    # no scaling when the first window completed nothing
+                    scaling = (f"x{outcome['scaling']:.2f}"
+                               if outcome["scaling"] is not None else "-")
+                    outcomes.append((cell, (
+                        f"{scaling} to "
+                        f"{best['throughput']:.0f} ops/sec at window "
+                        f"{best['window']}") if best else "no points"))
+                else:
+                    runs.append(outcome)
+            except Exception as e:
+                print(f"Error: {e}")
+                outcomes.append((cell, f"FAILED: {e}"))
+            finally:
+                try:
+                    module.stop()
+                except Exception as e:
+                    print(f"Error while stopping {cell['sut']}: {e}")
+                if network:
+                    stop_network(module, network)
+                isolation.release()
+        if len(runs) == 1 and not (cell["baseline"] or cell["save_baseline"]):
+            outcomes.append((cell, f"run {runs[0]['id']}"))
+        elif runs:
+            outcomes.append((cell, evaluate_trials(runs, cell["baseline"],
+                                                   cell["save_baseline"])))
+
+    print("\nSummary:")
+    for cell, outcome in outcomes:
+        size = f"n={cell['replicas']}" if cell["replicas"] else ""
+        print(f"{cell['sut']:<36} {cell['protocol']:<14} "
+              f"{cell['workload']:<14} {size:<5} {outcome}")
+
+
+def cached_runs(cell, project, module, workload_path) -> list[dict]:
+    """
+    :param cell: Single-mode cell, see src/utils/plan.py.
+    :type cell: dict[str...]
+    :param project: SUT directory name.
+    :type project: str
+    :param module: Loaded run.py of the SUT.
+    :type module: module
+    :param workload_path: Workload file of the cell, relative to YCSB_DIR.
+    :type workload_path: Path
+    :return: The stored runs the cell would repeat, oldest first; none if
+             the SUT does not support fingerprints.
+    :rtype: list[dict]
+    """
+    run_settings = fingerprint.settings(
+        cell["engine"], cell["rate"], clients=cell["clients"] or 1,
+        placement=cell["placement"], isolation=cell["isolation"],
+        topology=(netem.load_topology(cell["topology"])
+                  if cell["topology"] else None),
+        fault=cell["fault"], history=cell["history"],
+        steady_state=cell["steady_state"], profile=cell["profile"],
+        replicas=replicas.current(module))
+    identity = fingerprint.fingerprint(project, cell["protocol"], module,
+                                       YCSB_DIR / workload_path, run_settings)
+    if identity is None:
+        return []
+    with open_store() as results:
+        return results.fingerprinted(identity["key"])
+
+
+def start_network(module, topology) -> netem.NetemProxy:
+    """
+    Starts the proxies between the replicas of a SUT and routes its peer
+    traffic through them, before the cluster starts.
+
+    :param topology: Path to a topology file, or an inline topology.
+    :type topology: str | dict
+    :rtype: netem.NetemProxy
+    """
+    if not netem.supports_netem(module):
+        raise ValueError("The SUT does not support network emulation")
+    network = netem.NetemProxy(netem.load_topology(topology),
+                               module.PEER_ADDRESSES, module.pids)
+    module.peer_routes.update(network.start())
+    return network
+
+
+def stop_network(module, network) -> None:
+    network.stop()
+    module.peer_routes.clear()
+
+
+def run_cell(cell, args, extra_config=None, network=None) -> dict[str]:
+    """
+    Starts the cluster of a plan cell and runs it; the caller stops it.
+
+    :param cell: Cell, see src/utils/plan.py.
+    :type cell: dict[str...]
+    :param args: project, module, protocol, interface, workload path and
+                 engine of the cell.
+    :type args: tuple
+    :param extra_config: Merged into the stored config.
+    :type extra_config: dict | None
+    :param network: Proxies the cluster's peer traffic goes through, see
+                    start_network.
+    :type network: netem.NetemProxy | None
+    :return: The stored run, or the sweep or pipeline report in those
+             modes.
+    :rtype: dict[str...]
+    """
+    module = args[1]
+    check_workload(args[4], cell["engine"])
+    fleet_options = {"clients": cell["clients"],
+                     "placement": cell["placement"]}
+    load = True
+    extra_config = dict(extra_config or {})
+    if cell["snapshot"]:
+        snapshot_key = start_from_snapshot(*args, rate=cell["rate"],
+                                           **fleet_options)
+        load = snapshot_key is None
+        if snapshot_key:
+            extra_config["snapshot"] = str(snapshot_key)
+    else:
+        module.start(cell["protocol"])
+    if cell["mode"] == "sweep":
+        return run_sweep(*args, options=cell["sweep"], load=load,
+                         extra_config=extra_config,
+                         isolation_options=cell["isolation"], network=network,
+                         **fleet_options)
+    if cell["mode"] == "pipeline":
+        return run_pipeline(*args, options=cell["pipeline"], load=load,
+                            extra_config=extra_config,
+                            isolation_options=cell["isolation"],
+                            network=network, **fleet_options)
+    return run_benchmark(*args, rate=cell["rate"], load=load,
+                         extra_config=extra_config, fault=cell["fault"],
+                         sample_hz=cell["sample_hz"],
+                         isolation_options=cell["isolation"],
+                         record_history=cell["history"], network=network,
+                         steady_state=cell["steady_state"],
+                         profile=cell["profile"], **fleet_options)
+
+
+def workload_file(name) -> Path:
+    """
+    :param name: Workload name, see WORKLOADS.
+    :type name: str
+    :return: YCSB property file of the workload, relative to YCSB_DIR, or
+             generated for library workloads, see src/utils/workloads.py.
+    :rtype: Path
+    """
+    if name in YCSB_WORKLOADS:
+        return YCSB_WORKLOAD_DIR / name
+    return workloads.property_file(name)
+
+
+def check_workload(workload_path, engine) -> None:
+    """
+    :raises ValueError: If YCSB cannot run the library workload as specified.
+    """
+    spec = loadgen.load_workload(YCSB_DIR / workload_path).get(
+        workloads.SPEC_PROPERTY)
+    if engine != "ycsb" or spec is None:
+        return
+    unsupported = workloads.ycsb_unsupported(json.loads(spec))
+    if unsupported:
+        raise ValueError(f"YCSB does not support {', '.join(unsupported)}; "
+                         f"use the native engine")
+
+
+def evaluate_trials(runs, baseline=None, save_baseline=None) -> str:
+    """
+    Summarises the trials of one configuration with confidence intervals,
+    compares them against a baseline and optionally saves them as one,
+    see src/utils/trials.py.
+
+    :param runs: Stored runs of the trials.
+    :type runs: list[dict]
+    :param baseline: Name of the baseline to compare against.
+    :type baseline: str | None
+    :param save_baseline: Name to save the trials under as a baseline.
+    :type save_baseline: str | None
+    :return: One line outcome for the plan summary.
+    :rtype: str
+    """
+    samples = trials.samples(runs)
+    summary = {metric: trials.summarize(values)
+               for metric, values in samples.items()}
+    key = {k: runs[0][k] for k in store.KEYS}
+    comparison = None
+    with open_store() as results:
+        if baseline:
+            reference = results.baseline(baseline, **key)
+            if reference is None:
+                print(f"Baseline '{baseline}' has no runs of this "
+                      f"configuration")
+            else:
+                comparison = trials.compare(reference, samples)
+        if save_baseline:
+            results.save_baseline(save_baseline, key, samples)
+            print(f"Saved {len(runs)} trials as baseline '{save_baseline}'")
+
+    print(f"\n{len(runs)} trials:")
+    trials.print_report(summary, comparison)
+    throughput = summary["throughput"]
+    outcome = (f"{len(runs)} trials, {throughput['mean']:.0f} "
+               f"+/- {throughput['ci_high'] - throughput['mean']:.0f} ops/sec")
+    flagged = [f"{c['verdict']} in {metric}"
+               for metric, c in (comparison or {}).items()
+               if c["verdict"] in ("regression", "improvement")]
+    if flagged:
+        outcome += ", " + ", ".join(flagged)
+    return outcome
+
+
+def start_from_snapshot(project, module, protocol, interface, workload_path,
+                        engine="ycsb", rate=None, clients=1,
+                        placement="pinned"):
+    """
+    Starts the cluster with its workload already loaded. The first time,
+    the workload is loaded, the cluster is stopped keeping its data and a
+    snapshot of the data directories is taken before starting it again;
+    later runs restore that snapshot, see src/utils/snapshot.py.
+
+    :return: Key of the snapshot the cluster runs on, None if the SUT does
+             not support snapshots and was started empty.
+    :rtype: Path | None
+    """
+    if not snapshot.supports_snapshots(module):
+        print(f"{project.name} does not support snapshots, loading as usual")
+        module.start(protocol["name"])
+        return None
+
+    workload = loadgen.load_workload(YCSB_DIR / workload_path)
+    # members may remember the routed peer addresses in their data
+    sut = project.name
+    if replicas.current(module) not in (None, module.DEFAULT_SIZE):
+        sut += f"-n{module.SIZE}"
+    if getattr(module, "peer_routes", None):
+        sut += "-netem"
+    snapshot_key = snapshot.key(
+        sut, protocol["name"], engine, workload_path.name,
+        workload.get("recordcount", 1000),
+        fingerprint.file_digest(YCSB_DIR / workload_path))
+    if snapshot.exists(snapshot_key):
+        module.stop()
+        snapshot.restore(snapshot_key, module.DATA_DIRS)
+    else:
+        module.start(protocol["name"])
+        load_workload(module, interface, workload_path, engine, rate,
+                      clients, placement)
+        module.stop(keep_data=True)
+        snapshot.take(snapshot_key, module.DATA_DIRS)
+    module.start(protocol["name"], keep_data=True)
+    return snapshot_key
 
 
 def run_ycsb(protocol, interface) -> None:
     """
     Give user options to pick a workload, then runs that workload
     onto the specified protocol. The YCSB output is then parsed and
-    later stored in a .json file specified by DATA.
+    appended to the results store in RESULTS_DB.
+
+    SUTs whose run.py defines ENDPOINTS and whose interface has a native
+    driver can be benchmarked with the open-loop generator in
+    src/utils/loadgen.py instead of the YCSB binary.
 
     :param protocol: Protocol data that will be benchmarked.
     :type protocol: dict[str, str]
     :param interface: YCSB interface name for the protocol
     :type interface: str
     """
-    global selected_project
     options = [{"num": i, "text": name}
                for i, name in enumerate(WORKLOADS, start=1)]
     num = helper.get_option(1, len(options), options)
 
-    workload_path = YCSB_WORKLOAD_DIR / WORKLOADS[num-1]
+    workload_path = workload_file(WORKLOADS[num-1])
+
+    engine = "ycsb"
+    rate = NATIVE_RATE
+    if native_endpoints(selected_module, interface):
+        options = [{"num": i, "text": name}
+                   for i, name in enumerate(ENGINES, start=1)]
+        engine = ENGINES[helper.get_option(1, len(options), options) - 1]
+        if engine == "native":
+            rate = helper.get_number("Target rate (ops/sec)", NATIVE_RATE)
+
+    try:
+        check_workload(workload_path, engine)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    run_benchmark(selected_project, selected_module, protocol, interface,
+                  workload_path, engine, rate)
+
+
+def native_endpoints(module, interface) -> list[str] | None:
+    """
+    :return: The replica endpoints if the SUT can be driven by the native
+             generator, None otherwise.
+    :rtype: list[str] | None
+    """
+    endpoints = getattr(module, "ENDPOINTS", None)
+    if endpoints and interface in loadgen.DRIVERS:
+        return endpoints
+    return None
+
+
+def run_benchmark(project, module, protocol, interface, workload_path,
+                  engine="ycsb", rate=None, load=True, threads=None,
+                  extra_config=None, fault=None,
+                  sample_hz=resources.SAMPLE_HZ, clients=1,
+                  placement="pinned", isolation_options=None,
+                  record_history=False, network=None,
+                  pipeline=None, steady_state=None,
+                  profile=None) -> dict[str]:
+    """
+    Runs the load and run phases of a workload against a started cluster
+    and appends the parsed result to the results store.
+
+    :param project: Path to the SUT directory.
+    :type project: Path
+    :param module: Loaded run.py of the SUT.
+    :type module: module
+    :param protocol: Protocol data {name, language}.
+    :type protocol: dict[str, str]
+    :param interface: YCSB interface name for the protocol.
+    :type interface: str
+    :param workload_path: Workload file, relative to YCSB_DIR.
+    :type workload_path: Path
+    :param engine: "ycsb" or "native".
+    :type engine: str
+    :param rate: Target rate in ops/sec, YCSB runs unthrottled without it.
+    :type rate: float | None
+    :param load: Run the load phase first.
+    :type load: bool
+    :param threads: YCSB client threads.
+    :type threads: int | None
+    :param extra_config: Merged into the stored config.
+    :type extra_config: dict | None
+    :param fault: Crash the leader during the run phase, with keys "at",
+                  "action" and "restart_after" of faults.FaultInjector.
+    :type fault: dict | None
+    :param sample_hz: Rate at which replica resources are sampled during
+                      the run phase, 0 to disable.
+    :type sample_hz: float
+    :param clients: Number of concurrent client processes, see
+                    src/utils/fleet.py.
+    :type clients: int
+    :param placement: "pinned" or "spread", how clients map to replicas.
+    :type placement: str
+    :param isolation_options: Pin the replicas and the client to disjoint
+                              CPU sets before the load phase, see
+                              src/utils/isolation.py.
+    :type isolation_options: dict | None
+    :param record_history: Record every operation of the run phase and
+                           check the history for linearizability, see
+                           src/utils/history.py. Native engine only.
+    :type record_history: bool
+    :param network: Proxies the peer traffic goes through; the partitions
+                    of their topology are timed from the start of the run
+                    phase, see src/utils/netem.py.
+    :type network: netem.NetemProxy | None
+    :param pipeline: Run closed-loop with HTTP pipelining instead of at
+                     rate: "window" requests in flight on each of
+                     "connections" connections per client, each carrying
+                     up to "batch" operations, see
+                     loadgen.LoadGenerator.run_pipelined. Native engine only.
+    :type pipeline: dict[str, int] | None
+    :param steady_state: With "min_window" seconds, the run phase is
+                         repeated with more operations, up to
+                         "max_extensions" times, until its steady-state
+                         window lasts that long, see src/utils/steady.py.
+                         Not with faults.
+    :type steady_state: dict | None
+    :param profile: Take CPU profiles of the replicas "seconds" long,
+                    starting "at" seconds into the run phase, and list
+                    the "top" functions of each, see
+                    src/utils/profiling.py.
+    :type profile: dict | None
+    :return: The stored run, with its "id".
+    :rtype: dict[str...]
+    """
+    timeseries = None
+    config = {"interface": interface, "workload_path": str(workload_path),
+              "rate": rate, "threads": threads,
+              "replicas": replicas.current(module), **(extra_config or {})}
+    identity = fingerprint.fingerprint(
+        project.name, protocol["name"], module, YCSB_DIR / workload_path,
+        fingerprint.settings(engine, rate, threads, clients or 1, placement,
+                             isolation_options,
+                             network.topology if network else None, fault,
+                             record_history, pipeline, steady_state,
+                             profile, replicas.current(module)))
+    if identity:
+        config["fingerprint"] = identity
+    if isolation_options is not None:
+        if not hasattr(module, "pids"):
+            raise ValueError(f"{project.name} does not support isolation")
+        config["isolation"] = isolation.place(module.pids(),
+                                              isolation_options)
+    if network:
+        config["topology"] = network.to_dict()
+    injector = None
+    if fault:
+        if not faults.supports_faults(module):
+            raise ValueError(f"{project.name} does not support fault "
+                             "injection")
+        config["fault"] = fault
+        injector = faults.FaultInjector(module, **fault)
+    min_window = (steady_state or {}).get("min_window", 0)
+    if min_window and injector:
+        raise ValueError("Runs with faults cannot be extended to a steady "
+                         "state")
+    clients = clients or 1
+    if clients > 1:
+        config["clients"] = clients
+        config["placement"] = placement
+    targets = client_targets(module, engine, clients, placement)
+    operation_count = int(loadgen.load_workload(
+        YCSB_DIR / workload_path).get("operationcount", 1000))
+    history_paths = [None] * clients
+    if record_history:
+        if engine != "native":
+            raise ValueError("Recording histories needs the native engine")
+        history_dir = history.HISTORY_DIR / (
+            f"{project.name}-{protocol['name']}-{workload_path.name}-"
+            f"{time.strftime('%Y%m%d-%H%M%S')}")
+        history_dir.mkdir(parents=True)
+        history_paths = [history_dir / f"client{i}{history.SUFFIX}"
+                         for i in range(clients)]
+        config["history"] = str(history_dir)
+    if pipeline and engine != "native":
+        raise ValueError("Pipelining needs the native engine")
+    profile_dir = None
+    if profile is not None:
+        if not profiling.supports_profiling(module):
+            raise ValueError(f"{project.name} does not support profiling")
+        profile_dir = profiling.PROFILE_DIR / (
+            f"{project.name}-{protocol['name']}-{workload_path.name}-"
+            f"{time.strftime('%Y%m%d-%H%M%S')}")
+        config["profile"] = {**profile, "directory": str(profile_dir)}
+
+    if engine == "native":
+        endpoints = native_endpoints(module, interface)
+        if not endpoints:
+            raise ValueError(f"{project.name} cannot use the native engine")
+        rate = rate or NATIVE_RATE
+        config["rate"] = None if pipeline else rate
+        if pipeline:
+            config["pipeline"] = pipeline
+        config["endpoints"] = endpoints
+        native_workload = YCSB_DIR / workload_path
+    if load:
+        load_workload(module, interface, workload_path, engine, rate,
+                      clients, placement)
 
-    subprocess.run(
-        [YCSB_BIN, "load", interface, "-P", workload_path],
-        cwd=YCSB_DIR)
+    throttle = []
+    if engine != "native":
+        if rate:
+            throttle += ["-target", str(int(rate / clients))]
+        if threads:
+            throttle += ["-threads", str(threads)]
 
-    result = subprocess.run(
-        [YCSB_BIN, "run", interface, "-P", workload_path],
-        cwd=YCSB_DIR,
-        stdout=subprocess.PIPE,
-        stderr=None,
-        text=True)
+    # A run phase without a steady-state window of min_window seconds is
+    # discarded and repeated with more operations, without loading again.
+    extensions = 0
+    while True:
+        operation_counts = fleet.split(operation_count, clients)
+        sampler = None
+        if sample_hz and hasattr(module, "pids"):
+            config["sample_hz"] = sample_hz
+            sampler = resources.ResourceSampler(module.pids, sample_hz)
+        profiler = None
+        if profile_dir:
+            profiler = profiling.Profiler(
+                module, profile_dir, profile.get("at", profiling.AT),
+                profile.get("seconds", profiling.SECONDS),
+                profile.get("top", profiling.TOP))
+        live = metrics.RunMetrics(
+            {"project": project.name, "protocol": protocol["name"],
+             "workload": workload_path.name, "engine": engine},
+            sampler=sampler, injector=injector)
+        breakdown = None
+        # Wall-clock time of the time series' time 0
+        zero = None
 
-    parsed = parse_ycsb_output(result.stdout.splitlines())
+        if engine == "native":
+            if clients == 1:
+                live.recorder = loadgen.Recorder()
+            metrics.publish(live)
+            zero = time.time()
+            start_observers(injector, sampler, network, profiler)
+            try:
+                if clients == 1:
+                    parsed, histograms, timeseries = loadgen.run_native(
+                        interface, endpoints, native_workload, rate,
+                        recorder=live.recorder,
+                        properties={"operationcount": str(operation_count)},
+                        history_path=history_paths[0], pipeline=pipeline)
+                else:
+                    outputs = fleet.run_native(
+                        interface, targets, native_workload, rate,
+                        properties=[{"operationcount": str(count)}
+                                    for _, count in operation_counts],
+                        history_paths=history_paths, pipeline=pipeline,
+                        placement=placement)
+            finally:
+                stop_observers(injector, sampler, network, profiler)
+                live.finish()
+            if clients > 1:
+                config["endpoints"] = targets
+                parsed, histograms, timeseries, breakdown = fleet.merge(
+                    outputs, targets)
+        else:
+            def on_status(client, point):
+                nonlocal zero
+                if zero is None:
+                    zero = time.time() - point["time"]
+                live.observe_status(point, client)
+
+            def run_client(client, hdr_dir):
+                cmd = [YCSB_BIN, "run", interface, "-P", workload_path,
+                       *throttle, *ycsb.histogram_args(hdr_dir),
+                       "-p", f"operationcount={operation_counts[client][1]}"]
+                if clients > 1:
+                    cmd += ycsb_endpoint_args(module, targets[client])
+                # only the first client is echoed, the others would interleave
+                return ycsb.stream_ycsb(cmd, cwd=YCSB_DIR,
+                                        on_status=partial(on_status, client),
+                                        echo=client == 0)
+
+            metrics.publish(live)
+            start_observers(injector, sampler, network, profiler)
+            try:
+                with tempfile.TemporaryDirectory() as hdr_root:
+                    hdr_dirs = [Path(hdr_root, f"client{i}").resolve()
+                                for i in range(clients)]
+                    for hdr_dir in hdr_dirs:
+                        hdr_dir.mkdir()
+                    live.log_dirs = hdr_dirs
+                    runs = fleet.run_threads(
+                        [partial(run_client, i, hdr_dir)
+                         for i, hdr_dir in enumerate(hdr_dirs)])
+                    outputs = [(parse_ycsb_output(summary),
+                                histogram.read_log_dir(hdr_dir),
+                                series.to_list())
+                               for (summary, series), hdr_dir
+                               in zip(runs, hdr_dirs)]
+                    live.finish()
+            finally:
+                stop_observers(injector, sampler, network, profiler)
+                live.finish()
+
+            if clients == 1:
+                parsed, histograms, timeseries = outputs[0]
+            else:
+                config["endpoints"] = targets
+                parsed, histograms, timeseries, breakdown = fleet.merge(
+                    outputs, targets)
+
+        window = steady.analyse(timeseries, min_window)
+        if window:
+            steady.print_report(window)
+        if (not min_window or window and window["Stable"]
+                or extensions == steady_state.get("max_extensions",
+                                                  steady.MAX_EXTENSIONS)):
+            break
+        extensions += 1
+        operation_count = steady.extended_count(
+            operation_count, window,
+            parsed.get("OVERALL", {}).get("RunTime(ms)", 0) / 1000,
+            min_window)
+        print(f"\n--- no {min_window}s steady-state window yet, extending "
+              f"the run to {operation_count} operations ---")
+    if min_window:
+        config["steady_state"] = {**steady_state, "extensions": extensions,
+                                  "operationcount": operation_count}
     print(json.dumps(parsed, indent=2))
 
-    keep_keys = {"READ", "UPDATE", "DELETE", "INSERT", "OVERALL"}
-    result = {k: parsed[k] for k in keep_keys if k in parsed}
-
-    with open(DATA, "r") as f:
-        data = json.load(f)
-
-    already_exists = False
-    for item in data:
-        if (item["project"] == selected_project.name
-                and item["protocol"] == protocol["name"]
-                and item["workload"] == workload_path.name
-                and item["language"] == protocol["language"]):
-            already_exists = True
-            item["result"] = result
-
-    if not already_exists:
-        data.append({
-            "project": selected_project.name,
-            "protocol": protocol['name'],
-            "language": protocol['language'],
+    # Intended-* sections hold response times (YCSB's intended latency),
+    # the plain sections hold service times.
+    keep_keys = {"READ", "UPDATE", "DELETE", "INSERT", "READ-MODIFY-WRITE",
+                 "SCAN", "OVERALL"}
+    result = {k: parsed[k] for k in parsed
+              if k.removeprefix("Intended-") in keep_keys}
+    histograms = {k: v for k, v in histograms.items() if k in result}
+    for section, encoded in histograms.items():
+        hist = histogram.Histogram.decode(encoded)
+        for p in TAIL_PERCENTILES:
+            result[section][f"{p:g}thPercentileLatency(us)"] = \
+                hist.value_at_percentile(p)
+
+    if window:
+        result["STEADY_STATE"] = window
+
+    if profiler:
+        profiled = profiler.to_dict(zero or profiler.started,
+                                    window["Window(s)"] if window else None)
+        if profiled:
+            result["PROFILE"] = profiled
+            profiling.print_report(profiled)
+        else:
+            print("The run ended before the replicas were profiled")
+
+    if record_history:
+        result["LINEARIZABILITY"] = check_history(history_paths)
+
+    if breakdown:
+        result["CLIENTS"] = breakdown
+        print(json.dumps(breakdown, indent=2))
+
+    usage = None
+    if sampler:
+        usage = sampler.to_dict()
+        result["RESOURCES"] = resources.overall(
+            usage["summary"],
+            result.get("OVERALL", {}).get("Throughput(ops/sec)", 0.0))
+        print(json.dumps(usage["summary"], indent=2))
+
+    events = None
+    if injector or network:
+        recorded = sorted((injector.events if injector else [])
+                          + (network.events if network else []),
+                          key=lambda e: e["wall"])
+        events = faults.align(recorded, zero or (injector or network).started)
+    if injector:
+        impact = faults.analyse(timeseries or [], events)
+        if impact:
+            result["FAULT"] = impact
+            print(json.dumps(impact, indent=2))
+
+    run = {
+        "project": project.name,
+        "protocol": protocol["name"],
+        "language": protocol["language"],
+        "workload": workload_path.name,
+        "engine": engine,
+        "fingerprint": identity["key"] if identity else None,
+        "config": config,
+        "result": result,
+        "timeseries": timeseries,
+        "histograms": histograms,
+        "events": events,
+        "resources": usage,
+    }
+    with open_store() as results:
+        run["id"] = results.insert(run)
+    print(f"{workload_path.name} result has been inserted into "
+          f"{RESULTS_DB} (run {run['id']}).")
+    return run
+
+
+def check_history(paths) -> dict[str]:
+    """
+    Checks the recorded histories of all clients of a run together.
+
+    :param paths: History file of every client.
+    :type paths: list[Path]
+    :return: Verdict, counts and the counterexample of every key that is
+             not linearizable, see linearizability.check.
+    :rtype: dict[str...]
+    """
+    report = linearizability.check(history.operations(paths))
+    linearizability.print_report(report)
+    return {
+        "Linearizable": report["linearizable"],
+        "Operations": report["operations"],
+        "Keys": report["keys"],
+        "Duration(s)": round(report["duration"], 3),
+        "TimedOutKeys": report["timeouts"],
+        # open returns are infinite, which JSON cannot hold
+        "Counterexamples": {
+            str(key): [{**op, "return": None if op["return"] == float("inf")
+                        else op["return"]} for op in example]
+            for key, example in report["violations"].items()},
+    }
+
+
+def load_workload(module, interface, workload_path, engine="ycsb",
+                  rate=None, clients=1, placement="pinned") -> None:
+    """
+    Runs the load phase of a workload against a started cluster. Several
+    clients insert staggered key ranges in parallel.
+    """
+    clients = clients or 1
+    if clients == 1:
+        if engine == "native":
+            loadgen.run_native(interface, native_endpoints(module, interface),
+                               YCSB_DIR / workload_path, rate or NATIVE_RATE,
+                               phase="load")
+        else:
+            subprocess.run([YCSB_BIN, "load", interface, "-P", workload_path],
+                           cwd=YCSB_DIR)
+        return
+
+    record_count = int(loadgen.load_workload(
+        YCSB_DIR / workload_path).get("recordcount", 1000))
+    ranges = fleet.split(record_count, clients)
+    targets = client_targets(module, engine, clients, placement)
+    if engine == "native":
+        fleet.run_native(interface, targets, YCSB_DIR / workload_path,
+                         rate or NATIVE_RATE, phase="load",
+                         properties=[{"insertstart": str(start),
+                                      "insertcount": str(count)}
+                                     for start, count in ranges],
+                         placement=placement)
+    else:
+        fleet.run_threads([
+            partial(subprocess.run,
+                    [YCSB_BIN, "load", interface, "-P", workload_path,
+                     "-p", f"insertstart={start}",
+                     "-p", f"insertcount={count}",
+                     *ycsb_endpoint_args(module, endpoints)],
+                    cwd=YCSB_DIR)
+            for (start, count), endpoints in zip(ranges, targets)])
+
+
+def client_targets(module, engine, clients, placement) -> list[list[str]]:
+    """
+    :return: Endpoints of every client, empty lists when clients cannot be
+             pointed at replicas (YCSB bindings without
+             YCSB_ENDPOINT_PROPERTY in run.py use their own default).
+    :rtype: list[list[str]]
+    """
+    endpoints = getattr(module, "ENDPOINTS", None)
+    if engine != "native" and not hasattr(module, "YCSB_ENDPOINT_PROPERTY"):
+        endpoints = None
+    if not endpoints:
+        return [[] for _ in range(clients)]
+    return fleet.assign(endpoints, clients, placement,
+                        getattr(module, "INTERFACE", None))
+
+
+def ycsb_endpoint_args(module, endpoints) -> list[str]:
+    prop = getattr(module, "YCSB_ENDPOINT_PROPERTY", None)
+    if not prop or not endpoints:
+        return []
+    return ["-p", f"{prop}={','.join(endpoints)}"]
+
+
+def start_observers(injector, sampler, network=None, profiler=None) -> None:
+    if sampler:
+        sampler.start()
+    if injector:
+        injector.start()
+    if network:
+        network.start_schedule()
+    if profiler:
+        profiler.start()
+
+
+def stop_observers(injector, sampler, network=None, profiler=None) -> None:
+    if profiler:
+        profiler.cancel()
+    if network:
+        network.cancel_schedule()
+    if injector:
+        injector.cancel()
+    if sampler:
+        sampler.stop()
+
+
+def run_sweep(project, module, protocol, interface, workload_path,
+              engine="ycsb", options=None, load=True,
+              extra_config=None, clients=1, placement="pinned",
+              isolation_options=None, network=None) -> dict[str]:
+    """
+    Runs the workload at increasing offered load until latency diverges,
+    the SUT falls behind or errors appear, then stores the sweep report
+    with its saturation point. The workload is loaded once, before the
+    first step.
+
+    :param options: Overrides for start, max, growth, slo_us and threads,
+                    see src/utils/sweep.py.
+    :type options: dict | None
+    :param load: Load the workload before the first step.
+    :type load: bool
+    :param extra_config: Merged into the stored config of every step.
+    :type extra_config: dict | None
+    :param clients: Number of concurrent client processes.
+    :type clients: int
+    :param placement: "pinned" or "spread", see src/utils/fleet.py.
+    :type placement: str
+    :param isolation_options: See run_benchmark.
+    :type isolation_options: dict | None
+    :param network: See run_benchmark.
+    :type network: netem.NetemProxy | None
+    :return: The sweep report.
+    :rtype: dict[str...]
+    """
+    options = options or {}
+    slo_us = options.get("slo_us", sweep.SLO_US)
+    started = time.time()
+    points = []
+    stopped = None
+    rates = sweep.offered_loads(options.get("start", sweep.START_RATE),
+                                options.get("max", sweep.MAX_RATE),
+                                options.get("growth", sweep.GROWTH))
+    for step, rate in enumerate(rates):
+        print(f"\n--- sweep step {step + 1}: {rate} ops/sec offered ---")
+        run = run_benchmark(project, module, protocol, interface,
+                            workload_path, engine, rate,
+                            load=load and step == 0,
+                            threads=options.get("threads"),
+                            extra_config={**(extra_config or {}),
+                                          "sweep": {"started": started,
+                                                    "step": step}},
+                            clients=clients, placement=placement,
+                            isolation_options=isolation_options,
+                            network=network)
+        point = sweep.measure(run["result"], run["histograms"], rate)
+        point["run_id"] = run["id"]
+        points.append(point)
+        stopped = sweep.stop_reason(points)
+        if stopped:
+            break
+
+    report = sweep.analyse(points, slo_us, stopped)
+    sweep.print_report(report)
+    with open_store() as results:
+        results.insert_sweep({
+            "timestamp": started,
+            "project": project.name,
+            "protocol": protocol["name"],
+            "language": protocol["language"],
             "workload": workload_path.name,
-            "result": result
+            "engine": engine,
+            "report": report,
         })
+    return report
+
+
+def run_pipeline(project, module, protocol, interface, workload_path,
+                 engine="native", options=None, load=True,
+                 extra_config=None, clients=1, placement="pinned",
+                 isolation_options=None, network=None) -> dict[str]:
+    """
+    Runs the workload closed-loop at every in-flight window in turn and
+    reports how throughput and latency scale with it. Every window is
+    stored as a run with its pipeline config; the workload is loaded once,
+    before the first window.
 
-    with open(DATA, "w") as f:
-        json.dump(data, f, separators=(",", ":"))
-    print(f"{workload_path.name} result has been inserted into {DATA}.")
+    :param options: Overrides for windows, batch and connections, see
+                    src/utils/pipeline.py.
+    :type options: dict | None
+    :param load: Load the workload before the first window.
+    :type load: bool
+    :param extra_config: Merged into the stored config of every window.
+    :type extra_config: dict | None
+    :param clients: Number of concurrent client processes.
+    :type clients: int
+    :param placement: "pinned" or "spread", see src/utils/fleet.py.
+    :type placement: str
+    :param isolation_options: See run_benchmark.
+    :type isolation_options: dict | None
+    :param network: See run_benchmark.
+    :type network: netem.NetemProxy | None
+    :return: The pipeline report, see pipeline.analyse.
+    :rtype: dict[str...]
+    """
+    options = options or {}
+    started = time.time()
+    points = []
+    for step, window in enumerate(options.get("windows", pipeline.WINDOWS)):
+        print(f"\n--- pipeline step {step + 1}: window {window} ---")
+        settings = {"window": window,
+                    "batch": options.get("batch", pipeline.BATCH),
+                    "connections": options.get("connections",
+                                               pipeline.CONNECTIONS)}
+        run = run_benchmark(project, module, protocol, interface,
+                            workload_path, engine, load=load and step == 0,
+                            extra_config={**(extra_config or {}),
+                                          "pipeline_scan": {"started": started,
+                                                            "step": step}},
+                            clients=clients, placement=placement,
+                            isolation_options=isolation_options,
+                            network=network, pipeline=settings)
+        point = sweep.measure(run["result"], run["histograms"], None)
+        point["window"] = window
+        point["run_id"] = run["id"]
+        points.append(point)
+
+    report = pipeline.analyse(points)
+    pipeline.print_report(report)
+    return report
+
+
+def open_store() -> store.ResultStore:
+    """
+    Opens the results store. A new store starts with the runs recorded in
+    the legacy DATA file, if there is one.
+
+    :rtype: store.ResultStore
+    """
+    created = not Path(RESULTS_DB).exists()
+    results = store.ResultStore(RESULTS_DB)
+    if created and Path(DATA).exists():
+        count = results.import_json(DATA)
+        print(f"Imported {count} runs from {DATA} into {RESULTS_DB}.")
+    return results
 
 
 def parse_ycsb_output(lines) -> dict[str]:
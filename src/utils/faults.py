@@ -0,0 +1,207 @@
+"""
+Leader-crash fault injection.
+
+A FaultInjector runs next to the benchmark. At a scheduled time it asks the
+SUT's run.py for the current leader, then either kills it (SIGKILL) or
+freezes it (SIGSTOP). It can optionally bring the leader back later, by
+calling the run.py restart function or sending SIGCONT. Every action is
+recorded as an event with its wall-clock time. analyse then lines the
+events up with the run's time series and computes how long the cluster
+was unavailable and how long it took to recover.
+
+The run.py of a SUT supports fault injection by providing:
+- find_leader() -> str, name of the node currently leading
+- pids() -> dict[str, int], node name mapped to its process id
+- restart(node), start a killed node again (optional)
+"""
+import os
+import signal
+import threading
+import time
+
+ACTIONS = {"kill": signal.SIGKILL, "stop": signal.SIGSTOP}
+# Throughput under this fraction of the pre-fault baseline is unavailability
+UNAVAILABLE_FRACTION = 0.1
+# Throughput back at this fraction of the baseline counts as recovered
+RECOVERED_FRACTION = 0.9
+
+
+def supports_faults(module) -> bool:
+    return hasattr(module, "find_leader") and hasattr(module, "pids")
+
+
+class FaultInjector(threading.Thread):
+    """
+    Crashes the leader of a running cluster at a scheduled time.
+
+    :param module: Loaded run.py of the SUT.
+    :type module: module
+    :param at: Seconds after start() at which the leader is crashed.
+    :type at: float
+    :param action: "kill" (SIGKILL) or "stop" (SIGSTOP).
+    :type action: str
+    :param restart_after: Seconds after the crash at which the node is
+                          restarted (kill) or resumed (stop), None to
+                          leave it down.
+    :type restart_after: float | None
+    """
+
+    def __init__(self, module, at, action="kill", restart_after=None):
+        super().__init__(daemon=True)
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown fault action '{action}'")
+        if (action == "kill" and restart_after is not None
+                and not hasattr(module, "restart")):
+            raise ValueError("This SUT cannot restart a killed node")
+        self.module = module
+        self.at = at
+        self.action = action
+        self.restart_after = restart_after
+        self.events = []
+        self.started = None
+        self.stopped = None
+        self.cancelled = threading.Event()
+
+    def start(self) -> None:
+        self.started = time.time()
+        super().start()
+
+    def cancel(self) -> None:
+        """
+        Stops waiting for pending actions; a node that was stopped is
+        resumed so the cluster can be torn down normally.
+        """
+        self.cancelled.set()
+        if self.started is not None:
+            self.join()
+        if self.stopped is not None:
+            self._resume(*self.stopped)
+
+    def _resume(self, node, pid) -> None:
+        try:
+            os.kill(pid, signal.SIGCONT)
+        except ProcessLookupError:
+            pass
+        self.stopped = None
+        self._record("resume", node, pid=pid)
+
+    def _record(self, event, node, **extra) -> None:
+        self.events.append({"wall": time.time(), "event": event,
+                            "node": node, **extra})
+        print(f"[fault] {event} {node}")
+
+    def run(self) -> None:
+        if self.cancelled.wait(self.at):
+            return
+
+        try:
+            leader = self.module.find_leader()
+            pid = self.module.pids()[leader]
+        except Exception as e:
+            self._record("leader-lookup-failed", None, error=str(e))
+            return
+        os.kill(pid, ACTIONS[self.action])
+        if self.action == "stop":
+            self.stopped = (leader, pid)
+        self._record(self.action, leader, pid=pid)
+
+        if self.restart_after is None:
+            return
+        interrupted = self.cancelled.wait(self.restart_after)
+        if self.action == "stop":
+            self._resume(leader, pid)
+        elif not interrupted:
+            self.module.restart(leader)
+            self._record("restart", leader)
+
+
+def align(events, zero) -> list[dict]:
+    """
+    Adds to every event its time in seconds relative to the start of the
+    time series.
+
+    :param events: Events from FaultInjector.
+    :type events: list[dict]
+    :param zero: Wall-clock time of the time series' time 0.
+    :type zero: float
+    :rtype: list[dict]
+    """
+    return [dict(e, time=round(e["wall"] - zero, 3)) for e in events]
+
+
+def successful_rate(point) -> float:
+    """
+    :param point: Time series point with "ops/sec", "interval" and a
+                  section per operation.
+    :type point: dict[str...]
+    :return: Throughput of the interval counting successful operations
+             only: a node that is down answers fast with errors. Failures
+             are the "Errors" of the native engine's sections and YCSB's
+             <op>-FAILED sections.
+    :rtype: float
+    """
+    failed = 0
+    for section, stats in point.items():
+        if not isinstance(stats, dict) or section.startswith("Intended-"):
+            continue
+        if section.endswith("-FAILED"):
+            failed += stats.get("Count", 0)
+        else:
+            failed += stats.get("Errors", 0)
+    return max(0.0, point["ops/sec"] - failed / point.get("interval", 1))
+
+
+def analyse(timeseries, events) -> dict[str] | None:
+    """
+    Measures the impact of the first crash on the time series.
+
+    Throughput, of successful operations only (see successful_rate),
+    before the crash is the baseline. Unavailability is the
+    total time after the crash with throughput under UNAVAILABLE_FRACTION
+    of it; recovery is complete at the start of the first interval back at
+    RECOVERED_FRACTION after throughput dropped.
+
+    :param timeseries: Points with "time", "interval" and "ops/sec".
+    :type timeseries: list[dict]
+    :param events: Aligned events, see align.
+    :type events: list[dict]
+    :return: Summary in the result section format, None without a crash.
+    :rtype: dict[str...] | None
+    """
+    crash = next((e for e in events if e["event"] in ACTIONS), None)
+    if crash is None or not timeseries:
+        return None
+    t0 = crash["time"]
+
+    before = [p for p in timeseries if p["time"] <= t0]
+    after = [p for p in timeseries if p["time"] > t0]
+    if not before:
+        return None
+    duration = sum(p["interval"] for p in before)
+    baseline = sum(successful_rate(p) * p["interval"]
+                   for p in before) / duration
+
+    unavailable = 0.0
+    degraded = False
+    recovery = None
+    for p in after:
+        rate = successful_rate(p)
+        if rate < UNAVAILABLE_FRACTION * baseline:
+            unavailable += p["interval"]
+        if rate < RECOVERED_FRACTION * baseline:
+            degraded = True
+        elif degraded:
+            recovery = max(0.0, p["time"] - p["interval"] - t0)
+            break
+    if not degraded:
+        recovery = 0.0
+
+    return {
+        "Node": crash["node"],
+        "Action": crash["event"],
+        "FaultTime(s)": t0,
+        "BaselineThroughput(ops/sec)": baseline,
+        "Unavailability(s)": round(unavailable, 3),
+        "RecoveryTime(s)": (round(recovery, 3) if recovery is not None
+                            else None),
+    }
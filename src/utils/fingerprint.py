@@ -0,0 +1,104 @@
+"""
+Content-addressed identity of benchmark runs.
+
+The fingerprint of a run hashes everything that decides what it measures:
+the SUT's binaries, its configuration files and run.py (which holds the
+command lines), the workload file, and the harness settings it ran with.
+Runs with equal fingerprints measure the same thing. A plan therefore
+only runs the trials a cell's fingerprint is missing in the results store,
+and after a submodule bump only the cells of that SUT run again; a run of
+an old binary never stands in for a new one.
+
+The run.py of a SUT supports fingerprints by providing:
+- BINARIES: list[Path], the executables it starts, or dict[str,
+  list[Path]] mapping every protocol name to its own
+- CONFIG_FILES: list[Path], the configuration files they read
+
+A file that does not exist hashes as None, so an unbuilt SUT never
+matches the runs of a built one.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Arguments of run_benchmark that change what a run measures, see settings
+SETTINGS = ("engine", "rate", "threads", "clients", "placement", "isolation",
+            "topology", "fault", "history", "pipeline", "steady_state",
+            "profile", "replicas")
+
+# (path, mtime, size) -> digest, binaries are hashed once per process
+_digests = {}
+
+
+def supports_fingerprints(module) -> bool:
+    return hasattr(module, "BINARIES") and hasattr(module, "CONFIG_FILES")
+
+
+def file_digest(path) -> str | None:
+    """
+    :param path: File to hash.
+    :type path: str | Path
+    :return: SHA-256 of the file's content, None if it does not exist.
+    :rtype: str | None
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    cache_key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    if cache_key not in _digests:
+        with open(path, "rb") as f:
+            _digests[cache_key] = hashlib.file_digest(f, "sha256").hexdigest()
+    return _digests[cache_key]
+
+
+def settings(engine="ycsb", rate=None, threads=None, clients=1,
+             placement="pinned", isolation=None, topology=None, fault=None,
+             history=False, pipeline=None, steady_state=None,
+             profile=None, replicas=None) -> dict[str]:
+    """
+    :return: The harness settings of a run in the form they are hashed in,
+             see main.run_benchmark for their meaning. topology is the
+             loaded topology, see netem.load_topology, and replicas the
+             cluster size, see replicas.current.
+    :rtype: dict[str...]
+    """
+    values = locals()
+    return {name: values[name] for name in SETTINGS}
+
+
+def fingerprint(project, protocol, module, workload_path,
+                run_settings) -> dict[str] | None:
+    """
+    :param project: SUT directory name.
+    :type project: str
+    :param protocol: Protocol name.
+    :type protocol: str
+    :param module: Loaded run.py of the SUT.
+    :type module: module
+    :param workload_path: YCSB workload file of the run.
+    :type workload_path: Path
+    :param run_settings: See settings.
+    :type run_settings: dict[str...]
+    :return: The digest of every input and their combined "key", None if
+             the SUT does not support fingerprints.
+    :rtype: dict[str...] | None
+    """
+    if not supports_fingerprints(module):
+        return None
+    binaries = module.BINARIES
+    if isinstance(binaries, dict):
+        binaries = binaries.get(protocol, [])
+    inputs = {
+        "project": project,
+        "protocol": protocol,
+        "binaries": {os.path.relpath(p): file_digest(p) for p in binaries},
+        "configs": {os.path.relpath(p): file_digest(p)
+                    for p in [module.__file__, *module.CONFIG_FILES]},
+        "workload": file_digest(workload_path),
+        "settings": run_settings,
+    }
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+    return {"key": hashlib.sha256(encoded).hexdigest(), **inputs}
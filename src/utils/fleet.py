@@ -0,0 +1,251 @@
+"""
+Fleets of load clients.
+
+One client process cannot saturate a 5-replica cluster, and sending every
+request to one endpoint hides follower-read and forwarding costs. A fleet
+runs N client processes concurrently (YCSB JVMs or native generators),
+each pointed at its own replicas:
+- "pinned": client i talks to replica i mod R only. The writes of
+  interfaces that only the leader accepts (loadgen.LEADER_WRITES) still
+  go to the leader, so their clients get every replica, replica i mod R
+  first, and send only their reads to it.
+- "spread": every client talks to all replicas, starting at replica i, so
+  round-robin clients do not hit the replicas in lockstep.
+
+The offered load and the operation count are split evenly between the
+clients. The load phase is split into staggered key ranges (YCSB's
+insertstart/insertcount), so the clients insert disjoint keys in
+parallel; the run phase draws keys from the whole key space.
+
+Results are merged from the clients' latency histograms, never by
+averaging percentiles, and a per-client breakdown is kept.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+from src.utils import histogram
+from src.utils import loadgen
+
+PLACEMENTS = ("pinned", "spread")
+
+
+def assign(endpoints, clients, placement="pinned",
+           interface=None) -> list[list[str]]:
+    """
+    :param endpoints: Replica endpoints.
+    :type endpoints: list[str]
+    :param clients: Number of client processes.
+    :type clients: int
+    :param placement: "pinned" or "spread", see the module docstring.
+    :type placement: str
+    :param interface: YCSB interface name of the SUT.
+    :type interface: str | None
+    :return: Endpoints of every client.
+    :rtype: list[list[str]]
+    """
+    if placement not in PLACEMENTS:
+        raise ValueError(f"Unknown placement '{placement}'")
+    targets = []
+    for i in range(clients):
+        offset = i % len(endpoints)
+        if placement == "pinned" and interface not in loadgen.LEADER_WRITES:
+            targets.append([endpoints[offset]])
+        else:
+            targets.append(endpoints[offset:] + endpoints[:offset])
+    return targets
+
+
+def split(total, clients) -> list[tuple[int, int]]:
+    """
+    Splits total items into contiguous ranges, one per client.
+
+    :return: (start, count) of every client, counts differ by at most one.
+    :rtype: list[tuple[int, int]]
+    """
+    ranges = []
+    start = 0
+    for i in range(clients):
+        count = total // clients + (1 if i < total % clients else 0)
+        ranges.append((start, count))
+        start += count
+    return ranges
+
+
+def run_threads(functions) -> list:
+    """
+    Calls every function concurrently, e.g. one per YCSB client process.
+
+    :param functions: Callables without arguments.
+    :type functions: list[Callable]
+    :return: Their results, in order.
+    :rtype: list
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(functions))) as pool:
+        futures = [pool.submit(f) for f in functions]
+        return [future.result() for future in futures]
+
+
+def run_native(interface, targets, workload_path, rate, phase="run",
+               properties=None, history_paths=None,
+               pipeline=None, placement="spread") -> list[tuple]:
+    """
+    Runs one native generator process per client. The processes are
+    spawned rather than forked, as the harness runs threads.
+
+    :param interface: YCSB interface name of the SUT.
+    :type interface: str
+    :param targets: Endpoints of every client, see assign.
+    :type targets: list[list[str]]
+    :param workload_path: Path to the YCSB workload file.
+    :type workload_path: Path
+    :param rate: Total target rate in ops/sec, split between the clients.
+    :type rate: float
+    :param phase: Either "load" or "run".
+    :type phase: str
+    :param properties: Workload property overrides of every client.
+    :type properties: list[dict[str, str]] | None
+    :param history_paths: History file of every client.
+    :type history_paths: list[Path] | None
+    :param pipeline: Window, batch and connections of every client, which
+                     then runs closed-loop instead of at rate.
+    :type pipeline: dict[str, int] | None
+    :param placement: Placement targets were assigned with; "pinned"
+                      clients send all but leader writes to their first
+                      endpoint.
+    :type placement: str
+    :return: The output of loadgen.run_native of every client.
+    :rtype: list[tuple[dict, dict, list]]
+    """
+    properties = properties or [None] * len(targets)
+    history_paths = history_paths or [None] * len(targets)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(targets),
+                             mp_context=context) as pool:
+        futures = [pool.submit(loadgen.run_native, interface, endpoints,
+                               workload_path, rate / len(targets), phase,
+                               properties=props, history_path=path,
+                               client=client, clients=len(targets),
+                               pipeline=pipeline,
+                               spread=1 if placement == "pinned" else None)
+                   for client, (endpoints, props, path) in enumerate(
+                       zip(targets, properties, history_paths))]
+        return [future.result() for future in futures]
+
+
+def _combine(points) -> dict[str]:
+    """
+    Combines the points of several clients covering the same interval:
+    counts and rates add up, averages are count-weighted and, as with
+    ycsb._merge_points, the larger of the other statistics is kept.
+    """
+    combined = {
+        "time": points[0]["time"],
+        "interval": max(p.get("interval", 1) for p in points),
+        "operations": sum(p["operations"] for p in points),
+        "ops/sec": sum(p["ops/sec"] for p in points),
+    }
+    sections = {k for p in points for k, v in p.items() if isinstance(v, dict)}
+    for section in sections:
+        parts = [p[section] for p in points if section in p]
+        stats = {}
+        count = sum(s.get("Count", 0) for s in parts)
+        for key in {k for s in parts for k in s}:
+            values = [s[key] for s in parts if key in s]
+            if key in ("Count", "Errors"):
+                stats[key] = sum(values)
+            elif key == "Min":
+                stats[key] = min(values)
+            elif key == "Avg" and count:
+                stats[key] = sum(s["Avg"] * s.get("Count", 0)
+                                 for s in parts if "Avg" in s) / count
+            else:
+                stats[key] = max(values)
+        combined[section] = stats
+    return combined
+
+
+def merge_timeseries(series) -> list[dict]:
+    """
+    Merges the time series of the clients by interval end time. A client
+    without a point at some time still counts with its last cumulative
+    operation count, so the merged count never goes backwards.
+
+    :param series: Time series of every client.
+    :type series: list[list[dict]]
+    :rtype: list[dict]
+    """
+    by_time = [{round(p["time"], 3): p for p in points} for points in series]
+    merged = []
+    last_operations = [0] * len(series)
+    for t in sorted({t for points in by_time for t in points}):
+        present = []
+        for i, points in enumerate(by_time):
+            if t in points:
+                last_operations[i] = points[t]["operations"]
+                present.append(points[t])
+        point = _combine(present)
+        point["operations"] = sum(last_operations)
+        merged.append(point)
+    return merged
+
+
+def _operations(result) -> int:
+    """
+    :return: Operations a client completed, from its own throughput: the
+             histograms also hold the READ and UPDATE halves of every
+             READ-MODIFY-WRITE and YCSB's CLEANUP.
+    :rtype: int
+    """
+    overall = result.get("OVERALL", {})
+    return round(overall.get("Throughput(ops/sec)", 0.0)
+                 * overall.get("RunTime(ms)", 0) / 1000)
+
+
+def merge(outputs, targets) -> tuple[dict, dict, list, dict]:
+    """
+    Merges the outputs of all clients into one result.
+
+    :param outputs: (result, encoded histograms, time series) of every
+                    client, results in the shape of parse_ycsb_output.
+    :type outputs: list[tuple[dict, dict, list]]
+    :param targets: Endpoints of every client.
+    :type targets: list[list[str]]
+    :return: The merged result, histograms and time series, and the
+             per-client breakdown.
+    :rtype: tuple[dict[str, dict], dict[str, str], list[dict], dict]
+    """
+    sections = sorted({s for _, hists, _ in outputs for s in hists})
+    histograms = {s: histogram.merge(h[s] for _, h, _ in outputs if s in h)
+                  for s in sections}
+
+    runtime = max(r.get("OVERALL", {}).get("RunTime(ms)", 0)
+                  for r, _, _ in outputs)
+    operations = sum(_operations(r) for r, _, _ in outputs)
+    result = {"OVERALL": {
+        "RunTime(ms)": runtime,
+        "Throughput(ops/sec)": operations / runtime * 1000 if runtime else 0.0,
+    }}
+    for section, hist in histograms.items():
+        stats = hist.summary()
+        for r, _, _ in outputs:
+            for key, value in r.get(section, {}).items():
+                if key.startswith("Return="):
+                    stats[key] = stats.get(key, 0) + value
+        result[section] = stats
+
+    breakdown = {}
+    for i, ((r, hists, _), endpoints) in enumerate(zip(outputs, targets)):
+        service = histogram.merge(v for s, v in hists.items()
+                                  if not s.startswith("Intended-"))
+        breakdown[f"client{i}"] = {
+            "Endpoints": ",".join(endpoints),
+            "Operations": _operations(r),
+            "RunTime(ms)": r.get("OVERALL", {}).get("RunTime(ms)", 0),
+            "Throughput(ops/sec)": r.get("OVERALL", {}).get(
+                "Throughput(ops/sec)", 0.0),
+            "99thPercentileLatency(us)": service.value_at_percentile(99),
+        }
+
+    encoded = {s: h.encode() for s, h in histograms.items()}
+    return (result, encoded, merge_timeseries([ts for _, _, ts in outputs]),
+            breakdown)
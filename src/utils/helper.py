@@ -28,3 +28,30 @@ def get_option(min, max, opts) -> int:
             sys.exit()
         except ValueError:
             pass
+
+
+def get_number(prompt, default) -> float:
+    """
+    Gets a positive number from the user, falling back to default when the
+    input is left empty.
+
+    :param prompt: Text shown before the input
+    :type prompt: str
+    :param default: Value used for empty input
+    :type default: float
+    """
+    while True:
+        try:
+            text = input(f"{prompt} [{default}]: ").strip()
+            if not text:
+                return default
+
+            num = float(text)
+            if num > 0:
+                return num
+
+        except KeyboardInterrupt:
+            print("\nExiting program...")
+            sys.exit()
+        except ValueError:
+            pass
@@ -0,0 +1,379 @@
+"""
+Latency histograms compatible with HdrHistogram.
+
+Histogram uses the same bucket layout and the same compressed V2 encoding
+as HdrHistogram (Java, Go, C...), so the interval logs YCSB writes with
+``measurementtype=hdrhistogram`` and ``hdrhistogram.fileoutput=true`` can be
+decoded directly, and the encoded strings we store can be read back by any
+HdrHistogram implementation.
+
+Counts are kept in a sparse dict, so histograms never need resizing and
+merging two of them only touches the buckets that were used.
+"""
+import base64
+import bisect
+import itertools
+import math
+import struct
+import zlib
+from pathlib import Path
+
+SIGNIFICANT_DIGITS = 3
+LOWEST_VALUE = 1
+
+ENCODING_COOKIE = 0x1c849303
+COMPRESSED_COOKIE = 0x1c849304
+# Cookies carry the word size in bits 4-7, which is 8 bytes in V2.
+WORD_SIZE_FLAG = 0x10
+HEADER = struct.Struct(">iiiiqqd")
+
+
+def _zigzag_encode(value, out) -> None:
+    value = (value << 1) ^ (value >> 63)
+    for _ in range(8):
+        if value < 0x80:
+            out.append(value)
+            return
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value & 0xff)
+
+
+def _zigzag_decode(data, pos):
+    value = 0
+    shift = 0
+    for i in range(9):
+        byte = data[pos]
+        pos += 1
+        if i == 8:
+            value |= byte << 56
+            break
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    value &= (1 << 64) - 1
+    return (value >> 1) ^ -(value & 1), pos
+
+
+class Histogram:
+    """
+    Sparse HdrHistogram of integer values (latencies in microseconds).
+
+    :param significant_digits: Decimal digits of precision kept per value.
+    :type significant_digits: int
+    :param lowest: Lowest discernible value.
+    :type lowest: int
+    """
+
+    def __init__(self, significant_digits=SIGNIFICANT_DIGITS,
+                 lowest=LOWEST_VALUE):
+        self.significant_digits = significant_digits
+        self.lowest = lowest
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = None
+
+        single_unit = 2 * 10 ** significant_digits
+        self.sub_bucket_count_magnitude = math.ceil(math.log2(single_unit))
+        self.sub_bucket_half_count_magnitude = max(
+            self.sub_bucket_count_magnitude - 1, 0)
+        self.sub_bucket_count = 1 << self.sub_bucket_count_magnitude
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.unit_magnitude = int(math.floor(math.log2(lowest)))
+        self.sub_bucket_mask = ((self.sub_bucket_count - 1)
+                                << self.unit_magnitude)
+
+    def _index(self, value) -> int:
+        bucket = ((value | self.sub_bucket_mask).bit_length()
+                  - self.unit_magnitude - self.sub_bucket_count_magnitude)
+        sub_bucket = value >> (bucket + self.unit_magnitude)
+        base = (bucket + 1) << self.sub_bucket_half_count_magnitude
+        return base + sub_bucket - self.sub_bucket_half_count
+
+    def _bucket_of(self, index):
+        bucket = (index >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket = ((index & (self.sub_bucket_half_count - 1))
+                      + self.sub_bucket_half_count)
+        if bucket < 0:
+            sub_bucket -= self.sub_bucket_half_count
+            bucket = 0
+        return bucket, sub_bucket
+
+    def _value(self, index) -> int:
+        bucket, sub_bucket = self._bucket_of(index)
+        return sub_bucket << (bucket + self.unit_magnitude)
+
+    def _highest_equivalent(self, index) -> int:
+        bucket, sub_bucket = self._bucket_of(index)
+        if sub_bucket >= self.sub_bucket_count:
+            bucket += 1
+        size = 1 << (self.unit_magnitude + bucket)
+        return self._value(index) + size - 1
+
+    def record(self, value, count=1) -> None:
+        """
+        Records a value, negative values are clamped to 0.
+
+        :param value: Value to record.
+        :type value: int | float
+        :param count: Number of occurrences.
+        :type count: int
+        """
+        value = max(0, int(round(value)))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other) -> "Histogram":
+        """
+        Adds all counts of other into this histogram. Both must share the
+        same layout (significant digits and lowest value).
+
+        :param other: Histogram to add.
+        :type other: Histogram
+        :return: self, for chaining.
+        :rtype: Histogram
+        """
+        if (other.significant_digits != self.significant_digits
+                or other.lowest != self.lowest):
+            raise ValueError("Cannot merge histograms with different layouts")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        if other.total:
+            self.min = (other.min if self.min is None
+                        else min(self.min, other.min))
+            self.max = (other.max if self.max is None
+                        else max(self.max, other.max))
+        return self
+
+    def value_at_percentile(self, percentile) -> int:
+        """
+        Same semantics as HdrHistogram's getValueAtPercentile: the highest
+        value equivalent to the bucket holding the requested rank. Safe to
+        call while another thread records.
+
+        :param percentile: Percentile in [0, 100], e.g. 99.99.
+        :type percentile: float
+        :rtype: int
+        """
+        if not self.total:
+            return 0
+        percentile = min(max(percentile, 0.0), 100.0)
+        rank = max(1, int(percentile / 100 * self.total + 0.5))
+        seen = 0
+        for index, count in sorted(list(self.counts.items())):
+            seen += count
+            if seen >= rank:
+                if percentile == 0:
+                    return self._value(index)
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds) -> list[int]:
+        """
+        Number of recorded values at or below each bound, at the precision
+        of the histogram (a bucket counts under the first bound at or above
+        its lowest value). Safe to call while another thread records.
+
+        :param bounds: Ascending upper bounds.
+        :type bounds: Sequence[int]
+        :rtype: list[int]
+        """
+        counts = [0] * len(bounds)
+        for index, count in list(self.counts.items()):
+            i = bisect.bisect_left(bounds, self._value(index))
+            if i < len(bounds):
+                counts[i] += count
+        return list(itertools.accumulate(counts))
+
+    def buckets(self) -> list[tuple[int, int]]:
+        """
+        :return: (highest equivalent value, count) of every non-empty
+                 bucket, in ascending order of value. Safe to call while
+                 another thread records.
+        :rtype: list[tuple[int, int]]
+        """
+        return [(self._highest_equivalent(index), count)
+                for index, count in sorted(list(self.counts.items()))]
+
+    def mean(self) -> float:
+        """
+        Mean of the bucket midpoints. Safe to call while another thread
+        records: the buckets are copied first, and the mean is taken over
+        the values in the copy.
+
+        :rtype: float
+        """
+        total = 0
+        recorded = 0
+        for index, count in list(self.counts.items()):
+            low = self._value(index)
+            middle = low + (self._highest_equivalent(index) - low + 1) // 2
+            total += middle * count
+            recorded += count
+        if not recorded:
+            return 0.0
+        return total / recorded
+
+    def summary(self, percentiles=(50, 95, 99, 99.9, 99.99)) -> dict[str]:
+        """
+        Summary with the same keys YCSB prints for an operation section.
+
+        :param percentiles: Percentiles to include.
+        :type percentiles: tuple[float]
+        :rtype: dict[str, int | float]
+        """
+        stats = {
+            "Operations": self.total,
+            "AverageLatency(us)": self.mean(),
+            "MinLatency(us)": self.min or 0,
+            "MaxLatency(us)": self.max or 0,
+        }
+        for p in percentiles:
+            name = f"{p:g}"
+            stats[f"{name}thPercentileLatency(us)"] = (
+                self.value_at_percentile(p))
+        return stats
+
+    def encode(self) -> str:
+        """
+        Encodes the histogram in HdrHistogram's compressed V2 format,
+        base64 encoded (the "HISTF..." strings found in histogram logs).
+
+        :rtype: str
+        """
+        payload = bytearray()
+        zeros = 0
+        last = max(self.counts) if self.counts else -1
+        for index in range(last + 1):
+            count = self.counts.get(index, 0)
+            if count == 0:
+                zeros += 1
+                continue
+            if zeros:
+                _zigzag_encode(-zeros, payload)
+                zeros = 0
+            _zigzag_encode(count, payload)
+
+        highest = max(2 * self.lowest,
+                      self._highest_equivalent(last) if last >= 0 else 0)
+        header = HEADER.pack(ENCODING_COOKIE | WORD_SIZE_FLAG, len(payload),
+                             0, self.significant_digits, self.lowest,
+                             highest, 1.0)
+        compressed = zlib.compress(header + payload)
+        data = struct.pack(">ii", COMPRESSED_COOKIE | WORD_SIZE_FLAG,
+                           len(compressed)) + compressed
+        return base64.b64encode(data).decode()
+
+    @classmethod
+    def decode(cls, encoded) -> "Histogram":
+        """
+        Decodes a base64 compressed histogram produced by encode or by any
+        HdrHistogram implementation.
+
+        :param encoded: Base64 string.
+        :type encoded: str
+        :rtype: Histogram
+        """
+        data = base64.b64decode(encoded)
+        cookie, length = struct.unpack_from(">ii", data)
+        if cookie & ~0xf0 != COMPRESSED_COOKIE:
+            raise ValueError("Not a compressed HdrHistogram")
+        raw = zlib.decompress(data[8:8 + length])
+
+        (cookie, payload_length, offset, digits, lowest,
+         _, _) = HEADER.unpack_from(raw)
+        if cookie & ~0xf0 != ENCODING_COOKIE:
+            raise ValueError("Unsupported HdrHistogram encoding")
+        if offset:
+            raise ValueError("Normalized HdrHistogram encodings are not "
+                             "supported")
+
+        hist = cls(digits, lowest)
+        pos = HEADER.size
+        end = pos + payload_length
+        index = 0
+        while pos < end:
+            count, pos = _zigzag_decode(raw, pos)
+            if count < 0:
+                index += -count
+                continue
+            if count:
+                hist.counts[index] = count
+                hist.total += count
+            index += 1
+
+        if hist.counts:
+            hist.min = hist._value(min(hist.counts))
+            hist.max = hist._highest_equivalent(max(hist.counts))
+        return hist
+
+
+def merge(encoded_histograms) -> Histogram:
+    """
+    Merges encoded histograms, e.g. the same operation across repeated runs
+    or across several client processes.
+
+    :param encoded_histograms: Base64 encoded histograms.
+    :type encoded_histograms: Iterable[str]
+    :rtype: Histogram
+    """
+    merged = None
+    for encoded in encoded_histograms:
+        hist = Histogram.decode(encoded)
+        merged = hist if merged is None else merged.merge(hist)
+    return merged if merged is not None else Histogram()
+
+
+def parse_log_line(line) -> str | None:
+    """
+    :param line: A line of an HdrHistogram interval log.
+    :type line: str
+    :return: The encoded histogram of the interval, None for comments,
+             headers and blank lines.
+    :rtype: str | None
+    """
+    line = line.strip()
+    if not line or line.startswith("#") or line.startswith('"'):
+        return None
+    return line.rsplit(",", 1)[-1]
+
+
+def read_log(path) -> Histogram:
+    """
+    Reads an HdrHistogram interval log (as written by YCSB with
+    hdrhistogram.fileoutput=true) and sums all intervals.
+
+    :param path: Path to the .hdr log file.
+    :type path: Path
+    :rtype: Histogram
+    """
+    total = None
+    with open(path, "r") as f:
+        for line in f:
+            encoded = parse_log_line(line)
+            if encoded is None:
+                continue
+            hist = Histogram.decode(encoded)
+            total = hist if total is None else total.merge(hist)
+    return total if total is not None else Histogram()
+
+
+def read_log_dir(directory) -> dict[str, str]:
+    """
+    Reads every <OPERATION>.hdr log in a directory.
+
+    :param directory: Value used for hdrhistogram.output.path.
+    :type directory: Path
+    :return: Operation name mapped to its encoded histogram.
+    :rtype: dict[str, str]
+    """
+    return {path.stem: read_log(path).encode()
+            for path in sorted(Path(directory).glob("*.hdr"))}
@@ -0,0 +1,194 @@
+"""
+Binary operation histories, one memory-mapped file per load client.
+
+With history recording on, the native generator appends one fixed-size
+record per operation to its client's file: operation, status, client id,
+target replica, key id, value hash, invoke and return times. Appending
+packs the record straight into a shared memory mapping of the file, so
+there is no write syscall or buffering per operation; the mapping doubles
+when full and the file is cut to the records written on close.
+
+Times are CLOCK_MONOTONIC nanoseconds (time.perf_counter), which every
+client process on the machine shares, so the files of a fleet can be
+merged. Values are recorded as a 64-bit hash: 0 for reads that found
+nothing, enough for the linearizability checker to tell writes apart.
+
+read maps a file into a NumPy structured array without copying it, for
+analysis; operations decodes files into the dicts the linearizability
+checker takes and needs only the standard library.
+
+File layout: a HEADER (magic, version, record size, record count, wall
+clock time of the first record in ns), then the records.
+"""
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+HISTORY_DIR = Path("histories.local")
+SUFFIX = ".hist"
+MAGIC = b"DBHIST\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQq")
+# op, status, client, replica, key, value hash, invoke ns, return ns
+RECORD = struct.Struct("<BBHHxxQQqq")
+INITIAL_CAPACITY = 1 << 16
+
+OPERATIONS = ("READ", "UPDATE", "INSERT", "DELETE")
+OP_CODES = {op: code for code, op in enumerate(OPERATIONS)}
+STATUSES = ("OK", "ERROR", "NOT_FOUND")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+# NumPy dtype of RECORD, see read
+FIELDS = [("op", "u1"), ("status", "u1"), ("client", "<u2"),
+          ("replica", "<u2"), ("pad", "V2"), ("key", "<u8"),
+          ("value", "<u8"), ("invoke", "<i8"), ("return", "<i8")]
+
+
+def value_hash(value) -> int:
+    """
+    :param value: Value written or read, None or empty when absent.
+    :type value: bytes | None
+    :return: 64-bit hash of the value, 0 for no value. CRC-32 and
+             Adler-32 side by side: twice as fast as a cryptographic hash
+             and plenty to tell apart the values written to one key.
+    :rtype: int
+    """
+    if not value:
+        return 0
+    return (zlib.crc32(value) << 32 | zlib.adler32(value)) or 1
+
+
+class HistoryWriter:
+    """
+    Appends records to a memory-mapped history file.
+
+    :param path: File to create.
+    :type path: str | Path
+    :param client: Client id stored in every record.
+    :type client: int
+    :param capacity: Records the file holds before it grows.
+    :type capacity: int
+    """
+
+    def __init__(self, path, client=0, capacity=INITIAL_CAPACITY):
+        self.path = Path(path)
+        self.client = client
+        self.count = 0
+        self.started = None
+        self.capacity = capacity
+        self.file = open(self.path, "w+b")
+        self.file.truncate(HEADER.size + capacity * RECORD.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self._write_header()
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, RECORD.size,
+                         self.count, self.started or 0)
+
+    def append(self, op, status, key, value, invoke, ret, replica=0) -> None:
+        """
+        :param op: READ, UPDATE, INSERT or DELETE.
+        :type op: str
+        :param status: OK, ERROR or NOT_FOUND.
+        :type status: str
+        :param key: Key id.
+        :type key: int
+        :param value: Hash of the value, see value_hash.
+        :type value: int
+        :param invoke: Invoke time, time.perf_counter seconds.
+        :type invoke: float
+        :param ret: Return time, time.perf_counter seconds.
+        :type ret: float
+        :param replica: Index of the replica the request went to.
+        :type replica: int
+        """
+        if self.count == self.capacity:
+            self.capacity *= 2
+            self.map.resize(HEADER.size + self.capacity * RECORD.size)
+        if self.started is None:
+            self.started = time.time_ns()
+        RECORD.pack_into(self.map, HEADER.size + self.count * RECORD.size,
+                         OP_CODES[op], STATUS_CODES[status], self.client,
+                         replica, key, value, int(invoke * 1e9),
+                         int(ret * 1e9))
+        self.count += 1
+
+    def close(self) -> None:
+        """
+        Writes the record count and cuts the file to the records written.
+        """
+        if self.map is None:
+            return
+        self._write_header()
+        self.map.flush()
+        self.map.close()
+        self.map = None
+        self.file.truncate(HEADER.size + self.count * RECORD.size)
+        self.file.close()
+
+
+def _header(path) -> tuple[int, int]:
+    """
+    :return: Record count and wall clock start of a history file.
+    :raises ValueError: If the file is not a history of this version.
+    """
+    with open(path, "rb") as f:
+        magic, version, size, count, started = HEADER.unpack(
+            f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        raise ValueError(f"{path} is not a version {VERSION} history file")
+    if not count:
+        # not closed: every record up to the first empty one counts
+        count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+        with open(path, "rb") as f:
+            f.seek(HEADER.size)
+            for i, record in enumerate(RECORD.iter_unpack(
+                    f.read(count * RECORD.size))):
+                if record[6] == 0:
+                    count = i
+                    break
+    return count, started
+
+
+def read(path):
+    """
+    Maps a history file into a NumPy structured array with the fields op,
+    status, client, replica, key, value, invoke and return, without
+    copying it.
+
+    :param path: History file.
+    :type path: str | Path
+    :rtype: np.ndarray
+    """
+    import numpy as np
+    count, _ = _header(path)
+    return np.memmap(path, dtype=np.dtype(FIELDS), mode="r",
+                     offset=HEADER.size, shape=(count,))
+
+
+def operations(paths) -> list[dict]:
+    """
+    Decodes history files into operations for the linearizability checker.
+
+    :param paths: History files, e.g. those of every client of a fleet.
+    :type paths: Iterable[str | Path]
+    :rtype: list[dict]
+    """
+    ops = []
+    for path in paths:
+        count, _ = _header(path)
+        with open(path, "rb") as f:
+            f.seek(HEADER.size)
+            data = f.read(count * RECORD.size)
+        for (op, status, client, replica, key, value, invoke,
+             ret) in RECORD.iter_unpack(data):
+            ops.append({"op": OPERATIONS[op], "status": STATUSES[status],
+                        "client": client, "replica": replica, "key": key,
+                        "value": value, "call": invoke, "return": ret})
+    return ops
+
+
+def files(directory) -> list[Path]:
+    return sorted(Path(directory).glob(f"*{SUFFIX}"))
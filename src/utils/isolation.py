@@ -0,0 +1,223 @@
+"""
+CPU pinning and cgroup v2 isolation of replicas and load clients.
+
+With isolation enabled, every replica and the load client get disjoint
+CPU sets before the load phase. CPUs are handed out in topology order
+(package, core), so hyperthread siblings stay in the same set. The client
+side is the harness process itself: it is pinned with all its threads, so
+the YCSB JVMs and native generator processes it starts inherit its CPUs.
+Every thread of a replica is pinned with sched_setaffinity, and a replica
+the supervisor restarts (after a crash fault) is started on its CPUs
+again rather than on the client's, see supervisor.pin_restarts. release
+gives the harness its CPUs back once the cluster is stopped, so what it
+starts for later runs is not confined to the client CPUs.
+
+With cgroup enabled, each replica is also moved into its own cgroup v2
+group under /sys/fs/cgroup/distrobench with memory.max, cpu.max and,
+when the cpuset controller is available, cpuset.cpus. This needs write
+access to the cgroup hierarchy (root or a delegated subtree); when it is
+not permitted the run goes on with CPU pinning only and the reason is
+recorded with the placement.
+"""
+import os
+from pathlib import Path
+
+from src.utils import supervisor
+
+# CPUs the harness may use, read before it pins itself to the client CPUs
+AVAILABLE_CPUS = sorted(os.sched_getaffinity(0))
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+CGROUP_PARENT = "distrobench"
+# Memory limit of a replica, as in the README's Docker setup
+MEMORY_LIMIT = "1G"
+CPU_PERIOD_US = 100000
+CONTROLLERS = ("cpu", "cpuset", "memory")
+# CPUs of the harness before place pinned it, None when it is not pinned
+_client_cpus_before = None
+
+
+def _topology_key(cpu):
+    topology = Path(f"/sys/devices/system/cpu/cpu{cpu}/topology")
+    try:
+        return (int((topology / "physical_package_id").read_text()),
+                int((topology / "core_id").read_text()), cpu)
+    except (OSError, ValueError):
+        return (0, cpu, cpu)
+
+
+def parse_size(size) -> int:
+    """
+    :param size: Bytes, optionally with a K, M or G suffix, e.g. "1G".
+    :type size: str | int
+    :rtype: int
+    """
+    size = str(size).strip().upper()
+    units = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def layout(replicas, cpus_per_replica=None, client_cpus=None,
+           cpus=None) -> dict[str, list[int]]:
+    """
+    Splits the CPUs into disjoint sets for the client and every replica.
+
+    :param replicas: Replica names.
+    :type replicas: Iterable[str]
+    :param cpus_per_replica: CPUs of each replica, by default an equal
+                             share of what the client leaves.
+    :type cpus_per_replica: int | None
+    :param client_cpus: CPUs of the client, by default one share as if the
+                        client were one more replica.
+    :type client_cpus: int | None
+    :param cpus: CPUs to split, AVAILABLE_CPUS by default.
+    :type cpus: list[int] | None
+    :return: "client" and every replica name mapped to its CPUs.
+    :rtype: dict[str, list[int]]
+    :raises ValueError: If there are not enough CPUs.
+    """
+    replicas = sorted(replicas)
+    cpus = sorted(cpus or AVAILABLE_CPUS, key=_topology_key)
+    client_cpus = client_cpus or max(1, len(cpus) // (len(replicas) + 1))
+    cpus_per_replica = (cpus_per_replica
+                        or (len(cpus) - client_cpus) // max(1, len(replicas)))
+    needed = client_cpus + cpus_per_replica * len(replicas)
+    if cpus_per_replica < 1 or needed > len(cpus):
+        raise ValueError(f"Isolating {len(replicas)} replicas and the client "
+                         f"needs {max(needed, len(replicas) + 1)} CPUs, "
+                         f"{len(cpus)} are available")
+
+    assignment = {"client": sorted(cpus[:client_cpus])}
+    start = client_cpus
+    for name in replicas:
+        assignment[name] = sorted(cpus[start:start + cpus_per_replica])
+        start += cpus_per_replica
+    return assignment
+
+
+def pin(pid, cpus) -> None:
+    """
+    Pins every thread of a process. Threads it creates afterwards inherit
+    the CPUs of their creator.
+
+    :param pid: Process id.
+    :type pid: int
+    :param cpus: CPUs the process may run on.
+    :type cpus: list[int]
+    """
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        try:
+            os.sched_setaffinity(int(task.name), cpus)
+        except ProcessLookupError:
+            # the thread exited meanwhile
+            pass
+
+
+def _write(path, value) -> None:
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+def _cgroup_parent() -> tuple[Path, set[str]]:
+    """
+    Creates the parent group and enables the controllers for its children.
+
+    :return: The parent group and the enabled controllers.
+    :raises OSError: If cgroup v2 is not mounted or not writable.
+    """
+    available = (CGROUP_ROOT / "cgroup.controllers").read_text().split()
+    controllers = [c for c in CONTROLLERS if c in available]
+    parent = CGROUP_ROOT / CGROUP_PARENT
+    parent.mkdir(exist_ok=True)
+    if controllers:
+        enable = " ".join(f"+{c}" for c in controllers)
+        _write(CGROUP_ROOT / "cgroup.subtree_control", enable)
+        _write(parent / "cgroup.subtree_control", enable)
+    # groups of earlier runs are removed once their replicas exited
+    for group in parent.iterdir():
+        if group.is_dir():
+            try:
+                group.rmdir()
+            except OSError:
+                pass
+    return parent, set(controllers)
+
+
+def join_cgroup(parent, controllers, name, pid, cpus, memory) -> dict[str]:
+    """
+    Moves a replica into its own group with its memory and CPU limits.
+
+    :return: The group path and the limits that were set.
+    :rtype: dict[str...]
+    """
+    group = parent / name
+    group.mkdir(exist_ok=True)
+    limits = {}
+    if "memory" in controllers:
+        limits["memory.max"] = parse_size(memory)
+    if "cpu" in controllers:
+        limits["cpu.max"] = f"{len(cpus) * CPU_PERIOD_US} {CPU_PERIOD_US}"
+    if "cpuset" in controllers:
+        limits["cpuset.cpus"] = ",".join(map(str, cpus))
+    for key, value in limits.items():
+        _write(group / key, value)
+    # moves every thread of the process at once
+    _write(group / "cgroup.procs", pid)
+    return {"cgroup": str(group), **limits}
+
+
+def place(pids, options) -> dict[str]:
+    """
+    Pins the client (this process) and every replica to its CPUs and, if
+    requested and permitted, moves the replicas into cgroups. The client
+    stays pinned until release.
+
+    :param pids: Replica name mapped to its pid, as returned by run.py.
+    :type pids: dict[str, int]
+    :param options: cpus_per_replica, client_cpus, cgroup (bool) and
+                    memory (e.g. "1G"), all optional.
+    :type options: dict[str...]
+    :return: The placement, stored with the result.
+    :rtype: dict[str...]
+    """
+    global _client_cpus_before
+    assignment = layout(pids, options.get("cpus_per_replica"),
+                        options.get("client_cpus"))
+    if _client_cpus_before is None:
+        _client_cpus_before = sorted(os.sched_getaffinity(0))
+    pin(os.getpid(), assignment["client"])
+    placement = {"client": {"pid": os.getpid(), "cpus": assignment["client"]},
+                 "replicas": {}}
+    for name, pid in pids.items():
+        pin(pid, assignment[name])
+        supervisor.pin_restarts(pid, assignment[name])
+        placement["replicas"][name] = {"pid": pid, "cpus": assignment[name]}
+
+    if options.get("cgroup"):
+        memory = options.get("memory", MEMORY_LIMIT)
+        try:
+            parent, controllers = _cgroup_parent()
+            for name, pid in pids.items():
+                placement["replicas"][name].update(join_cgroup(
+                    parent, controllers, name, pid, assignment[name], memory))
+        except OSError as e:
+            placement["cgroup_error"] = str(e)
+            print(f"cgroup isolation not applied: {e}")
+
+    for name, node in placement["replicas"].items():
+        print(f"{name}: CPUs {node['cpus']}"
+              + (f", cgroup {node['cgroup']}" if "cgroup" in node else ""))
+    print(f"client: CPUs {assignment['client']}")
+    return placement
+
+
+def release() -> None:
+    """
+    Gives every thread of this process back the CPUs it had before place
+    pinned it; nothing to do if it was not pinned.
+    """
+    global _client_cpus_before
+    if _client_cpus_before is not None:
+        pin(os.getpid(), _client_cpus_before)
+        _client_cpus_before = None
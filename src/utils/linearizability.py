@@ -0,0 +1,393 @@
+"""
+Linearizability checker for recorded key-value operation histories.
+
+Every key of a linearizable key-value store behaves as a linearizable
+register, and a history is linearizable iff the sub-history of every key
+is (P-compositionality). The history is therefore split by key and the
+partitions are checked in parallel on a process pool, small partitions
+batched together so the pool is not drowned in tiny tasks.
+
+A partition is checked with the Wing & Gong search as refined by Lowe and
+used by Porcupine: the call and return events are kept in a linked list
+in time order, the search linearizes any pending call whose operation is
+legal in the current state, and backtracks when it meets the return of an
+operation it has not linearized. Every (set of linearized operations,
+register state) pair reached is cached, so a configuration is never
+explored twice.
+
+Operations are dicts with:
+- "op": READ, UPDATE, INSERT or DELETE (writes of None)
+- "key", "value": the value written, or returned by a read
+- "call", "return": invoke and return timestamps (any unit)
+- "status": YCSB status name, "OK" when the operation succeeded
+Only "OK" operations are definite. A failed write may still have taken
+effect, so it is kept with an open return; a failed read tells nothing
+and is dropped, except NOT_FOUND, which reads None. Keys loaded before the
+recording start in an unknown state that the first read establishes.
+
+When a partition is not linearizable, the shortest failing prefix of it
+(by return order) is searched, then shrunk by dropping the operations the
+failure does not need, and reported as the counterexample.
+
+Usage:
+    python -m src.utils.linearizability history.jsonl [--timeout 60]
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+READS = {"READ"}
+WRITES = {"UPDATE", "INSERT", "DELETE"}
+# Seconds the search of one partition may take
+PARTITION_TIMEOUT = 60
+# Partitions are batched into tasks of about this many operations
+TASK_OPERATIONS = 20000
+# Iterations of the search between two deadline checks
+DEADLINE_STRIDE = 4096
+
+LINEARIZABLE = "linearizable"
+VIOLATION = "violation"
+TIMEOUT = "timeout"
+
+
+class _Unknown:
+    def __repr__(self):
+        return "unknown"
+
+
+# State of a key whose value was set before the history starts
+UNKNOWN = _Unknown()
+
+
+class _Entry:
+    """
+    Call or return event of an operation in the search's linked list. A
+    call entry links to its return entry through match.
+    """
+    __slots__ = ("id", "time", "match", "prev", "next")
+
+    def __init__(self, op_id, at, match=None):
+        self.id = op_id
+        self.time = at
+        self.match = match
+        self.prev = None
+        self.next = None
+
+
+def _step(state, op):
+    """
+    Applies an operation to a register.
+
+    :return: Whether the operation is legal in state, and the new state.
+    :rtype: tuple[bool, Any]
+    """
+    if op["op"] in WRITES:
+        return True, op["value"]
+    if state is UNKNOWN:
+        return True, op["value"]
+    return state == op["value"], state
+
+
+def normalize(history) -> list[dict]:
+    """
+    Drops the operations that constrain nothing and opens the return of
+    writes whose outcome is unknown, see the module docstring.
+
+    :param history: Operations, see the module docstring.
+    :type history: Iterable[dict]
+    :rtype: list[dict]
+    """
+    ops = []
+    for op in history:
+        status = op.get("status", "OK")
+        kind = op["op"].upper()
+        if kind in READS:
+            if status == "NOT_FOUND":
+                op = {**op, "value": None}
+            elif status != "OK":
+                continue
+        elif kind not in WRITES:
+            continue
+        op = {**op, "op": kind}
+        if kind == "DELETE":
+            op["value"] = None
+        if status != "OK" and kind in WRITES or op.get("return") is None:
+            op["return"] = math.inf
+        ops.append(op)
+    return ops
+
+
+def check_register(ops, timeout=PARTITION_TIMEOUT, initial=UNKNOWN) -> str:
+    """
+    Checks the history of one key.
+
+    :param ops: Normalized operations of the key, see normalize.
+    :type ops: list[dict]
+    :param timeout: Seconds the search may take.
+    :type timeout: float
+    :param initial: Value of the key before the history.
+    :return: LINEARIZABLE, VIOLATION or TIMEOUT.
+    :rtype: str
+    """
+    events = []
+    for i, op in enumerate(ops):
+        ret = _Entry(i, op["return"])
+        events.append((op["call"], 0, _Entry(i, op["call"], ret)))
+        events.append((op["return"], 1, ret))
+    # calls sort before returns at the same time: such operations overlap
+    events.sort(key=lambda e: (e[0], e[1]))
+    head = _Entry(-1, -math.inf)
+    prev = head
+    for _, _, entry in events:
+        prev.next = entry
+        entry.prev = prev
+        prev = entry
+
+    deadline = time.monotonic() + timeout
+    state = initial
+    linearized = 0
+    cache = set()
+    stack = []
+    entry = head.next
+    iterations = 0
+    while head.next is not None:
+        iterations += 1
+        if iterations % DEADLINE_STRIDE == 0 and time.monotonic() > deadline:
+            return TIMEOUT
+        if entry.match is not None:
+            legal, new_state = _step(state, ops[entry.id])
+            if legal:
+                new_linearized = linearized | (1 << entry.id)
+                if (new_linearized, new_state) not in cache:
+                    cache.add((new_linearized, new_state))
+                    stack.append((entry, state))
+                    state = new_state
+                    linearized = new_linearized
+                    # lift the call and its return out of the list
+                    entry.prev.next = entry.next
+                    entry.next.prev = entry.prev
+                    match = entry.match
+                    match.prev.next = match.next
+                    if match.next is not None:
+                        match.next.prev = match.prev
+                    entry = head.next
+                    continue
+            entry = entry.next
+        else:
+            # a return whose operation could not be linearized before it
+            if not stack:
+                return VIOLATION
+            entry, state = stack.pop()
+            linearized &= ~(1 << entry.id)
+            match = entry.match
+            match.prev.next = match
+            if match.next is not None:
+                match.next.prev = match
+            entry.prev.next = entry
+            entry.next.prev = entry
+            entry = entry.next
+    return LINEARIZABLE
+
+
+def _prefix(ops, cut) -> list[dict]:
+    """
+    :return: The history as it was at time cut: operations returned by
+             then are complete, writes still running are open and reads
+             still running are dropped.
+    """
+    prefix = []
+    for op in ops:
+        if op["call"] > cut:
+            continue
+        if op["return"] <= cut:
+            prefix.append(op)
+        elif op["op"] in WRITES:
+            prefix.append({**op, "return": math.inf})
+    return prefix
+
+
+def _removable(kept, removed) -> bool:
+    """
+    Removing reads never turns a linearizable history into a failing one,
+    and neither does removing a write whose value no remaining read
+    returned. Other writes could be what a failing read was missing.
+    """
+    read = {repr(op["value"]) for op in kept if op["op"] in READS}
+    return all(op["op"] in READS or repr(op["value"]) not in read
+               for op in removed)
+
+
+def counterexample(ops, timeout=PARTITION_TIMEOUT) -> list[dict]:
+    """
+    Shrinks a non-linearizable history of one key: binary search of the
+    shortest failing prefix, then delta debugging of the operations the
+    failure does not need (see _removable), until removing any other
+    chunk makes it pass.
+
+    :param ops: Normalized, non-linearizable operations of one key.
+    :type ops: list[dict]
+    :rtype: list[dict]
+    """
+    deadline = time.monotonic() + timeout
+
+    def fails(candidate):
+        return check_register(candidate,
+                              deadline - time.monotonic()) == VIOLATION
+
+    returns = sorted({op["return"] for op in ops if op["return"] != math.inf})
+    low, high = 0, len(returns) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if fails(_prefix(ops, returns[middle])):
+            high = middle
+        else:
+            low = middle + 1
+    failing = _prefix(ops, returns[low]) if returns else list(ops)
+
+    chunks = 2
+    while len(failing) > 1 and time.monotonic() < deadline:
+        size = math.ceil(len(failing) / chunks)
+        for start in range(0, len(failing), size):
+            removed = failing[start:start + size]
+            kept = failing[:start] + failing[start + size:]
+            if _removable(kept, removed) and fails(kept):
+                failing = kept
+                chunks = max(chunks - 1, 2)
+                break
+        else:
+            if chunks >= len(failing):
+                break
+            chunks = min(chunks * 2, len(failing))
+    return sorted(failing, key=lambda op: op["call"])
+
+
+def _check_partitions(partitions, timeout) -> list[tuple]:
+    """
+    Checks a batch of partitions in a worker process.
+
+    :return: (key, verdict, counterexample or None) of every partition.
+    """
+    outcomes = []
+    for key, ops in partitions:
+        verdict = check_register(ops, timeout)
+        example = None
+        if verdict == VIOLATION:
+            example = counterexample(ops, timeout)
+        outcomes.append((key, verdict, example))
+    return outcomes
+
+
+def partition(ops) -> dict[str, list[dict]]:
+    by_key = {}
+    for op in ops:
+        by_key.setdefault(op["key"], []).append(op)
+    return by_key
+
+
+def check(history, timeout=PARTITION_TIMEOUT, workers=None) -> dict[str]:
+    """
+    Checks a key-value history, one partition per key, in parallel.
+
+    :param history: Operations, see the module docstring.
+    :type history: Iterable[dict]
+    :param timeout: Seconds the search of one partition may take.
+    :type timeout: float
+    :param workers: Worker processes, all CPUs by default; 1 checks in
+                    this process.
+    :type workers: int | None
+    :return: "linearizable" (True, False, or None when some partition timed
+             out and none failed), the number of operations and keys,
+             "violations" (key mapped to its counterexample), "timeouts"
+             (keys) and "duration" in seconds.
+    :rtype: dict[str...]
+    """
+    start = time.monotonic()
+    ops = normalize(history)
+    partitions = sorted(partition(ops).items(),
+                        key=lambda item: len(item[1]), reverse=True)
+
+    # largest partitions first, small ones batched
+    tasks = []
+    batch, size = [], 0
+    for key, key_ops in partitions:
+        batch.append((key, key_ops))
+        size += len(key_ops)
+        if size >= TASK_OPERATIONS:
+            tasks.append(batch)
+            batch, size = [], 0
+    if batch:
+        tasks.append(batch)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        outcomes = [o for task in tasks
+                    for o in _check_partitions(task, timeout)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 mp_context=context) as pool:
+            futures = [pool.submit(_check_partitions, task, timeout)
+                       for task in tasks]
+            outcomes = [o for future in futures for o in future.result()]
+
+    violations = {key: example for key, verdict, example in outcomes
+                  if verdict == VIOLATION}
+    timeouts = [key for key, verdict, _ in outcomes if verdict == TIMEOUT]
+    return {
+        "linearizable": (False if violations else
+                         None if timeouts else True),
+        "operations": len(ops),
+        "keys": len(partitions),
+        "violations": violations,
+        "timeouts": timeouts,
+        "duration": time.monotonic() - start,
+    }
+
+
+def print_report(report) -> None:
+    verdict = {True: "linearizable", False: "NOT linearizable",
+               None: "unknown (timeouts)"}[report["linearizable"]]
+    print(f"{report['operations']} operations on {report['keys']} keys "
+          f"checked in {report['duration']:.1f}s: {verdict}")
+    if report["timeouts"]:
+        print(f"Timed out: {', '.join(map(str, report['timeouts'][:10]))}"
+              + (" ..." if len(report["timeouts"]) > 10 else ""))
+    for key, example in report["violations"].items():
+        print(f"Counterexample on key {key}:")
+        for op in example:
+            ret = "..." if op["return"] == math.inf else op["return"]
+            print(f"  client {op.get('client', '?')}: {op['op']} "
+                  f"{op['value']!r} [{op['call']}, {ret}]")
+
+
+def load_history(path) -> list[dict]:
+    """
+    :param path: JSON lines file, one operation per line.
+    :type path: str | Path
+    :rtype: list[dict]
+    """
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv) -> None:
+    parser = argparse.ArgumentParser(
+        description="Check a recorded history for linearizability.")
+    parser.add_argument("history", help="JSON lines file of operations")
+    parser.add_argument("--timeout", type=float, default=PARTITION_TIMEOUT,
+                        help="seconds per key partition")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes (default: all CPUs)")
+    args = parser.parse_args(argv[1:])
+    report = check(load_history(args.history), args.timeout, args.workers)
+    print_report(report)
+    sys.exit(0 if report["linearizable"] else 1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,935 @@
+"""
+Native open-loop load generator.
+
+Drives a system under test through its HTTP interface with asyncio and
+keep-alive connections, as an alternative to the closed-loop YCSB client.
+Requests are issued on a fixed schedule at a target rate, independently of
+how fast the replicas answer, so queueing delay is not hidden by
+coordinated omission.
+
+Workloads of the library in src/utils/workloads.py replay their
+precomputed stream of operations, keys and value sizes instead of
+sampling the YCSB properties.
+
+Two latencies are recorded per operation, following YCSB's naming:
+- service time (``READ``, ``UPDATE``...), measured from the moment the
+  request is written on a connection until the response is read.
+- response time (``Intended-READ``, ``Intended-UPDATE``...), measured from
+  the moment the request was scheduled to be sent.
+"""
+import asyncio
+import base64
+import collections
+import itertools
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from src.utils import history
+from src.utils import workloads
+from src.utils.histogram import Histogram
+from src.utils.ycsb import TimeSeries
+
+READ = "READ"
+UPDATE = "UPDATE"
+INSERT = "INSERT"
+READ_MODIFY_WRITE = "READ-MODIFY-WRITE"
+
+# Time series resolution in seconds
+INTERVAL = 0.1
+# Requests to a crashed or stopped replica fail after this many seconds
+REQUEST_TIMEOUT = 5
+
+
+def load_workload(path) -> dict[str]:
+    """
+    Reads a YCSB workload property file so the native generator runs the
+    same mix as the YCSB client would.
+
+    :param path: Path to the YCSB workload file.
+    :type path: Path
+    :return: Property names mapped to their (string) values.
+    :rtype: dict[str, str]
+    """
+    props = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            props[key.strip()] = value.strip()
+    return props
+
+
+class HttpConnection:
+    """
+    Minimal HTTP/1.1 client connection that is kept alive between requests.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def open(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port)
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, method, path, body=b"", headers=None):
+        """
+        Sends one request and reads the full response.
+
+        :param method: HTTP method.
+        :type method: str
+        :param path: Request path, including the leading slash.
+        :type path: str
+        :param body: Request body.
+        :type body: bytes
+        :param headers: Extra request headers.
+        :type headers: dict[str, str]
+        :return: Status code and response body.
+        :rtype: tuple[int, bytes]
+        """
+        if self.writer is None:
+            await self.open()
+        self.writer.write(self._encode(method, path, body, headers))
+        status, data, keep_alive = await self._read_response()
+        if not keep_alive:
+            self.close()
+        return status, data
+
+    def _encode(self, method, path, body, headers) -> bytes:
+        lines = [f"{method} {path} HTTP/1.1",
+                 f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(body)}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        head = "\r\n".join(lines) + "\r\n\r\n"
+        return head.encode() + body
+
+    async def _read_response(self) -> tuple[int, bytes, bool]:
+        """
+        :return: Status code, body and whether the server keeps the
+                 connection open.
+        """
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split(b" ", 2)[1])
+
+        length = 0
+        chunked = False
+        keep_alive = True
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif name == "connection" and value == "close":
+                keep_alive = False
+
+        if chunked:
+            data = bytearray()
+            while True:
+                line = await self.reader.readuntil(b"\r\n")
+                size = int(line.split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                data += await self.reader.readexactly(size + 2)
+                del data[-2:]
+            data = bytes(data)
+        else:
+            data = await self.reader.readexactly(length)
+        return status, data, keep_alive
+
+
+class PipelinedConnection(HttpConnection):
+    """
+    Keep-alive connection with up to ``window`` requests in flight (HTTP/1.1
+    pipelining): requests are written without waiting for the responses,
+    which come back in order and are handed to their callers by a reader
+    task.
+    """
+
+    def __init__(self, host, port, window):
+        super().__init__(host, port)
+        self.slots = asyncio.Semaphore(window)
+        self.opening = asyncio.Lock()
+        self.waiting = collections.deque()
+        self.reader_task = None
+
+    async def open(self) -> None:
+        await super().open()
+        self.reader_task = asyncio.create_task(self._read_responses())
+
+    def close(self) -> None:
+        super().close()
+        if self.reader_task:
+            self.reader_task.cancel()
+            self.reader_task = None
+        while self.waiting:
+            future = self.waiting.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError("connection closed"))
+
+    async def request(self, method, path, body=b"", headers=None):
+        async with self.slots:
+            async with self.opening:
+                if self.writer is None:
+                    await self.open()
+            future = asyncio.get_running_loop().create_future()
+            self.waiting.append(future)
+            self.writer.write(self._encode(method, path, body, headers))
+            return await future
+
+    async def _read_responses(self) -> None:
+        try:
+            while True:
+                status, data, keep_alive = await self._read_response()
+                future = self.waiting.popleft()
+                # the caller may have given up waiting
+                if not future.done():
+                    future.set_result((status, data))
+                if not keep_alive:
+                    break
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            pass
+        self.reader_task = None
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Pool of keep-alive connections to one replica endpoint. Connections are
+    opened lazily up to ``size``; requests beyond that wait for a free
+    connection, and that wait counts towards their response time.
+    """
+
+    def __init__(self, url, size):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.size = size
+        self.opened = 0
+        self.idle = asyncio.Queue()
+
+    async def acquire(self) -> HttpConnection:
+        if self.idle.empty() and self.opened < self.size:
+            self.opened += 1
+            return HttpConnection(self.host, self.port)
+        return await self.idle.get()
+
+    def release(self, conn, broken=False) -> None:
+        if broken:
+            conn.close()
+        self.idle.put_nowait(conn)
+
+    def close(self) -> None:
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+def paxi_request(op, key, value, seq):
+    """
+    paxi serves ``GET /<key>`` for reads and ``PUT /<key>`` for writes, with
+    integer keys and the raw value as body.
+    """
+    headers = {"Id": "loadgen", "Cid": str(seq)}
+    if op == READ:
+        return "GET", f"/{key}", b"", headers
+    return "PUT", f"/{key}", value, headers
+
+
+def hraftd_request(op, key, value, seq):
+    """
+    hraftd serves ``GET /key/<key>`` for reads and ``POST /key`` with a JSON
+    object of key/value pairs for writes.
+    """
+    if op == READ:
+        return "GET", f"/key/user{key}", b"", None
+    body = json.dumps({f"user{key}": value.decode()}).encode()
+    return "POST", "/key", body, None
+
+
+def etcd_request(op, key, value, seq):
+    """
+    etcd serves the v3 KV API through its gRPC gateway with base64-encoded
+    keys and values.
+    """
+    k = base64.b64encode(f"user{key}".encode()).decode()
+    if op == READ:
+        return "POST", "/v3/kv/range", json.dumps({"key": k}).encode(), None
+    v = base64.b64encode(value).decode()
+    body = json.dumps({"key": k, "value": v}).encode()
+    return "POST", "/v3/kv/put", body, None
+
+
+# YCSB interface name -> request builder
+DRIVERS = {
+    "paxi": paxi_request,
+    "hraftd": hraftd_request,
+    "etcd": etcd_request,
+}
+
+
+def hraftd_batch(ops):
+    """
+    hraftd's ``POST /key`` sets every pair of its JSON object in one Raft
+    entry.
+    """
+    body = json.dumps({f"user{key}": value.decode()
+                       for _, key, value in ops}).encode()
+    return "POST", "/key", body, None
+
+
+def etcd_batch(ops):
+    """
+    An etcd transaction runs reads and writes in one Raft entry; at most
+    --max-txn-ops (128 by default) of them.
+    """
+    requests = []
+    for op, key, value in ops:
+        k = base64.b64encode(f"user{key}".encode()).decode()
+        if op == READ:
+            requests.append({"request_range": {"key": k}})
+        else:
+            requests.append({"request_put": {
+                "key": k, "value": base64.b64encode(value).decode()}})
+    return ("POST", "/v3/kv/txn", json.dumps({"success": requests}).encode(),
+            None)
+
+
+# Interfaces whose writes only the leader accepts, every other node
+# answers them with an error and does not forward them; see
+# LoadGenerator.leader. A client pinned to a follower cannot write.
+LEADER_WRITES = {"hraftd"}
+
+# YCSB interface name -> batch request builder and the operations it batches
+BATCH_DRIVERS = {
+    "hraftd": (hraftd_batch, {UPDATE, INSERT}),
+    "etcd": (etcd_batch, {READ, UPDATE, INSERT}),
+}
+
+
+def paxi_value(body):
+    return body
+
+
+def hraftd_value(body):
+    return next(iter(json.loads(body).values()), "").encode()
+
+
+def etcd_value(body):
+    kvs = json.loads(body).get("kvs")
+    return base64.b64decode(kvs[0].get("value", "")) if kvs else None
+
+
+# YCSB interface name -> value returned by a read, for history recording
+READ_VALUES = {
+    "paxi": paxi_value,
+    "hraftd": hraftd_value,
+    "etcd": etcd_value,
+}
+
+
+class ZipfianGenerator:
+    """
+    Zipfian key chooser over [0, items), using the same algorithm and
+    default constant as YCSB's ZipfianGenerator.
+    """
+
+    def __init__(self, items, theta=0.99):
+        self.items = items
+        self.theta = theta
+        zeta2 = sum(1 / (i ** theta) for i in range(1, 3))
+        self.zetan = sum(1 / (i ** theta) for i in range(1, items + 1))
+        self.alpha = 1 / (1 - theta)
+        self.eta = ((1 - (2 / items) ** (1 - theta))
+                    / (1 - zeta2 / self.zetan))
+
+    def next(self, rng) -> int:
+        u = rng.random()
+        uz = u * self.zetan
+        if uz < 1:
+            return 0
+        if uz < 1 + 0.5 ** self.theta:
+            return 1
+        return int(self.items * (self.eta * u - self.eta + 1) ** self.alpha)
+
+
+class Recorder:
+    """
+    Collects per-operation latency histograms (in microseconds), return
+    codes and a time series of completions per interval.
+
+    :param interval: Time series resolution in seconds.
+    :type interval: float
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.histograms = {}
+        self.returns = {}
+        self.runtime = 0.0
+        self.interval = interval
+        self.start = time.perf_counter()
+        # interval index -> op -> [count, latency sum, max latency, errors]
+        self.intervals = {}
+
+    def record(self, section, latency_us) -> None:
+        if section not in self.histograms:
+            self.histograms[section] = Histogram()
+        self.histograms[section].record(latency_us)
+
+    def count_return(self, op, code) -> None:
+        counts = self.returns.setdefault(op, {})
+        counts[code] = counts.get(code, 0) + 1
+
+    def record_interval(self, op, end, latency_us, ok) -> None:
+        index = int((end - self.start) / self.interval)
+        stats = self.intervals.setdefault(index, {}).setdefault(
+            op, [0, 0.0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += latency_us
+        stats[2] = max(stats[2], latency_us)
+        if not ok:
+            stats[3] += 1
+
+    def timeseries(self) -> TimeSeries:
+        """
+        Completions per interval, in the same point format as the YCSB
+        status lines parsed by ycsb.parse_status_line. Intervals without
+        any completion are included with zero throughput.
+
+        :rtype: TimeSeries
+        """
+        series = TimeSeries()
+        operations = 0
+        last = max(self.intervals, default=-1)
+        for index in range(last + 1):
+            ops = self.intervals.get(index, {})
+            count = sum(stats[0] for stats in ops.values())
+            operations += count
+            point = {
+                "time": round((index + 1) * self.interval, 6),
+                "interval": self.interval,
+                "operations": operations,
+                "ops/sec": count / self.interval,
+            }
+            for op, (n, total, highest, errors) in ops.items():
+                point[op] = {"Count": n, "Avg": total / n, "Max": highest,
+                             "Errors": errors}
+            series.append(point)
+        return series
+
+    def summary(self) -> dict[str]:
+        """
+        Builds a result in the same shape as ``parse_ycsb_output``.
+
+        :rtype: dict[str, dict]
+        """
+        total = sum(sum(c.values()) for c in self.returns.values())
+        result = {
+            "OVERALL": {
+                "RunTime(ms)": int(self.runtime * 1000),
+                "Throughput(ops/sec)": (total / self.runtime
+                                        if self.runtime else 0.0),
+            }
+        }
+        for section, hist in self.histograms.items():
+            stats = hist.summary()
+            op = section.removeprefix("Intended-")
+            if section == op:
+                for code, count in self.returns.get(op, {}).items():
+                    stats[f"Return={code}"] = count
+            result[section] = stats
+        return result
+
+    def encoded_histograms(self) -> dict[str, str]:
+        return {section: hist.encode()
+                for section, hist in self.histograms.items()}
+
+
+class LoadGenerator:
+    """
+    Open-loop load generator for one SUT.
+
+    :param interface: YCSB interface name of the SUT, a key of DRIVERS.
+    :type interface: str
+    :param endpoints: HTTP endpoints of the replicas; requests are spread
+                      round-robin over them, except the writes of
+                      LEADER_WRITES interfaces, which go to the leader.
+    :type endpoints: list[str]
+    :param workload: YCSB workload properties, see load_workload.
+    :type workload: dict[str, str]
+    :param connections: Maximum keep-alive connections per endpoint.
+    :type connections: int
+    :param history: Writer every operation is recorded to, see
+                    src/utils/history.py.
+    :type history: history.HistoryWriter | None
+    :param client: Index of this client among clients, selects the
+                   client's stream of a library workload.
+    :type client: int
+    :param clients: Number of clients running the workload together.
+    :type clients: int
+    :param spread: Number of endpoints, from the first, the requests are
+                   spread over, all of them by default. The leader of
+                   LEADER_WRITES interfaces is looked for among all.
+    :type spread: int | None
+    """
+
+    def __init__(self, interface, endpoints, workload, connections=64,
+                 seed=None, history=None, client=0, clients=1, spread=None):
+        if interface not in DRIVERS:
+            raise ValueError(f"No native driver for interface '{interface}'")
+        self.interface = interface
+        self.build_request = DRIVERS[interface]
+        self.read_value = READ_VALUES[interface]
+        self.history = history
+        self.endpoints = endpoints
+        self.spread = spread or len(endpoints)
+        self.connections = connections
+        # Endpoint index the writes of LEADER_WRITES interfaces go to. A
+        # failed write moves it on to the next endpoint, which finds the
+        # leader, and a new one after a failover, like find_leader in the
+        # SUT's run.py: by writing to each node in turn.
+        self.leader = 0 if interface in LEADER_WRITES else None
+        self.rng = random.Random(seed)
+
+        self.record_count = int(workload.get("recordcount", 1000))
+        self.operation_count = int(workload.get("operationcount", 1000))
+        # Keys inserted by the load phase, YCSB's insertstart/insertcount
+        self.insert_start = int(workload.get("insertstart", 0))
+        self.insert_count = int(workload.get("insertcount",
+                                             self.record_count
+                                             - self.insert_start))
+        self.read_proportion = float(workload.get("readproportion", 0.95))
+        self.field_length = int(workload.get("fieldlength", 100))
+        if workload.get("requestdistribution", "uniform") == "zipfian":
+            self.keys = ZipfianGenerator(self.record_count)
+        else:
+            self.keys = None
+
+        self.spec = None
+        self.stream = None
+        if workloads.SPEC_PROPERTY in workload:
+            self.spec = json.loads(workload[workloads.SPEC_PROPERTY])
+            self.spec["operationcount"] = self.operation_count
+            if self.spec["mix"].get("scan"):
+                raise ValueError("The native drivers have no scan operation")
+            self.stream = workloads.stream(self.spec, client, clients)
+        self.client = client
+
+        self.pools = []
+        # Pipelined connections by replica, and the slot of each, see
+        # _leader_target
+        self.targets = []
+        self.slots = {}
+        self.seq = 0
+
+    def next_key(self) -> int:
+        if self.keys:
+            return self.keys.next(self.rng)
+        return self.rng.randrange(self.record_count)
+
+    def next_value(self, size=None) -> bytes:
+        size = size or self.field_length
+        return self.rng.randbytes((size + 1) // 2).hex()[:size].encode()
+
+    async def execute(self, op, key, recorder, intended=None,
+                      size=None, target=None) -> None:
+        """
+        Sends one operation to the next endpoint, or to target, and
+        records its latency. A read-modify-write is a read then, if it
+        succeeded, an update of the same key: both are recorded in their
+        own sections and the whole under READ-MODIFY-WRITE, as YCSB does.
+        """
+        if op == READ_MODIFY_WRITE:
+            code, start, end = await self._send(READ, key, size, target)
+            recorder.record(READ, (end - start) * 1e6)
+            if code == "OK":
+                code, update_start, end = await self._send(UPDATE, key, size,
+                                                           target)
+                recorder.record(UPDATE, (end - update_start) * 1e6)
+        else:
+            code, start, end = await self._send(op, key, size, target)
+
+        latency = (end - start) * 1e6
+        recorder.count_return(op, code)
+        recorder.record(op, latency)
+        if intended is not None:
+            latency = (end - intended) * 1e6
+            recorder.record(f"Intended-{op}", latency)
+        recorder.record_interval(op, end, latency, code == "OK")
+
+    async def execute_batch(self, unit, recorder, target) -> None:
+        """
+        Sends the operations of unit the driver can batch, each key once,
+        as one request and the others one by one, all on target.
+
+        :param unit: (operation, key, value size) of every operation.
+        :type unit: list[tuple[str, int, int | None]]
+        :param target: Replica index and pipelined connection.
+        :type target: tuple[int, PipelinedConnection]
+        """
+        build_batch, batchable = BATCH_DRIVERS[self.interface]
+        batched, single, keys = [], [], set()
+        for op, key, size in unit:
+            if op in batchable and key not in keys:
+                keys.add(key)
+                batched.append((op, key, size))
+            else:
+                single.append((op, key, size))
+        if len(batched) == 1:
+            single += batched
+            batched = []
+        requests = [self.execute(op, key, recorder, size=size, target=target)
+                    for op, key, size in single]
+        if batched:
+            if any(self._to_leader(op) for op, _, _ in batched):
+                target = self._leader_target(target)
+            requests.append(self._execute_batched(build_batch(
+                [(op, key, self.next_value(size) if op != READ else b"")
+                 for op, key, size in batched]), batched, recorder, target))
+        await asyncio.gather(*requests)
+
+    async def _execute_batched(self, request, batched, recorder,
+                               target) -> None:
+        replica, conn = target
+        start = time.perf_counter()
+        try:
+            status, _ = await asyncio.wait_for(conn.request(*request),
+                                               REQUEST_TIMEOUT)
+            code = "OK" if 200 <= status < 300 else "ERROR"
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ValueError):
+            code = "ERROR"
+            conn.close()
+        end = time.perf_counter()
+        if code != "OK":
+            self._failed_on(replica)
+        latency = (end - start) * 1e6
+        for op, _, _ in batched:
+            recorder.count_return(op, code)
+            recorder.record(op, latency)
+            recorder.record_interval(op, end, latency, code == "OK")
+
+    async def _send(self, op, key, size=None,
+                    target=None) -> tuple[str, float, float]:
+        """
+        :param target: Replica index and connection to use instead of the
+                       next endpoint's pool.
+        :type target: tuple[int, HttpConnection] | None
+        :return: Return code, start and end time of one request.
+        """
+        self.seq += 1
+        value = self.next_value(size) if op != READ else b""
+        method, path, body, headers = self.build_request(op, key, value,
+                                                         self.seq)
+        if target is None:
+            replica = (self.leader if self._to_leader(op)
+                       else self.seq % self.spread)
+            pool = self.pools[replica]
+            conn = await pool.acquire()
+        else:
+            if self._to_leader(op):
+                target = self._leader_target(target)
+            replica, conn = target
+        start = time.perf_counter()
+        broken = False
+        data = b""
+        try:
+            status, data = await asyncio.wait_for(
+                conn.request(method, path, body, headers), REQUEST_TIMEOUT)
+            code = "OK" if 200 <= status < 300 else "ERROR"
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ValueError):
+            code = "ERROR"
+            broken = True
+        end = time.perf_counter()
+        if target is None:
+            pool.release(conn, broken)
+        elif broken:
+            conn.close()
+        if code != "OK" and self._to_leader(op):
+            self._failed_on(replica)
+        if self.history is not None:
+            self._record(op, code, key, value, data, start, end, replica)
+        return code, start, end
+
+    def _to_leader(self, op) -> bool:
+        return self.leader is not None and op != READ
+
+    def _failed_on(self, replica) -> None:
+        """
+        Moves the writes on to the next endpoint after one failed on the
+        presumed leader; failures of writes already sent to an old leader
+        leave the new one alone.
+        """
+        if self.leader == replica:
+            self.leader = (replica + 1) % len(self.endpoints)
+
+    def _leader_target(self, target) -> tuple[int, "PipelinedConnection"]:
+        """
+        :return: The pipelined connection to the leader in the slot of
+                 target, target itself outside run_pipelined.
+        """
+        if self.leader is None or not self.targets:
+            return target
+        return self.targets[self.leader][self.slots[target[1]]]
+
+    def _record(self, op, code, key, value, data, start, end, replica):
+        status = code
+        if op == READ:
+            value = b""
+            if code == "OK":
+                try:
+                    value = self.read_value(data)
+                except (ValueError, AttributeError, IndexError):
+                    status = "ERROR"
+            if status == "OK" and not value:
+                status = "NOT_FOUND"
+        self.history.append(op, status, key, history.value_hash(value),
+                            start, end, replica)
+
+    def _open_pools(self) -> None:
+        self.pools = [ConnectionPool(url, self.connections)
+                      for url in self.endpoints]
+
+    def _close_pools(self) -> None:
+        for pool in self.pools:
+            pool.close()
+
+    async def load(self) -> Recorder:
+        """
+        Inserts insertcount keys from insertstart (all recordcount keys by
+        default), closed-loop with one outstanding request per connection.
+
+        :return: Measurements of the load phase.
+        :rtype: Recorder
+        """
+        self._open_pools()
+        recorder = Recorder()
+        keys = iter(range(self.insert_start,
+                          self.insert_start + self.insert_count))
+        sizes = None
+        if self.spec is not None:
+            import numpy as np
+            rng = np.random.default_rng([self.spec["seed"], self.client, 1])
+            sizes = workloads.sample_sizes(rng, self.spec["values"],
+                                           self.insert_count).tolist()
+
+        async def worker():
+            for key in keys:
+                size = sizes[key - self.insert_start] if sizes else None
+                await self.execute(INSERT, key, recorder, size=size)
+
+        start = recorder.start = time.perf_counter()
+        workers = self.connections * len(self.pools)
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        recorder.runtime = time.perf_counter() - start
+        self._close_pools()
+        return recorder
+
+    async def run(self, rate, duration=None, recorder=None) -> Recorder:
+        """
+        Issues operations open-loop at a fixed target rate. Each request is
+        sent at its scheduled time regardless of outstanding requests.
+
+        :param rate: Target throughput in operations per second.
+        :type rate: float
+        :param duration: Run length in seconds; defaults to
+                         operationcount / rate.
+        :type duration: float
+        :param recorder: Recorder to fill, e.g. one watched by the metrics
+                         endpoint while the run progresses.
+        :type recorder: Recorder | None
+        :return: Measurements of the run.
+        :rtype: Recorder
+        """
+        self._open_pools()
+        recorder = recorder or Recorder()
+        total = (int(duration * rate) if duration
+                 else self.operation_count)
+        if self.stream is not None:
+            total = min(total, len(self.stream))
+            ops = [workloads.OPERATIONS[op]
+                   for op in self.stream["op"][:total].tolist()]
+            keys = self.stream["key"][:total].tolist()
+            sizes = self.stream["size"][:total].tolist()
+        interval = 1 / rate
+        pending = set()
+
+        start = recorder.start = time.perf_counter()
+        for i in range(total):
+            intended = start + i * interval
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.stream is not None:
+                task = asyncio.create_task(self.execute(
+                    ops[i], keys[i], recorder, intended, sizes[i]))
+            else:
+                op = (READ if self.rng.random() < self.read_proportion
+                      else UPDATE)
+                task = asyncio.create_task(
+                    self.execute(op, self.next_key(), recorder, intended))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+        recorder.runtime = time.perf_counter() - start
+        self._close_pools()
+        return recorder
+
+    def _operations(self, total):
+        """
+        :return: (operation, key, value size) of the next total operations,
+                 from the workload's stream or sampled like run does.
+        :rtype: Iterator[tuple[str, int, int | None]]
+        """
+        if self.stream is not None:
+            total = min(total, len(self.stream))
+            yield from zip((workloads.OPERATIONS[op] for op
+                            in self.stream["op"][:total].tolist()),
+                           self.stream["key"][:total].tolist(),
+                           self.stream["size"][:total].tolist())
+            return
+        for _ in range(total):
+            op = READ if self.rng.random() < self.read_proportion else UPDATE
+            yield op, self.next_key(), None
+
+    async def run_pipelined(self, window, batch=1, connections=1,
+                            recorder=None) -> Recorder:
+        """
+        Issues operationcount operations closed-loop as fast as the SUT
+        answers: every connection keeps window requests in flight, each
+        carrying up to batch operations when the driver can batch them
+        (see BATCH_DRIVERS). Latencies are service times, the requests
+        queued behind others on their connection included.
+        Writes of LEADER_WRITES interfaces use the leader's connection in
+        the same slot.
+
+        :param window: Requests in flight per connection.
+        :type window: int
+        :param batch: Operations per request.
+        :type batch: int
+        :param connections: Pipelined connections per endpoint.
+        :type connections: int
+        :param recorder: Recorder to fill.
+        :type recorder: Recorder | None
+        :return: Measurements of the run.
+        :rtype: Recorder
+        :raises ValueError: If batch > 1 and the driver cannot batch, or
+                            with history recording, whose read values are
+                            not decoded from batches.
+        """
+        if batch > 1 and self.interface not in BATCH_DRIVERS:
+            raise ValueError(f"No batched requests for interface "
+                             f"'{self.interface}'")
+        if batch > 1 and self.history is not None:
+            raise ValueError("Histories cannot be recorded with batching")
+        recorder = recorder or Recorder()
+        self.targets = []
+        for replica, url in enumerate(self.endpoints):
+            parts = urlsplit(url if "://" in url else f"http://{url}")
+            self.targets.append([(replica, PipelinedConnection(
+                parts.hostname, parts.port or 80, window))
+                for _ in range(connections)])
+        self.slots = {conn: slot for replica in self.targets
+                      for slot, (_, conn) in enumerate(replica)}
+        targets = [target for replica in self.targets[:self.spread]
+                   for target in replica]
+        operations = self._operations(self.operation_count)
+
+        async def worker(target):
+            while unit := list(itertools.islice(operations, batch)):
+                if batch == 1:
+                    op, key, size = unit[0]
+                    await self.execute(op, key, recorder, size=size,
+                                       target=target)
+                else:
+                    await self.execute_batch(unit, recorder, target)
+
+        start = recorder.start = time.perf_counter()
+        await asyncio.gather(*(worker(target) for target in targets
+                               for _ in range(window)))
+        recorder.runtime = time.perf_counter() - start
+        for replica in self.targets:
+            for _, conn in replica:
+                conn.close()
+        self.targets = []
+        self.slots = {}
+        return recorder
+
+
+def run_native(interface, endpoints, workload_path, rate, phase="run",
+               connections=64, recorder=None, properties=None,
+               history_path=None, client=0, clients=1, pipeline=None,
+               spread=None):
+    """
+    Runs one phase of a YCSB workload file with the native generator.
+
+    :param interface: YCSB interface name of the SUT.
+    :type interface: str
+    :param endpoints: HTTP endpoints of the replicas.
+    :type endpoints: list[str]
+    :param workload_path: Path to the YCSB workload file.
+    :type workload_path: Path
+    :param rate: Target rate in ops/sec for the run phase.
+    :type rate: float
+    :param phase: Either "load" or "run".
+    :type phase: str
+    :param recorder: Recorder filled by the run phase.
+    :type recorder: Recorder | None
+    :param properties: Overrides of the workload file's properties.
+    :type properties: dict[str, str] | None
+    :param history_path: File every operation is recorded to.
+    :type history_path: Path | None
+    :param client: Client id stored in the history.
+    :type client: int
+    :param clients: Number of clients running the workload together.
+    :type clients: int
+    :param pipeline: Run closed-loop with window, batch and connections
+                     instead of at rate, see LoadGenerator.run_pipelined.
+    :type pipeline: dict[str, int] | None
+    :param spread: Number of endpoints the requests are spread over, see
+                   LoadGenerator.
+    :type spread: int | None
+    :return: Result in the same shape as parse_ycsb_output, the encoded
+             latency histogram of every section and the time series.
+    :rtype: tuple[dict[str, dict], dict[str, str], list[dict]]
+    """
+    workload = {**load_workload(workload_path), **(properties or {})}
+    writer = None
+    if history_path is not None:
+        writer = history.HistoryWriter(history_path, client)
+    generator = LoadGenerator(interface, endpoints, workload, connections,
+                              history=writer, client=client, clients=clients,
+                              spread=spread)
+    try:
+        if phase == "load":
+            recorder = asyncio.run(generator.load())
+        elif pipeline:
+            recorder = asyncio.run(generator.run_pipelined(
+                **pipeline, recorder=recorder))
+        else:
+            recorder = asyncio.run(generator.run(rate, recorder=recorder))
+    finally:
+        if writer is not None:
+            writer.close()
+    return (recorder.summary(), recorder.encoded_histograms(),
+            recorder.timeseries().to_list())
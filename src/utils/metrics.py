@@ -0,0 +1,317 @@
+"""
+Live Prometheus metrics of the benchmark in progress.
+
+With --metrics-port, main.py serves /metrics in the Prometheus text format
+for the whole session. Every run publishes a RunMetrics, which reads its
+sources only when scraped, so the load generators do no extra work:
+- YCSB: status lines (ops/sec, per operation counts and -FAILED counts)
+  and the HdrHistogram interval logs YCSB appends to every second.
+- native engine: the live Recorder of loadgen.
+- replica resources from the ResourceSampler and fault events from the
+  FaultInjector, when the run has them.
+
+Every series is labelled with project, protocol, workload and engine.
+Latencies are exported in seconds as Prometheus histograms, with a
+"latency" label telling service times from response times (Intended-*).
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from src.utils import histogram
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+PREFIX = "distrobench"
+# Histogram bucket upper bounds in microseconds
+LATENCY_BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000,
+                      100000, 250000, 500000, 1000000, 2500000, 5000000)
+# Window over which the native engine's live throughput is averaged
+RATE_WINDOW = 1.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Run exported by the endpoint, see publish
+current = None
+_server = None
+
+
+def _escape(value) -> str:
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + pairs + "}"
+
+
+class _Exposition:
+    """
+    Builds a metrics page, one HELP/TYPE header per metric family.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.lines = []
+        self.declared = set()
+
+    def add(self, name, metric_type, help_text, value, suffix="",
+            **labels) -> None:
+        name = f"{PREFIX}_{name}"
+        if name not in self.declared:
+            self.declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {metric_type}")
+        self.lines.append(f"{name}{suffix}{_labels({**self.labels, **labels})}"
+                          f" {value}")
+
+    def add_histogram(self, name, help_text, hist, **labels) -> None:
+        counts = hist.cumulative_counts(LATENCY_BUCKETS_US)
+        for bound, count in zip(LATENCY_BUCKETS_US, counts):
+            self.add(name, "histogram", help_text, count, "_bucket",
+                     **labels, le=f"{bound / 1e6:g}")
+        self.add(name, "histogram", help_text, hist.total, "_bucket",
+                 **labels, le="+Inf")
+        self.add(name, "histogram", help_text,
+                 f"{hist.mean() * hist.total / 1e6:.6f}", "_sum", **labels)
+        self.add(name, "histogram", help_text, hist.total, "_count", **labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class RunMetrics:
+    """
+    Live view of one run.
+
+    :param labels: Labels of every series, e.g. project, protocol,
+                   workload and engine.
+    :type labels: dict[str, str]
+    :param sampler: Resource sampler of the run.
+    :type sampler: resources.ResourceSampler | None
+    :param injector: Fault injector of the run.
+    :type injector: faults.FaultInjector | None
+    """
+
+    def __init__(self, labels, sampler=None, injector=None):
+        self.labels = labels
+        self.sampler = sampler
+        self.injector = injector
+        self.recorder = None
+        self.log_dirs = []
+        self.active = True
+        # Last ops/sec reported by every YCSB client
+        self.throughputs = {}
+        self.operations = {}
+        self.errors = {}
+        self.histograms = {}
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+    def observe_status(self, point, client=0) -> None:
+        """
+        Accounts a YCSB status line, see ycsb.parse_status_line. Per
+        operation counts in status lines cover the last interval only.
+
+        :param point: Parsed status line.
+        :type point: dict[str...]
+        :param client: Index of the YCSB client that printed it.
+        :type client: int
+        """
+        with self._lock:
+            self.throughputs[client] = point["ops/sec"]
+            for section, stats in point.items():
+                if not isinstance(stats, dict) or "Count" not in stats:
+                    continue
+                if section.startswith("Intended-"):
+                    continue
+                if section.endswith("-FAILED"):
+                    op = section.removesuffix("-FAILED")
+                    self.errors[op] = self.errors.get(op, 0) + stats["Count"]
+                else:
+                    self.operations[section] = (
+                        self.operations.get(section, 0) + stats["Count"])
+
+    def finish(self) -> None:
+        """
+        Marks the run phase as over; the last histogram log intervals are
+        read while they still exist.
+        """
+        with self._lock:
+            self._follow_logs()
+            self.log_dirs = []
+            self.active = False
+            self.throughputs = {}
+
+    def _follow_logs(self) -> None:
+        """
+        Merges the intervals YCSB appended to its histogram logs since the
+        last scrape, across all clients. Only complete lines are consumed.
+        """
+        paths = [path for log_dir in self.log_dirs
+                 for path in sorted(Path(log_dir).glob("*.hdr"))]
+        for path in paths:
+            offset = self._offsets.get(path, 0)
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read()
+            except OSError:
+                continue
+            end = data.rfind(b"\n") + 1
+            self._offsets[path] = offset + end
+            for line in data[:end].decode().splitlines():
+                encoded = histogram.parse_log_line(line)
+                if encoded is None:
+                    continue
+                hist = histogram.Histogram.decode(encoded)
+                if path.stem in self.histograms:
+                    self.histograms[path.stem].merge(hist)
+                else:
+                    self.histograms[path.stem] = hist
+
+    def _native(self):
+        """
+        :return: Throughput over the last RATE_WINDOW, and operations and
+                 errors per operation from the live Recorder.
+        """
+        recorder = self.recorder
+        now = int((time.perf_counter() - recorder.start) / recorder.interval)
+        window = max(1, round(RATE_WINDOW / recorder.interval))
+        completed = 0
+        for index in range(now - window, now):
+            ops = recorder.intervals.get(index, {})
+            completed += sum(stats[0] for stats in list(ops.values()))
+        throughput = completed / (window * recorder.interval)
+
+        operations, errors = {}, {}
+        for op, codes in list(recorder.returns.items()):
+            codes = dict(codes)
+            operations[op] = sum(codes.values())
+            errors[op] = operations[op] - codes.get("OK", 0)
+        return throughput, operations, errors
+
+    def render(self) -> str:
+        """
+        :return: The metrics page in the Prometheus text format.
+        :rtype: str
+        """
+        page = _Exposition(self.labels)
+        with self._lock:
+            if self.recorder is not None:
+                throughput, operations, errors = self._native()
+                if not self.active:
+                    throughput = 0.0
+                hists = dict(self.recorder.histograms)
+            else:
+                self._follow_logs()
+                throughput = sum(self.throughputs.values())
+                operations = dict(self.operations)
+                errors = dict(self.errors)
+                hists = dict(self.histograms)
+
+        page.add("run_active", "gauge",
+                 "1 while the run phase is in progress.", int(self.active))
+        page.add("throughput_ops_per_second", "gauge",
+                 "Operations completed per second, last interval.",
+                 f"{throughput:.3f}")
+        for op, count in sorted(operations.items()):
+            page.add("operations_total", "counter",
+                     "Operations completed.", count, op=op)
+        for op, count in sorted(errors.items()):
+            page.add("errors_total", "counter",
+                     "Operations that failed.", count, op=op)
+        for section, hist in sorted(hists.items()):
+            op = section.removeprefix("Intended-")
+            page.add_histogram(
+                "latency_seconds", "Operation latency, service time or "
+                "response time from the intended start.", hist, op=op,
+                latency="service" if op == section else "response")
+
+        if self.sampler is not None:
+            self._render_resources(page)
+        if self.injector is not None:
+            for event in list(self.injector.events):
+                page.add("fault_event_timestamp_seconds", "gauge",
+                         "Wall-clock time of a fault injection event.",
+                         f"{event['wall']:.3f}", event=event["event"],
+                         node=event["node"] or "")
+        return page.text()
+
+    def _render_resources(self, page) -> None:
+        for replica, series in sorted(list(self.sampler.series.items())):
+            if not series:
+                continue
+            last = series[-1]
+            page.add("replica_cpu_cores", "gauge",
+                     "CPU used by a replica, in cores.",
+                     f"{last['cpu']:.3f}", replica=replica)
+            page.add("replica_rss_bytes", "gauge",
+                     "Resident set size of a replica.", last["rss"],
+                     replica=replica)
+            page.add("replica_threads", "gauge",
+                     "Threads of a replica.", last["threads"],
+                     replica=replica)
+            for direction in ("read", "write"):
+                page.add("replica_disk_bytes_per_second", "gauge",
+                         "Disk I/O of a replica.",
+                         f"{last[f'{direction}_bps']:.1f}",
+                         replica=replica, direction=direction)
+            for kind, key in (("voluntary", "vcsw/s"),
+                              ("involuntary", "nvcsw/s")):
+                page.add("replica_context_switches_per_second", "gauge",
+                         "Context switches of a replica.", f"{last[key]:.1f}",
+                         replica=replica, kind=kind)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = (current.render() if current else "").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # scrapes would interleave with the benchmark output
+        pass
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST) -> ThreadingHTTPServer:
+    """
+    Starts serving /metrics in a background thread, once per process.
+
+    :param port: TCP port, 0 picks a free one.
+    :type port: int
+    :param host: Address to bind.
+    :type host: str
+    :rtype: ThreadingHTTPServer
+    """
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on "
+              f"http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def publish(run) -> None:
+    """
+    Makes run the one exported by the endpoint. The previous run stays
+    exported until the next one is published.
+
+    :param run: Metrics of the run that starts.
+    :type run: RunMetrics
+    """
+    global current
+    current = run
@@ -0,0 +1,444 @@
+"""
+Userspace network emulation between replicas: per-link delay, jitter,
+bandwidth and partitions, without root or tc.
+
+Every replica gets an ingress proxy on loopback, at its real peer port
+plus PORT_OFFSET, so a restarted replica or restored snapshot that
+remembers the routed addresses finds the proxies again. The peer
+addresses the replicas advertise to each other are rewritten to the
+proxies (see PEER_ADDRESSES below), while every replica still listens on
+its real address, so all replica-to-replica traffic goes through the
+proxy of the receiving node. Client traffic is not touched.
+
+An accepted connection is attributed to its sending node through
+/proc/net/tcp: the inode of the connecting socket is looked up among the
+file descriptors of the replicas' pids. Bytes from the sender are then
+shaped by the link sender -> receiver and the replies by the link
+receiver -> sender. Connections from an unknown process use the default
+link and are never partitioned.
+
+Shaping keeps the byte stream in order: a chunk leaves the proxy once the
+link had the bandwidth to carry it and its delay (plus a uniform jitter of
++/- jitter_ms) has passed, never before the chunk ahead of it. The queue of
+a connection is bounded, so a slow link pushes back on the sender through
+TCP flow control. Links without impairment forward chunks as they arrive.
+
+A partition closes every connection between nodes of different groups
+and refuses new ones until it heals, as a broken network would after the
+replicas' timeouts; nodes in no group are cut off from all others.
+
+Topology files are TOML::
+
+    [zones]
+    "1" = ["1.1", "1.2", "1.3"]
+    "2" = ["2.1", "2.2"]
+
+    [default]                       # every link not listed below
+    delay_ms = 0.1
+
+    [[link]]
+    between = ["1", "2"]            # both directions, or from/to for one
+    delay_ms = 40
+    jitter_ms = 5
+    bandwidth_mbps = 100
+
+    [[partition]]
+    at = 10                         # seconds into the run phase
+    heal_after = 5                  # omitted: until the end of the run
+    groups = [["1.1", "1.2", "1.3"], ["2.1", "2.2"]]
+
+from, to and between name zones or nodes; later links override earlier
+ones for the node pairs they cover.
+
+The run.py of a SUT supports network emulation by providing:
+- PEER_ADDRESSES: dict[str, str], node name mapped to the host:port its
+  replica listens on for other replicas
+- peer_routes: dict[str, str], filled by the harness before start with
+  the host:port every node must be reached at by the others
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import tomllib
+
+HOST = "127.0.0.1"
+# A proxy listens at the port of its replica plus this
+PORT_OFFSET = 10000
+CHUNK_SIZE = 65536
+# Chunks a shaped connection holds before it stops reading from the sender
+QUEUE_CHUNKS = 256
+# Name of the sender of connections no replica owns
+UNKNOWN = "?"
+LINK_KEYS = ("delay_ms", "jitter_ms", "bandwidth_mbps")
+
+
+def supports_netem(module) -> bool:
+    return hasattr(module, "PEER_ADDRESSES") and hasattr(module, "peer_routes")
+
+
+def load_topology(topology) -> dict[str]:
+    """
+    :param topology: Path to a topology TOML file, or the parsed topology
+                     (e.g. an inline table of a plan).
+    :type topology: str | Path | dict
+    :return: Topology with zones, default, link and partition filled in.
+    :rtype: dict[str...]
+    :raises ValueError: On unknown keys in a link.
+    """
+    if not isinstance(topology, dict):
+        with open(topology, "rb") as f:
+            topology = tomllib.load(f)
+    topology = {"zones": topology.get("zones", {}),
+                "default": topology.get("default", {}),
+                "link": topology.get("link", []),
+                "partition": topology.get("partition", [])}
+    for link in [topology["default"], *topology["link"]]:
+        unknown = set(link) - {*LINK_KEYS, "from", "to", "between"}
+        if unknown:
+            raise ValueError(f"Unknown link keys: "
+                             f"{', '.join(sorted(unknown))}")
+    return topology
+
+
+class Link:
+    """
+    Impairment of one direction between two nodes.
+    """
+    __slots__ = ("delay", "jitter", "bandwidth")
+
+    def __init__(self, delay_ms=0, jitter_ms=0, bandwidth_mbps=0):
+        self.delay = delay_ms / 1e3
+        self.jitter = jitter_ms / 1e3
+        # bytes per second, 0 for unlimited
+        self.bandwidth = bandwidth_mbps * 1e6 / 8
+
+    def impaired(self) -> bool:
+        return bool(self.delay or self.jitter or self.bandwidth)
+
+    def to_dict(self) -> dict[str, float]:
+        return {"delay_ms": self.delay * 1e3, "jitter_ms": self.jitter * 1e3,
+                "bandwidth_mbps": self.bandwidth * 8 / 1e6}
+
+
+def links(topology, nodes) -> dict[tuple[str, str], Link]:
+    """
+    :param topology: See load_topology.
+    :type topology: dict[str...]
+    :param nodes: Node names of the cluster.
+    :type nodes: Iterable[str]
+    :return: (sender, receiver) mapped to its link, for every ordered pair
+             of nodes.
+    :rtype: dict[tuple[str, str], Link]
+    :raises ValueError: If a link names neither a zone nor a node.
+    """
+    nodes = list(nodes)
+    zones = topology["zones"]
+
+    def members(name):
+        if name in zones:
+            return zones[name]
+        if name in nodes:
+            return [name]
+        raise ValueError(f"'{name}' is neither a zone nor a node")
+
+    default = {k: v for k, v in topology["default"].items() if k in LINK_KEYS}
+    params = {(a, b): default for a in nodes for b in nodes if a != b}
+    for link in topology["link"]:
+        values = {k: v for k, v in link.items() if k in LINK_KEYS}
+        if "between" in link:
+            first, second = link["between"]
+            directions = [(first, second), (second, first)]
+        else:
+            directions = [(link["from"], link["to"])]
+        for source, target in directions:
+            for a in members(source):
+                for b in members(target):
+                    if a != b:
+                        params[(a, b)] = {**params[(a, b)], **values}
+    return {pair: Link(**values) for pair, values in params.items()}
+
+
+def _socket_inode(port, listen_port) -> int | None:
+    """
+    :return: Inode of the loopback socket connected from port to
+             listen_port, None if it is gone.
+    """
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table, "r") as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    local, remote = fields[1], fields[2]
+                    local_port = int(local.rsplit(":", 1)[1], 16)
+                    remote_port = int(remote.rsplit(":", 1)[1], 16)
+                    if local_port == port and remote_port == listen_port:
+                        return int(fields[9])
+        except OSError:
+            continue
+    return None
+
+
+def _owner(inode, pids) -> str | None:
+    """
+    :param pids: Node name mapped to the pid of its replica.
+    :type pids: dict[str, int]
+    :return: Node whose replica holds the socket with the inode.
+    """
+    target = f"socket:[{inode}]"
+    for node, pid in pids.items():
+        fd_dir = f"/proc/{pid}/fd"
+        try:
+            for fd in os.listdir(fd_dir):
+                if os.readlink(f"{fd_dir}/{fd}") == target:
+                    return node
+        except OSError:
+            continue
+    return None
+
+
+class _Connection:
+    """
+    A proxied connection, closed when a partition separates its nodes.
+    """
+
+    def __init__(self, source, target, writers):
+        self.source = source
+        self.target = target
+        self.writers = writers
+
+    def abort(self) -> None:
+        for writer in self.writers:
+            writer.transport.abort()
+
+
+class NetemProxy:
+    """
+    Ingress proxies of one cluster on their own event loop thread.
+
+    :param topology: See load_topology.
+    :type topology: dict[str...]
+    :param addresses: Node name mapped to the host:port its replica
+                      listens on for peers, the run.py's PEER_ADDRESSES.
+    :type addresses: dict[str, str]
+    :param pids: Returns node name mapped to replica pid, to attribute
+                 connections to their sender.
+    :type pids: Callable[[], dict[str, int]] | None
+    """
+
+    def __init__(self, topology, addresses, pids=None):
+        self.topology = topology
+        self.addresses = addresses
+        self.pids = pids or dict
+        self.links = links(topology, addresses)
+        self.default = Link(**{k: v for k, v in topology["default"].items()
+                               if k in LINK_KEYS})
+        self.routes = {}
+        self.blocked = set()
+        self.connections = set()
+        self.events = []
+        self.started = None
+        self.loop = None
+        self.servers = []
+        self.timers = []
+
+    def start(self) -> dict[str, str]:
+        """
+        Starts a proxy per node.
+
+        :return: Node name mapped to the host:port of its proxy, the
+                 run.py's peer_routes.
+        :rtype: dict[str, str]
+        """
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="netem",
+                         daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._listen(), self.loop).result()
+        return dict(self.routes)
+
+    async def _listen(self) -> None:
+        for node in self.addresses:
+            port = int(self.addresses[node].rsplit(":", 1)[1]) + PORT_OFFSET
+            server = await asyncio.start_server(
+                lambda r, w, node=node: self._accept(node, r, w),
+                HOST, port, limit=CHUNK_SIZE, reuse_address=True)
+            self.servers.append(server)
+            self.routes[node] = f"{HOST}:{port}"
+
+    def stop(self) -> None:
+        """
+        Closes every proxy and connection.
+        """
+        if self.loop is None:
+            return
+        self.cancel_schedule()
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+    async def _close(self) -> None:
+        for server in self.servers:
+            server.close()
+        for connection in list(self.connections):
+            connection.abort()
+        self.servers = []
+
+    def start_schedule(self) -> None:
+        """
+        Starts the clock of the topology's partitions, at the start of the
+        run phase.
+        """
+        self.started = time.time()
+        self.events = []
+        for partition in self.topology["partition"]:
+            groups = partition["groups"]
+            self.timers.append(self.loop.call_soon_threadsafe(
+                self._schedule, partition["at"], groups,
+                partition.get("heal_after")))
+
+    def _schedule(self, at, groups, heal_after) -> None:
+        self.timers.append(self.loop.call_later(at, self._partition, groups))
+        if heal_after is not None:
+            self.timers.append(self.loop.call_later(at + heal_after,
+                                                    self._heal))
+
+    def cancel_schedule(self) -> None:
+        """
+        Cancels pending partitions and heals the network.
+        """
+        if self.loop is None:
+            return
+        for timer in self.timers:
+            self.loop.call_soon_threadsafe(timer.cancel)
+        self.timers = []
+        if self.blocked:
+            self.loop.call_soon_threadsafe(self._heal)
+
+    def partition(self, groups) -> None:
+        """
+        :param groups: Lists of node names that can still reach each other.
+        :type groups: list[list[str]]
+        """
+        self.loop.call_soon_threadsafe(self._partition, groups)
+
+    def heal(self) -> None:
+        self.loop.call_soon_threadsafe(self._heal)
+
+    def _partition(self, groups) -> None:
+        group_of = {node: i for i, group in enumerate(groups)
+                    for node in group}
+        self.blocked = {(a, b) for a in self.addresses for b in self.addresses
+                        if a != b and (a not in group_of or b not in group_of
+                                       or group_of[a] != group_of[b])}
+        for connection in list(self.connections):
+            if (connection.source, connection.target) in self.blocked:
+                connection.abort()
+        self._record("partition", groups=groups)
+
+    def _heal(self) -> None:
+        self.blocked = set()
+        self._record("heal")
+
+    def _record(self, event, **extra) -> None:
+        self.events.append({"wall": time.time(), "event": event,
+                            "node": None, **extra})
+        print(f"[netem] {event} {extra.get('groups', '')}".rstrip())
+
+    def _source(self, peer_port, listen_port) -> str:
+        inode = _socket_inode(peer_port, listen_port)
+        if inode is None:
+            return UNKNOWN
+        try:
+            pids = self.pids()
+        except Exception:
+            return UNKNOWN
+        return _owner(inode, pids) or UNKNOWN
+
+    async def _accept(self, target, reader, writer) -> None:
+        listen_port = writer.get_extra_info("sockname")[1]
+        source = self._source(writer.get_extra_info("peername")[1],
+                              listen_port)
+        if (source, target) in self.blocked:
+            writer.transport.abort()
+            return
+        host, port = self.addresses[target].rsplit(":", 1)
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                host, int(port), limit=CHUNK_SIZE)
+        except OSError:
+            writer.transport.abort()
+            return
+        connection = _Connection(source, target, (writer, upstream_writer))
+        self.connections.add(connection)
+        try:
+            await asyncio.gather(
+                self._pipe(reader, upstream_writer,
+                           self.links.get((source, target), self.default)),
+                self._pipe(upstream_reader, writer,
+                           self.links.get((target, source), self.default)))
+        finally:
+            self.connections.discard(connection)
+            connection.abort()
+
+    async def _pipe(self, reader, writer, link) -> None:
+        """
+        Forwards one direction of a connection through a link.
+        """
+        try:
+            if not link.impaired():
+                while data := await reader.read(CHUNK_SIZE):
+                    writer.write(data)
+                    await writer.drain()
+                return
+            queue = asyncio.Queue(QUEUE_CHUNKS)
+            sender = asyncio.ensure_future(self._deliver(queue, writer))
+            try:
+                # time the link is busy transmitting until, and time the
+                # last chunk is due, to keep the stream in order
+                busy = due = 0.0
+                while data := await reader.read(CHUNK_SIZE):
+                    now = self.loop.time()
+                    if link.bandwidth:
+                        busy = max(busy, now) + len(data) / link.bandwidth
+                    else:
+                        busy = now
+                    jitter = random.uniform(-link.jitter, link.jitter)
+                    due = max(due, busy + max(link.delay + jitter, 0.0))
+                    await queue.put((due, data))
+                await queue.put((due, b""))
+                await sender
+            finally:
+                sender.cancel()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if writer.can_write_eof() and not writer.is_closing():
+                try:
+                    writer.write_eof()
+                except OSError:
+                    pass
+
+    async def _deliver(self, queue, writer) -> None:
+        while True:
+            due, data = await queue.get()
+            wait = due - self.loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if not data:
+                return
+            writer.write(data)
+            await writer.drain()
+
+    def to_dict(self) -> dict[str]:
+        """
+        :return: The topology and the resolved link of every node pair, for
+                 the stored config.
+        :rtype: dict[str...]
+        """
+        return {"zones": self.topology["zones"],
+                "partition": self.topology["partition"],
+                "links": {f"{a}->{b}": link.to_dict()
+                          for (a, b), link in self.links.items()
+                          if link.impaired()}}
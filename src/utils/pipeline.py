@@ -0,0 +1,51 @@
+"""
+Window scaling of pipelined and batched clients.
+
+A pipeline run drives the SUT closed-loop with the native generator:
+every connection keeps a window of requests in flight (HTTP/1.1
+pipelining) and every request carries up to batch operations when the
+SUT's API can batch them. Repeating the run with growing windows shows
+whether an implementation turns concurrent requests into batches: its
+throughput keeps growing with the window while latency stays flat,
+whereas one that handles requests one at a time saturates early and
+only queues them, latency growing with the window.
+"""
+WINDOWS = (1, 2, 4, 8, 16, 32, 64)
+BATCH = 1
+CONNECTIONS = 1
+
+
+def analyse(points) -> dict[str]:
+    """
+    :param points: Curve points of every window in order, see
+                   sweep.measure, with their "window".
+    :type points: list[dict]
+    :return: The points with their speedup over the first window, the
+             best point and the overall scaling factor.
+    :rtype: dict[str...]
+    """
+    base = points[0]["throughput"] if points else 0
+    base_p50 = points[0]["p50"] if points else 0
+    for p in points:
+        p["speedup"] = p["throughput"] / base if base else None
+        p["p50_growth"] = p["p50"] / base_p50 if base_p50 else None
+    best = max(points, key=lambda p: p["throughput"], default=None)
+    return {
+        "points": points,
+        "best": best,
+        "scaling": best["speedup"] if best else None,
+    }
+
+
+def print_report(report) -> None:
+    print(f"{'window':>7} {'achieved':>10} {'speedup':>8} {'p50(us)':>9} "
+          f"{'p99(us)':>9} {'errors':>7}")
+    for p in report["points"]:
+        speedup = f"x{p['speedup']:.2f}" if p["speedup"] is not None else "-"
+        print(f"{p['window']:>7} {p['throughput']:>10.0f} {speedup:>8} "
+              f"{p['p50']:>9} {p['p99']:>9} {p['errors']:>7}")
+    best = report["best"]
+    if best:
+        print(f"Best: {best['throughput']:.0f} ops/sec at window "
+              f"{best['window']}, x{report['scaling'] or 0:.2f} over window "
+              f"{report['points'][0]['window']}")
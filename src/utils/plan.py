@@ -0,0 +1,245 @@
+"""
+Run plans for unattended benchmark sweeps.
+
+A plan is a TOML file with defaults at the top level and one [[matrix]]
+table per group of SUTs, e.g.::
+
+    workloads = ["read-heavy", "update-heavy"]
+    engine = "ycsb"
+
+    [[matrix]]
+    sut = "ailidani.paxi"
+    protocols = ["*"]
+    exclude = ["chain", "kpaxos"]
+
+    [[matrix]]
+    sut = "otoolep.hraftd"
+    engine = "native"
+    mode = "sweep"
+    sweep = { slo_us = 5000, growth = 2 }
+
+Every key of DEFAULTS can be set at the top level and in any entry:
+
+- sut, protocols, exclude: SUT directory and protocols, "*" for all
+- workloads: YCSB workload files or src/utils/workloads.py library
+  workloads; the YCSB files when not given
+- replicas: cluster sizes, see src/utils/replicas.py
+- engine, rate: "ycsb" or "native" (src/utils/loadgen.py), target ops/s
+- mode: "single", "sweep" (options in sweep, see src/utils/sweep.py) or
+  "pipeline" (windows and batch in pipeline)
+- fault: e.g. { at = 10, action = "kill", restart_after = 5 }, see
+  src/utils/faults.py
+- steady_state, profile: { min_window = 30 } extends runs until settled
+  (src/utils/steady.py), { at = 10, seconds = 15 } takes CPU profiles
+  (src/utils/profiling.py)
+- sample_hz: resource samples per second, see src/utils/resources.py
+- snapshot: load once and restore later cells, see src/utils/snapshot.py
+- clients, placement: load clients and "pinned" or "spread", see
+  src/utils/fleet.py
+- isolation: e.g. { cgroup = true, memory = "1G" }, see
+  src/utils/isolation.py
+- topology: network topology file, see src/utils/netem.py
+- history: record histories for the checker, see src/utils/history.py
+- trials, cache, baseline, save_baseline: repeated trials compared with
+  a saved baseline, see src/utils/trials.py
+
+Every matrix entry is expanded into cells, one per SUT x protocol x
+workload x cluster size, which main.py runs as start -> load -> run ->
+stop. Single-mode cells whose binaries, configs, workload and settings
+already have enough stored runs are skipped; cache = false runs them
+anyway.
+"""
+from itertools import product
+import tomllib
+
+from src.utils.resources import SAMPLE_HZ
+
+# Keys that can be set at the top level and overridden per [[matrix]] entry
+DEFAULTS = {
+    "sut": "*",
+    "protocols": ["*"],
+    "exclude": [],
+    "workloads": None,
+    "replicas": None,
+    "engine": "ycsb",
+    "rate": None,
+    "mode": "single",
+    "sweep": {},
+    "pipeline": {},
+    "fault": None,
+    "steady_state": None,
+    "profile": None,
+    "sample_hz": SAMPLE_HZ,
+    "snapshot": False,
+    "clients": 1,
+    "placement": "pinned",
+    "isolation": None,
+    "topology": None,
+    "history": False,
+    "trials": 1,
+    "cache": True,
+    "baseline": None,
+    "save_baseline": None,
+}
+
+
+def load_plan(path) -> dict[str]:
+    """
+    :param path: Path to the TOML plan file.
+    :type path: str | Path
+    :rtype: dict[str...]
+    """
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def plan_from_args(args) -> dict[str]:
+    """
+    Builds a single-entry plan from command line arguments.
+
+    :param args: Parsed arguments with sut, protocol, workload, engine, rate.
+    :type args: argparse.Namespace
+    :rtype: dict[str...]
+    """
+    entry = {"sut": args.sut}
+    if args.protocol:
+        entry["protocols"] = args.protocol
+    if args.workload:
+        entry["workloads"] = args.workload
+    if args.replicas:
+        entry["replicas"] = args.replicas
+    if args.engine:
+        entry["engine"] = args.engine
+    if args.rate:
+        entry["rate"] = args.rate
+    if args.sweep:
+        entry["mode"] = "sweep"
+    if args.slo_us:
+        entry["sweep"] = {"slo_us": args.slo_us}
+    if args.windows:
+        entry["mode"] = "pipeline"
+        entry["engine"] = "native"
+        entry["pipeline"] = {"windows": args.windows}
+        if args.batch:
+            entry["pipeline"]["batch"] = args.batch
+        if args.pipeline_connections:
+            entry["pipeline"]["connections"] = args.pipeline_connections
+    if args.clients:
+        entry["clients"] = args.clients
+    if args.placement:
+        entry["placement"] = args.placement
+    if args.snapshot:
+        entry["snapshot"] = True
+    if args.isolate:
+        entry["isolation"] = {"cgroup": args.cgroup}
+        if args.replica_cpus:
+            entry["isolation"]["cpus_per_replica"] = args.replica_cpus
+        if args.client_cpus:
+            entry["isolation"]["client_cpus"] = args.client_cpus
+        if args.memory_limit:
+            entry["isolation"]["memory"] = args.memory_limit
+    if args.topology:
+        entry["topology"] = args.topology
+    if args.history:
+        entry["history"] = True
+    if args.trials:
+        entry["trials"] = args.trials
+    if args.rerun:
+        entry["cache"] = False
+    if args.baseline:
+        entry["baseline"] = args.baseline
+    if args.save_baseline:
+        entry["save_baseline"] = args.save_baseline
+    if args.steady_window:
+        entry["steady_state"] = {"min_window": args.steady_window}
+    if args.profile:
+        entry["profile"] = {}
+        if args.profile_at is not None:
+            entry["profile"]["at"] = args.profile_at
+        if args.profile_seconds:
+            entry["profile"]["seconds"] = args.profile_seconds
+    if args.sample_hz is not None:
+        entry["sample_hz"] = args.sample_hz
+    if args.fault_at is not None:
+        entry["fault"] = {"at": args.fault_at, "action": args.fault_action,
+                          "restart_after": args.restart_after}
+    return {"matrix": [entry]}
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def expand(plan, systems, workloads, implicit=None) -> list[dict]:
+    """
+    Expands a plan into the ordered list of cells to run.
+
+    :param plan: Plan, see load_plan.
+    :type plan: dict[str...]
+    :param systems: SUT directory name mapped to its loaded run.py module.
+    :type systems: dict[str, module]
+    :param workloads: Workloads a plan may name.
+    :type workloads: list[str]
+    :param implicit: Workloads used when the plan names none, all of
+                     workloads by default.
+    :type implicit: list[str] | None
+    :return: Cells {sut, protocol, workload, replicas, engine, rate}.
+    :rtype: list[dict]
+    :raises ValueError: On unknown SUTs, protocols or workloads.
+    """
+    defaults = {k: plan.get(k, v) for k, v in DEFAULTS.items()}
+    cells = []
+    for entry in plan.get("matrix", [{}]):
+        options = {k: entry.get(k, defaults[k]) for k in DEFAULTS}
+
+        suts = _as_list(options["sut"])
+        if "*" in suts:
+            suts = sorted(systems)
+        for sut in suts:
+            if sut not in systems:
+                raise ValueError(f"Unknown SUT '{sut}'")
+
+            available = [p["text"] for p in systems[sut].PROTOCOLS]
+            protocols = _as_list(options["protocols"])
+            if "*" in protocols:
+                protocols = available
+            exclude = set(_as_list(options["exclude"]))
+            for protocol in protocols:
+                if protocol not in available:
+                    raise ValueError(f"Unknown protocol '{protocol}' "
+                                     f"for {sut}")
+                if protocol in exclude:
+                    continue
+
+                for workload, replicas in product(
+                        _as_list(options["workloads"]
+                                 or implicit or workloads),
+                        _as_list(options["replicas"])):
+                    if workload not in workloads:
+                        raise ValueError(f"Unknown workload '{workload}'")
+                    cells.append({
+                        "sut": sut,
+                        "protocol": protocol,
+                        "workload": workload,
+                        "replicas": replicas,
+                        "engine": options["engine"],
+                        "rate": options["rate"],
+                        "mode": options["mode"],
+                        "sweep": options["sweep"],
+                        "pipeline": options["pipeline"],
+                        "fault": options["fault"],
+                        "steady_state": options["steady_state"],
+                        "profile": options["profile"],
+                        "sample_hz": options["sample_hz"],
+                        "snapshot": options["snapshot"],
+                        "clients": options["clients"],
+                        "placement": options["placement"],
+                        "isolation": options["isolation"],
+                        "topology": options["topology"],
+                        "history": options["history"],
+                        "trials": options["trials"],
+                        "cache": options["cache"],
+                        "baseline": options["baseline"],
+                        "save_baseline": options["save_baseline"],
+                    })
+    return cells
@@ -0,0 +1,440 @@
+"""
+CPU profiles of the replicas, taken while a benchmark runs.
+
+A Profiler runs next to the benchmark. At a scheduled time, past the
+warm-up, it profiles every replica for a fixed number of seconds, all at
+once: replicas serving Go's net/http/pprof handlers are asked for a CPU
+profile (/debug/pprof/profile), the others are sampled with perf record
+at PERF_HZ with call graphs, which needs perf on the PATH and a
+perf_event_paranoid setting that lets it attach. Both work on Go and Rust
+binaries alike; pprof is preferred where available because it needs no
+privileges and knows Go's inlined frames.
+
+Every profile is stored as taken (profile.pb.gz or perf.data) next to its
+stacks in folded format, one "root;...;leaf count" line per stack, which
+flamegraph.pl, speedscope or inferno render; flamegraph writes an SVG of
+them as well. summarize tells which functions the replica spends its
+time in, directly (self) and including what they call (total), so the
+benchmark output says whether a protocol is bound by its own code, locks
+(runtime.lock, futex), fsync or the network stack. The profile covers
+the run's steady state if it lies within the window steady.analyse
+finds; the result records whether it did.
+
+The run.py of a SUT supports profiling by providing:
+- pids() -> dict[str, int], node name mapped to its process id
+- PPROF_ENDPOINTS: dict[str, str], node name mapped to the base URL of
+  its pprof handlers, e.g. "http://127.0.0.1:2379/debug/pprof"
+  (optional, nodes without one are profiled with perf)
+"""
+import gzip
+import html
+import shutil
+import subprocess
+import threading
+import time
+import urllib.request
+import zlib
+from pathlib import Path
+
+PROFILE_DIR = Path("profiles.local")
+# Seconds after the start of the run phase, past most warm-ups
+AT = 5.0
+SECONDS = 10.0
+# Functions listed in the summary of every replica
+TOP = 15
+# perf sampling rate, off the timer tick like pprof's 100 Hz
+PERF_HZ = 99
+FOLDED_SUFFIX = ".folded"
+# Frames narrower than this fraction of the total are left out of the SVG
+MIN_FRACTION = 0.001
+
+
+def supports_profiling(module) -> bool:
+    return hasattr(module, "pids")
+
+
+def _varint(buf, i) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buf[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+
+def _fields(buf):
+    """
+    Yields the (field number, wire type, value) of every field of an
+    encoded protobuf message; length-delimited values are memoryviews.
+    """
+    buf = memoryview(buf)
+    i = 0
+    while i < len(buf):
+        key, i = _varint(buf, i)
+        wire = key & 7
+        if wire == 0:
+            value, i = _varint(buf, i)
+        elif wire == 2:
+            size, i = _varint(buf, i)
+            value = buf[i:i + size]
+            i += size
+        elif wire == 1:
+            value, i = buf[i:i + 8], i + 8
+        elif wire == 5:
+            value, i = buf[i:i + 4], i + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire}")
+        yield key >> 3, wire, value
+
+
+def _integers(wire, value) -> list[int]:
+    """
+    :return: The values of a repeated integer field, packed or not.
+    """
+    if wire == 0:
+        return [value]
+    values, i = [], 0
+    while i < len(value):
+        v, i = _varint(value, i)
+        values.append(v)
+    return values
+
+
+def fold_pprof(data) -> dict[str, int]:
+    """
+    Folds a CPU profile in pprof's format (gzipped profile.proto).
+
+    :param data: The profile as served by /debug/pprof/profile.
+    :type data: bytes
+    :return: Folded stack, root first, mapped to its CPU time in
+             nanoseconds (its samples when the profile has no time).
+    :rtype: dict[str, int]
+    """
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    sample_types, samples, locations, functions, strings = [], [], {}, {}, []
+    for field, wire, value in _fields(data):
+        if field == 1:
+            sample_types.append({f: v for f, _, v in _fields(value)})
+        elif field == 2:
+            ids, values = [], []
+            for f, w, v in _fields(value):
+                if f == 1:
+                    ids += _integers(w, v)
+                elif f == 2:
+                    values += _integers(w, v)
+            samples.append((ids, values))
+        elif field == 4:
+            location_id, lines = 0, []
+            for f, _, v in _fields(value):
+                if f == 1:
+                    location_id = v
+                elif f == 4:
+                    lines.append(next((fv for ff, _, fv in _fields(v)
+                                       if ff == 1), 0))
+            locations[location_id] = lines
+        elif field == 5:
+            fields = {f: v for f, _, v in _fields(value)}
+            functions[fields.get(1, 0)] = fields.get(2, 0)
+        elif field == 6:
+            strings.append(bytes(value).decode(errors="replace"))
+
+    units = [strings[t.get(2, 0)] for t in sample_types]
+    index = units.index("nanoseconds") if "nanoseconds" in units else 0
+    folded = {}
+    for ids, values in samples:
+        # leaf first, and the lines of a location innermost first
+        frames = [strings[functions.get(function_id, 0)] or "?"
+                  for location_id in ids
+                  for function_id in locations.get(location_id, [])]
+        stack = ";".join(reversed(frames))
+        if stack and index < len(values):
+            folded[stack] = folded.get(stack, 0) + values[index]
+    return folded
+
+
+def fold_perf(script) -> dict[str, int]:
+    """
+    Folds the output of perf script, like stackcollapse-perf.pl: one stack
+    per sample, its header line followed by one indented line per frame,
+    leaf first.
+
+    :param script: Output of perf script.
+    :type script: str
+    :return: Folded stack, root first, mapped to its samples.
+    :rtype: dict[str, int]
+    """
+    folded = {}
+    frames = None
+    for line in script.splitlines() + [""]:
+        if not line.strip():
+            if frames:
+                stack = ";".join(reversed(frames))
+                folded[stack] = folded.get(stack, 0) + 1
+            frames = None
+        elif line[0] in " \t":
+            if frames is not None:
+                # "address symbol+offset (dso)"
+                parts = line.split(None, 1)
+                symbol = parts[1].rsplit(" (", 1)[0] if len(parts) > 1 else ""
+                symbol = symbol.rsplit("+0x", 1)[0]
+                frames.append(symbol if symbol and symbol != "[unknown]"
+                              else "?")
+        else:
+            frames = []
+    return folded
+
+
+def read_folded(path) -> dict[str, int]:
+    folded = {}
+    with open(path, "r") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                folded[stack] = folded.get(stack, 0) + int(count)
+    return folded
+
+
+def write_folded(folded, path) -> None:
+    with open(path, "w") as f:
+        for stack, count in sorted(folded.items()):
+            f.write(f"{stack} {count}\n")
+
+
+def summarize(folded, top=TOP) -> dict[str]:
+    """
+    :param folded: Folded stacks, see fold_pprof and fold_perf.
+    :type folded: dict[str, int]
+    :param top: Number of functions listed.
+    :type top: int
+    :return: Total weight and the top functions by self time, with their
+             self and total share of the profile in percent.
+    :rtype: dict[str...]
+    """
+    total = sum(folded.values())
+    flat, cumulative = {}, {}
+    for stack, count in folded.items():
+        frames = stack.split(";")
+        flat[frames[-1]] = flat.get(frames[-1], 0) + count
+        # recursive functions count once per stack
+        for frame in set(frames):
+            cumulative[frame] = cumulative.get(frame, 0) + count
+    ranked = sorted(flat, key=flat.get, reverse=True)[:top]
+    return {
+        "Samples": total,
+        "Top": [{"Function": name,
+                 "Self(%)": round(100 * flat[name] / total, 2),
+                 "Total(%)": round(100 * cumulative[name] / total, 2)}
+                for name in ranked] if total else [],
+    }
+
+
+def flamegraph(folded, path, title="CPU") -> None:
+    """
+    Writes a flame graph of folded stacks as a standalone SVG: the root at
+    the bottom, every frame as wide as its share of the samples and its
+    callees stacked on top, in alphabetical order.
+
+    :param folded: Folded stacks, see fold_pprof and fold_perf.
+    :type folded: dict[str, int]
+    :param path: SVG file to write.
+    :type path: Path
+    :param title: Heading of the graph.
+    :type title: str
+    """
+    # frame tree: name -> [weight, children]
+    root = [0, {}]
+    for stack, count in folded.items():
+        node = root
+        node[0] += count
+        for frame in stack.split(";"):
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += count
+    total = root[0] or 1
+    width, row, top = 1200, 16, 40
+
+    rects = []
+    depth = 0
+
+    def place(children, x, level):
+        nonlocal depth
+        for name in sorted(children):
+            weight, grandchildren = children[name]
+            if weight / total >= MIN_FRACTION:
+                depth = max(depth, level + 1)
+                rects.append((x, level, weight, name))
+                place(grandchildren, x, level + 1)
+            x += weight
+
+    place(root[1], 0, 0)
+    height = top + (depth + 1) * row
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+             f'height="{height}" font-family="monospace" font-size="11">',
+             f'<text x="{width / 2}" y="20" text-anchor="middle" '
+             f'font-size="15">{html.escape(title)}</text>']
+    for x, level, weight, name in rects:
+        px = x / total * width
+        pw = weight / total * width
+        y = height - (level + 1) * row
+        share = 100 * weight / total
+        # warm colours, varied by name so neighbours stand apart
+        hue = zlib.crc32(name.encode()) % 50
+        label = html.escape(name[:int(pw / 7)] if pw > 21 else "")
+        parts.append(
+            f'<g><title>{html.escape(name)} ({share:.2f}%)</title>'
+            f'<rect x="{px:.1f}" y="{y}" width="{max(pw - 0.5, 0.1):.1f}" '
+            f'height="{row - 1}" fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{px + 2:.1f}" y="{y + row - 4}">{label}</text></g>')
+    parts.append("</svg>")
+    Path(path).write_text("\n".join(parts) + "\n")
+
+
+class Profiler(threading.Thread):
+    """
+    Profiles every replica of a running cluster for seconds, starting at
+    a scheduled time.
+
+    :param module: Loaded run.py of the SUT.
+    :type module: module
+    :param out_dir: Directory the profiles are written to.
+    :type out_dir: Path
+    :param at: Seconds after start() at which profiling starts.
+    :type at: float
+    :param seconds: Length of the profiles.
+    :type seconds: float
+    :param top: Functions listed per replica, see summarize.
+    :type top: int
+    """
+
+    def __init__(self, module, out_dir, at=AT, seconds=SECONDS, top=TOP):
+        super().__init__(daemon=True)
+        self.module = module
+        self.out_dir = Path(out_dir)
+        self.at = at
+        self.seconds = seconds
+        self.top = top
+        self.started = None
+        # wall-clock start and end of the profiles
+        self.window = None
+        self.nodes = {}
+        self.cancelled = threading.Event()
+        self._perf = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.started = time.time()
+        super().start()
+
+    def cancel(self) -> None:
+        """
+        Ends profiles that are still being taken, e.g. when the run
+        finished early; perf writes what it sampled so far.
+        """
+        self.cancelled.set()
+        with self._lock:
+            for process in self._perf:
+                if process.poll() is None:
+                    process.terminate()
+        if self.started is not None:
+            self.join()
+
+    def run(self) -> None:
+        if self.cancelled.wait(self.at):
+            return
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        endpoints = getattr(self.module, "PPROF_ENDPOINTS", {})
+        threads = []
+        for node, pid in self.module.pids().items():
+            if node in endpoints:
+                target = (self._pprof, node, endpoints[node])
+            else:
+                target = (self._perf_record, node, pid)
+            threads.append(threading.Thread(target=self._profile,
+                                            args=target, daemon=True))
+        print(f"[profile] {len(threads)} replicas for {self.seconds:g}s")
+        began = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.window = (began, time.time())
+
+    def _profile(self, take, node, target) -> None:
+        try:
+            profiler, folded = take(node, target)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            self.nodes[node] = {"Error": str(e)}
+            print(f"[profile] {node}: {e}")
+            return
+        write_folded(folded, self.out_dir / f"{node}{FOLDED_SUFFIX}")
+        flamegraph(folded, self.out_dir / f"{node}.svg",
+                   f"{node} ({profiler})")
+        self.nodes[node] = {"Profiler": profiler,
+                            **summarize(folded, self.top)}
+
+    def _pprof(self, node, base_url) -> tuple[str, dict]:
+        url = f"{base_url}/profile?seconds={max(1, round(self.seconds))}"
+        with urllib.request.urlopen(url, timeout=self.seconds + 30) as r:
+            data = r.read()
+        (self.out_dir / f"{node}.pb.gz").write_bytes(data)
+        return "pprof", fold_pprof(data)
+
+    def _perf_record(self, node, pid) -> tuple[str, dict]:
+        if shutil.which("perf") is None:
+            raise ValueError("perf is not installed and the node serves "
+                             "no pprof endpoint")
+        data = self.out_dir / f"{node}.perf.data"
+        with self._lock:
+            if self.cancelled.is_set():
+                raise ValueError("the run ended before profiling")
+            process = subprocess.Popen(
+                ["perf", "record", "-F", str(PERF_HZ), "-g", "-p", str(pid),
+                 "-o", str(data), "--", "sleep", str(self.seconds)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            self._perf.append(process)
+        _, errors = process.communicate()
+        if not data.exists():
+            raise ValueError(f"perf record failed: {errors.strip()}")
+        script = subprocess.run(["perf", "script", "-i", str(data)],
+                                capture_output=True, text=True, check=True)
+        return "perf", fold_perf(script.stdout)
+
+    def to_dict(self, zero, steady_window=None) -> dict[str]:
+        """
+        :param zero: Wall-clock time of the run's time series time 0.
+        :type zero: float
+        :param steady_window: Steady-state window of the run in time
+                              series seconds, see steady.analyse.
+        :type steady_window: list[float] | None
+        :return: Summary in the result section format, None if no
+                 profile was taken.
+        :rtype: dict[str...] | None
+        """
+        if self.window is None:
+            return None
+        window = [round(t - zero, 3) for t in self.window]
+        return {
+            "Window(s)": window,
+            "InSteadyState": bool(steady_window
+                                  and steady_window[0] <= window[0]
+                                  and window[1] <= steady_window[1]),
+            "Directory": str(self.out_dir),
+            "Nodes": self.nodes,
+        }
+
+
+def print_report(section, top=5) -> None:
+    state = "within" if section["InSteadyState"] else "NOT within"
+    print(f"Profiles {section['Window(s)'][0]:.1f}s-"
+          f"{section['Window(s)'][1]:.1f}s ({state} the steady state), "
+          f"in {section['Directory']}")
+    for node, summary in section["Nodes"].items():
+        if "Error" in summary:
+            print(f"  {node}: {summary['Error']}")
+            continue
+        print(f"  {node} ({summary['Profiler']}):")
+        for entry in summary["Top"][:top]:
+            print(f"    {entry['Self(%)']:6.2f}% self "
+                  f"{entry['Total(%)']:6.2f}% total  {entry['Function']}")
@@ -0,0 +1,48 @@
+"""
+Cluster sizes for replica-count scaling experiments.
+
+The checked-in configuration of every SUT describes five replicas. A cell
+with replicas = N (or --replicas N) runs on N replicas instead: before
+the cluster starts, the SUT regenerates everything that depends on the
+replica count (per-node configs, ports, data directories and membership
+strings), so throughput and commit latency can be compared as the
+quorum grows. Cells without a size run on the SUT's default.
+
+The run.py of a SUT supports cluster sizes by providing:
+- DEFAULT_SIZE: int, the size of its checked-in configuration
+- SIZE: int, the size the next start uses
+- resize(size), which sets SIZE and regenerates ENDPOINTS, DATA_DIRS and
+  PEER_ADDRESSES in place; node configs are generated on start
+"""
+
+
+def supports_resize(module) -> bool:
+    return hasattr(module, "resize") and hasattr(module, "DEFAULT_SIZE")
+
+
+def resize(module, size=None) -> None:
+    """
+    :param module: Loaded run.py of the SUT, with its cluster stopped.
+    :type module: module
+    :param size: Number of replicas, the SUT's default when None.
+    :type size: int | None
+    :raises ValueError: If size is not positive, or the SUT cannot be
+                        resized.
+    """
+    if not supports_resize(module):
+        if size is not None:
+            raise ValueError("The SUT does not support cluster sizes")
+        return
+    size = module.DEFAULT_SIZE if size is None else size
+    if not isinstance(size, int) or size < 1:
+        raise ValueError(f"Invalid cluster size {size!r}")
+    if size != module.SIZE:
+        module.resize(size)
+
+
+def current(module) -> int | None:
+    """
+    :return: Number of replicas the SUT runs, None if it has a fixed size.
+    :rtype: int | None
+    """
+    return module.SIZE if supports_resize(module) else None
@@ -0,0 +1,429 @@
+"""
+Reports over the results store: comparison tables, plots and summaries.
+
+All runs are loaded as columns in one query, with SQLite extracting the
+metrics from the result JSON, and aggregated per configuration (project,
+protocol, workload, engine, cluster size, target rate, mode and fault)
+with NumPy, so a store with tens of thousands
+of runs is reported in well under a second. Only the histograms of the
+latest run of every configuration are decoded, for the latency CDFs.
+
+The report holds, per workload:
+- runs, mean and standard deviation of throughput, and mean p99 per
+  operation of every configuration
+- the ratio of every configuration to a reference protocol of the same
+  project, when one is given
+- latency CDFs from the stored HdrHistograms
+
+It is written as Markdown and HTML, with PNG plots when matplotlib is
+installed. NumPy is required.
+
+Usage:
+    python -m src.utils.report [--reference raft] [--workload read-heavy]
+"""
+import argparse
+import html
+import json
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+from src.utils import histogram
+from src.utils import store
+
+REPORT_DIR = Path("reports.local")
+GROUP_KEYS = ("project", "protocol", "workload", "engine", "replicas",
+              "rate", "mode", "fault")
+# Group keys read from the run's config rather than a column of their own:
+# the steps of a sweep or pipeline scan and the runs with a fault are
+# configurations of their own, not samples of the plain run
+CONFIG_KEYS = {
+    "replicas": "json_extract(config, '$.replicas')",
+    "rate": "json_extract(config, '$.rate')",
+    "mode": ("CASE WHEN json_extract(config, '$.sweep') IS NOT NULL "
+             "THEN 'sweep' "
+             "WHEN json_extract(config, '$.pipeline') IS NOT NULL "
+             "THEN 'pipeline w=' || json_extract(config, '$.pipeline.window') "
+             "ELSE 'single' END"),
+    "fault": ("json_extract(config, '$.fault.action') || '@' "
+              "|| json_extract(config, '$.fault.at') || 's'"),
+}
+# Keys a configuration shares with the reference it is compared to
+PEER_KEYS = tuple(key for key in GROUP_KEYS if key != "protocol")
+OPERATIONS = ("READ", "UPDATE", "INSERT")
+# Percentiles of the plotted CDFs are spaced evenly in log(1 / (1 - p))
+CDF_POINTS = 200
+
+
+def _p99_column(op) -> str:
+    return (f"json_extract(result, '$.\"{op}\".\"99thPercentileLatency(us)\"')"
+            f" AS p99_{op.lower()}")
+
+
+def load_columns(results, **filters) -> dict[str, "np.ndarray"]:
+    """
+    Loads every run matching filters as columns.
+
+    :param results: Results store.
+    :type results: store.ResultStore
+    :param filters: Values for any of store.KEYS.
+    :return: id, timestamp, the GROUP_KEYS, throughput and p99_<op> of
+             every run, in insertion order.
+    :rtype: dict[str, np.ndarray]
+    """
+    where, params = results._where(filters)
+    columns = ["id", "timestamp",
+               *(f"{CONFIG_KEYS[key]} AS {key}" if key in CONFIG_KEYS
+                 else key for key in GROUP_KEYS),
+               "throughput",
+               *(_p99_column(op) for op in OPERATIONS)]
+    rows = results.conn.execute(
+        f"SELECT {', '.join(columns)} FROM runs{where} ORDER BY id",
+        params).fetchall()
+    names = ["id", "timestamp", *GROUP_KEYS, "throughput",
+             *(f"p99_{op.lower()}" for op in OPERATIONS)]
+    values = list(zip(*rows)) if rows else [()] * len(names)
+    data = {}
+    for name, column in zip(names, values):
+        if name in GROUP_KEYS:
+            data[name] = np.array(column, dtype=object).astype(str)
+        elif name == "id":
+            data[name] = np.array(column, dtype=np.int64)
+        else:
+            # NULLs become NaN
+            data[name] = np.array(column, dtype=float)
+    return data
+
+
+def group(data, keys=GROUP_KEYS) -> tuple[dict, "np.ndarray"]:
+    """
+    :param data: Columns, see load_columns.
+    :type data: dict[str, np.ndarray]
+    :param keys: Columns identifying a group.
+    :type keys: tuple[str]
+    :return: The key columns of every group, sorted, and the group index
+             of every run.
+    :rtype: tuple[dict[str, np.ndarray], np.ndarray]
+    """
+    codes = np.zeros(len(data[keys[0]]), dtype=np.int64)
+    uniques = {}
+    for key in keys:
+        uniques[key], inverse = np.unique(data[key], return_inverse=True)
+        codes = codes * len(uniques[key]) + inverse
+    _, first, inverse = np.unique(codes, return_index=True,
+                                  return_inverse=True)
+    return {key: data[key][first] for key in keys}, inverse
+
+
+def aggregate(values, inverse, size) -> dict[str, "np.ndarray"]:
+    """
+    Count, mean and standard deviation of values per group, NaN ignored.
+
+    :rtype: dict[str, np.ndarray]
+    """
+    valid = ~np.isnan(values)
+    clean = np.where(valid, values, 0.0)
+    count = np.bincount(inverse, weights=valid, minlength=size)
+    total = np.bincount(inverse, weights=clean, minlength=size)
+    squares = np.bincount(inverse, weights=clean * clean, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        variance = (squares - count * mean * mean) / (count - 1)
+    std = np.sqrt(np.clip(np.where(count > 1, variance, 0.0), 0.0, None))
+    return {"count": count, "mean": mean, "std": std}
+
+
+def latest(data, inverse, size) -> "np.ndarray":
+    """
+    :return: Run id of the most recent run of every group.
+    :rtype: np.ndarray
+    """
+    order = np.lexsort((data["id"], data["timestamp"], inverse))
+    last = np.flatnonzero(np.r_[inverse[order][1:] != inverse[order][:-1],
+                                True])
+    ids = np.zeros(size, dtype=np.int64)
+    ids[inverse[order][last]] = data["id"][order][last]
+    return ids
+
+
+def summarize(data, reference=None) -> dict[str, "np.ndarray"]:
+    """
+    Aggregates the runs per configuration.
+
+    :param data: Columns, see load_columns.
+    :type data: dict[str, np.ndarray]
+    :param reference: Protocol the others are compared to, within the
+                      same PEER_KEYS.
+    :type reference: str | None
+    :return: Columns of the table, one row per configuration: the
+             GROUP_KEYS, runs, throughput, throughput_std, p99_<op>,
+             latest_id and, with a reference, throughput_ratio and
+             p99_<op>_ratio.
+    :rtype: dict[str, np.ndarray]
+    """
+    keys, inverse = group(data)
+    size = len(keys["project"])
+    table = dict(keys)
+    stats = aggregate(data["throughput"], inverse, size)
+    table["runs"] = np.bincount(inverse, minlength=size)
+    table["throughput"] = stats["mean"]
+    table["throughput_std"] = stats["std"]
+    metrics = ["throughput"]
+    for op in OPERATIONS:
+        column = f"p99_{op.lower()}"
+        table[column] = aggregate(data[column], inverse, size)["mean"]
+        metrics.append(column)
+    table["latest_id"] = latest(data, inverse, size)
+
+    if reference is not None:
+        peers, peer_of = group(table, PEER_KEYS)
+        is_reference = table["protocol"] == reference
+        reference_row = np.full(len(peers["project"]), -1)
+        reference_row[peer_of[is_reference]] = np.flatnonzero(is_reference)
+        row = reference_row[peer_of]
+        for metric in metrics:
+            base = np.where(row >= 0, table[metric][row], np.nan)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                table[f"{metric}_ratio"] = table[metric] / base
+    return table
+
+
+def cdf(hist) -> tuple["np.ndarray", "np.ndarray"]:
+    """
+    :param hist: Latency histogram.
+    :type hist: histogram.Histogram
+    :return: Latencies in microseconds and the fraction of operations at
+             or below each.
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    buckets = np.array(hist.buckets(), dtype=float).reshape(-1, 2)
+    fraction = np.cumsum(buckets[:, 1]) / max(hist.total, 1)
+    if len(buckets) > CDF_POINTS:
+        # keep the tail: sample evenly in the number of nines
+        nines = -np.log10(np.clip(1 - fraction, 1e-9, None))
+        targets = np.linspace(0, nines[-1], CDF_POINTS)
+        keep = np.unique(np.searchsorted(nines, targets).clip(
+            0, len(buckets) - 1))
+        return buckets[keep, 0], fraction[keep]
+    return buckets[:, 0], fraction
+
+
+def load_cdfs(results, ids) -> dict[int, tuple]:
+    """
+    :param ids: Run ids.
+    :type ids: Iterable[int]
+    :return: Run id mapped to the CDF of its merged service times, see cdf.
+    :rtype: dict[int, tuple[np.ndarray, np.ndarray]]
+    """
+    ids = [int(i) for i in ids]
+    if not ids:
+        return {}
+    rows = results.conn.execute(
+        f"SELECT id, histograms FROM runs WHERE id IN "
+        f"({', '.join('?' * len(ids))}) AND histograms IS NOT NULL",
+        ids).fetchall()
+    cdfs = {}
+    for run_id, encoded in rows:
+        sections = json.loads(encoded)
+        service = [v for k, v in sections.items()
+                   if not k.startswith("Intended-")]
+        if service:
+            cdfs[run_id] = cdf(histogram.merge(service))
+    return cdfs
+
+
+def _value(table, key, i) -> str:
+    # NULL in the store, e.g. the cluster size of a SUT with a fixed one
+    return "-" if table[key][i] == "None" else table[key][i]
+
+
+def _label(table, i) -> str:
+    label = f"{table['project'][i]} {table['protocol'][i]}"
+    if table["replicas"][i] != "None":
+        label += f" n={table['replicas'][i]}"
+    if table["mode"][i] != "single":
+        label += f" {table['mode'][i]}"
+    if table["rate"][i] != "None":
+        label += f" @{table['rate'][i]}"
+    if table["fault"][i] != "None":
+        label += f" {table['fault'][i]}"
+    return label
+
+
+def _format(value, digits=0) -> str:
+    return "-" if np.isnan(value) else f"{value:,.{digits}f}"
+
+
+def _rows(table, rows) -> tuple[list[str], list[list[str]]]:
+    """
+    :return: Header and cells of the table for the given rows.
+    """
+    ratios = "throughput_ratio" in table
+    header = ["Project", "Protocol", "Engine", "Replicas", "Mode",
+              "Rate (ops/s)", "Fault", "Runs", "Throughput (ops/s)",
+              *(f"p99 {op} (us)" for op in OPERATIONS)]
+    if ratios:
+        header += ["Throughput ratio", "p99 READ ratio", "p99 UPDATE ratio"]
+    cells = []
+    for i in rows:
+        cells.append([
+            table["project"][i], table["protocol"][i], table["engine"][i],
+            _value(table, "replicas", i), table["mode"][i],
+            _value(table, "rate", i), _value(table, "fault", i),
+            str(table["runs"][i]),
+            f"{_format(table['throughput'][i])} ± "
+            f"{_format(table['throughput_std'][i])}",
+            *(_format(table[f"p99_{op.lower()}"][i]) for op in OPERATIONS),
+        ])
+        if ratios:
+            cells[-1] += [_format(table[f"{m}_ratio"][i], 2) for m in
+                          ("throughput", "p99_read", "p99_update")]
+    return header, cells
+
+
+def plot(table, rows, cdfs, workload, out_dir) -> list[str]:
+    """
+    Plots throughput, p99 and latency CDFs of one workload.
+
+    :return: File names of the written plots.
+    :rtype: list[str]
+    """
+    labels = [_label(table, i) for i in rows]
+    files = []
+    fig, (ax_tp, ax_p99) = plt.subplots(
+        1, 2, figsize=(12, 0.4 * len(rows) + 2), sharey=True)
+    y = np.arange(len(rows))
+    ax_tp.barh(y, table["throughput"][rows],
+               xerr=table["throughput_std"][rows])
+    ax_tp.set_yticks(y, labels)
+    ax_tp.set_xlabel("throughput (ops/sec)")
+    height = 0.8 / len(OPERATIONS)
+    for k, op in enumerate(OPERATIONS):
+        ax_p99.barh(y + (k - 1) * height, table[f"p99_{op.lower()}"][rows],
+                    height, label=op)
+    ax_p99.set_xlabel("p99 latency (us)")
+    ax_p99.legend()
+    fig.suptitle(workload)
+    fig.tight_layout()
+    files.append(f"{workload}-summary.png")
+    fig.savefig(out_dir / files[-1], dpi=100)
+    plt.close(fig)
+
+    curves = [(label, cdfs[table["latest_id"][i]])
+              for label, i in zip(labels, rows)
+              if table["latest_id"][i] in cdfs]
+    if curves:
+        fig, ax = plt.subplots(figsize=(9, 5))
+        for label, (latency, fraction) in curves:
+            ax.step(latency, fraction, where="post", label=label)
+        ax.set_xscale("log")
+        ax.set_xlabel("latency (us)")
+        ax.set_ylabel("fraction of operations")
+        ax.set_title(f"{workload}: latency CDF of the latest runs")
+        ax.grid(True, which="both", alpha=0.3)
+        ax.legend(fontsize="small")
+        fig.tight_layout()
+        files.append(f"{workload}-cdf.png")
+        fig.savefig(out_dir / files[-1], dpi=100)
+        plt.close(fig)
+    return files
+
+
+def write_report(table, cdfs, out_dir, reference=None) -> tuple[Path, Path]:
+    """
+    Writes report.md and report.html, and the plots when matplotlib is
+    installed.
+
+    :return: Paths of the Markdown and HTML reports.
+    :rtype: tuple[Path, Path]
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    generated = time.strftime("%Y-%m-%d %H:%M:%S")
+    markdown = ["# Benchmark report", "", f"Generated {generated}."]
+    page = [f"<h1>Benchmark report</h1><p>Generated {generated}.</p>"]
+    if reference:
+        markdown.append(f"Ratios are relative to {reference}.")
+        page.append(f"<p>Ratios are relative to {html.escape(reference)}.</p>")
+
+    for workload in np.unique(table["workload"]):
+        rows = np.flatnonzero(table["workload"] == workload)
+        rows = rows[np.argsort(-np.nan_to_num(table["throughput"][rows]))]
+        header, cells = _rows(table, rows)
+        markdown += ["", f"## {workload}", "",
+                     "| " + " | ".join(header) + " |",
+                     "|" + "---|" * len(header)]
+        markdown += ["| " + " | ".join(row) + " |" for row in cells]
+        page.append(f"<h2>{html.escape(workload)}</h2><table><tr>"
+                    + "".join(f"<th>{html.escape(h)}</th>" for h in header)
+                    + "</tr>")
+        page += ["<tr>" + "".join(f"<td>{html.escape(c)}</td>" for c in row)
+                 + "</tr>" for row in cells]
+        page.append("</table>")
+        if plt is not None:
+            for name in plot(table, rows, cdfs, workload, out_dir):
+                markdown += ["", f"![{name}]({name})"]
+                page.append(f'<img src="{html.escape(name)}" alt="{name}">')
+
+    md_path = out_dir / "report.md"
+    md_path.write_text("\n".join(markdown) + "\n")
+    html_path = out_dir / "report.html"
+    html_path.write_text(
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+        "<title>Benchmark report</title><style>"
+        "body{font-family:sans-serif;margin:2em}"
+        "table{border-collapse:collapse;margin-bottom:1em}"
+        "td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}"
+        "img{max-width:100%}</style></head><body>\n"
+        + "\n".join(page) + "\n</body></html>\n")
+    return md_path, html_path
+
+
+def main(argv) -> None:
+    parser = argparse.ArgumentParser(
+        description="Write comparison tables and plots of the stored runs.")
+    parser.add_argument("--db", default=store.RESULTS_DB,
+                        help="results store to read")
+    parser.add_argument("--out", default=REPORT_DIR, type=Path,
+                        help=f"output directory (default: {REPORT_DIR})")
+    parser.add_argument("--reference",
+                        help="protocol the others are compared to")
+    for key in ("project", "protocol", "workload", "engine"):
+        parser.add_argument(f"--{key}", help=f"only runs of this {key}")
+    args = parser.parse_args(argv[1:])
+    if np is None:
+        print("The report needs NumPy: pip install numpy")
+        sys.exit(1)
+    if plt is None:
+        print("matplotlib is not installed, the report has no plots")
+
+    start = time.perf_counter()
+    filters = {k: getattr(args, k)
+               for k in ("project", "protocol", "workload", "engine")}
+    with store.ResultStore(args.db) as results:
+        data = load_columns(results, **filters)
+        if not len(data["id"]):
+            print(f"No runs in {args.db}")
+            return
+        table = summarize(data, args.reference)
+        print(f"Aggregated {len(data['id'])} runs into "
+              f"{len(table['project'])} configurations in "
+              f"{time.perf_counter() - start:.2f}s")
+        cdfs = load_cdfs(results, table["latest_id"])
+    md_path, html_path = write_report(table, cdfs, args.out, args.reference)
+    print(f"Report written to {md_path} and {html_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,273 @@
+"""
+Per-replica resource sampling from /proc.
+
+A ResourceSampler thread reads /proc/<pid>/stat, status and io of every
+replica at a fixed rate (10 Hz by default) while a benchmark runs. The
+/proc files are kept open and re-read with pread, so a sample costs three
+syscalls per replica and no allocation beyond the parsed values.
+
+For each replica it records a time series of CPU usage (in cores), RSS,
+disk I/O and context switch rates, plus a summary with peak RSS and the
+average CPU used, which is what throughput per core is computed from.
+"""
+import os
+import threading
+import time
+
+SAMPLE_HZ = 10
+MAX_POINTS = 3600
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class _ProcFiles:
+    """
+    Open /proc files of one process, re-read from offset 0 on every sample.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.fds = {}
+        for name in ("stat", "status", "io"):
+            try:
+                self.fds[name] = os.open(f"/proc/{pid}/{name}", os.O_RDONLY)
+            except OSError:
+                # io needs ptrace access, the other files are always readable
+                if name != "io":
+                    self.close()
+                    raise
+
+    def read(self, name) -> bytes | None:
+        fd = self.fds.get(name)
+        return os.pread(fd, 4096, 0) if fd is not None else None
+
+    def close(self) -> None:
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+
+def read_sample(files) -> dict[str, int]:
+    """
+    Reads the cumulative counters of one process.
+
+    :param files: Open /proc files of the process.
+    :type files: _ProcFiles
+    :return: cpu_ticks, rss, threads, vcsw, nvcsw, read_bytes, write_bytes.
+    :rtype: dict[str, int]
+    """
+    stat = files.read("stat")
+    # comm may contain spaces, fields after it are space separated
+    fields = stat[stat.rindex(b")") + 2:].split()
+    sample = {
+        "cpu_ticks": int(fields[11]) + int(fields[12]),
+        "threads": int(fields[17]),
+        "rss": int(fields[21]) * PAGE_SIZE,
+        "vcsw": 0,
+        "nvcsw": 0,
+        "read_bytes": 0,
+        "write_bytes": 0,
+    }
+    for line in files.read("status").splitlines():
+        if line.startswith(b"voluntary_ctxt_switches:"):
+            sample["vcsw"] = int(line.split()[1])
+        elif line.startswith(b"nonvoluntary_ctxt_switches:"):
+            sample["nvcsw"] = int(line.split()[1])
+    io = files.read("io")
+    if io:
+        for line in io.splitlines():
+            if line.startswith(b"read_bytes:"):
+                sample["read_bytes"] = int(line.split()[1])
+            elif line.startswith(b"write_bytes:"):
+                sample["write_bytes"] = int(line.split()[1])
+    return sample
+
+
+def _rates(prev, curr, dt) -> dict[str, float]:
+    return {
+        "cpu": (curr["cpu_ticks"] - prev["cpu_ticks"]) / CLOCK_TICKS / dt,
+        "rss": curr["rss"],
+        "threads": curr["threads"],
+        "read_bps": (curr["read_bytes"] - prev["read_bytes"]) / dt,
+        "write_bps": (curr["write_bytes"] - prev["write_bytes"]) / dt,
+        "vcsw/s": (curr["vcsw"] - prev["vcsw"]) / dt,
+        "nvcsw/s": (curr["nvcsw"] - prev["nvcsw"]) / dt,
+    }
+
+
+def _compact(points) -> list[dict]:
+    """
+    Halves the resolution of a series: rates are averaged, RSS and thread
+    counts keep their maximum.
+    """
+    compacted = []
+    for a, b in zip(points[0::2], points[1::2]):
+        merged = {"time": b["time"], "interval": a["interval"] + b["interval"]}
+        for key in a:
+            if key in ("time", "interval"):
+                continue
+            if key in ("rss", "threads"):
+                merged[key] = max(a[key], b[key])
+            else:
+                merged[key] = ((a[key] * a["interval"]
+                                + b[key] * b["interval"])
+                               / merged["interval"])
+        compacted.append(merged)
+    if len(points) % 2:
+        compacted.append(points[-1])
+    return compacted
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Samples the resources of every replica while a benchmark runs.
+
+    :param pids: Returns the replica name mapped to its pid. Called at the
+                 first sample, and again only when a replica's process
+                 is gone or fewer replicas than before are listed, so
+                 restarted replicas are followed without walking /proc
+                 (etcd's pids) on every sample.
+    :type pids: Callable[[], dict[str, int]]
+    :param hz: Samples per second.
+    :type hz: float
+    """
+
+    def __init__(self, pids, hz=SAMPLE_HZ, max_points=MAX_POINTS):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = 1 / hz
+        self.max_points = max_points
+        self.series = {}
+        self.totals = {}
+        self.started = None
+        self.stopped = threading.Event()
+        self._files = {}
+        self._last = {}
+        # Pids of the last call of pids, None to call it again
+        self._pids = None
+        self._replicas = 0
+
+    def start(self) -> None:
+        self.started = time.time()
+        super().start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+        for files in self._files.values():
+            files.close()
+        self._files = {}
+
+    def _files_for(self, name, pid):
+        files = self._files.get(name)
+        if files is None or files.pid != pid:
+            if files is not None:
+                files.close()
+            files = self._files[name] = _ProcFiles(pid)
+            self._last.pop(name, None)
+        return files
+
+    def _resolve(self) -> dict[str, int]:
+        if self._pids is None:
+            self._pids = self.pids()
+            if len(self._pids) < self._replicas:
+                # a replica is down, look for its restart next time
+                pids, self._pids = self._pids, None
+                return pids
+            self._replicas = len(self._pids)
+        return self._pids
+
+    def sample(self) -> None:
+        now = time.monotonic()
+        for name, pid in self._resolve().items():
+            try:
+                curr = read_sample(self._files_for(name, pid))
+            except (OSError, ValueError, IndexError):
+                # the process exited since the pids were listed
+                files = self._files.pop(name, None)
+                if files is not None:
+                    files.close()
+                self._pids = None
+                continue
+
+            last = self._last.get(name)
+            self._last[name] = (now, curr)
+            totals = self.totals.setdefault(
+                name, {"cpu_seconds": 0.0, "peak_rss": 0, "read_bytes": 0,
+                       "write_bytes": 0, "vcsw": 0, "nvcsw": 0,
+                       "duration": 0.0})
+            totals["peak_rss"] = max(totals["peak_rss"], curr["rss"])
+            if last is None:
+                continue
+
+            then, prev = last
+            dt = now - then
+            point = _rates(prev, curr, dt)
+            point["time"] = round(time.time() - self.started, 3)
+            point["interval"] = dt
+            series = self.series.setdefault(name, [])
+            series.append(point)
+            if len(series) > self.max_points:
+                self.series[name] = _compact(series)
+
+            totals["duration"] += dt
+            totals["cpu_seconds"] += point["cpu"] * dt
+            for key in ("read_bytes", "write_bytes", "vcsw", "nvcsw"):
+                totals[key] += curr[key] - prev[key]
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            self.sample()
+            self.stopped.wait(max(0.0, self.interval
+                                  - (time.monotonic() - started)))
+
+    def summary(self) -> dict[str, dict]:
+        """
+        :return: Replica name mapped to peak RSS, average CPU cores and
+                 totals over the sampled period.
+        :rtype: dict[str, dict]
+        """
+        summary = {}
+        for name, totals in self.totals.items():
+            duration = totals["duration"]
+            summary[name] = {
+                "PeakRSS(MB)": totals["peak_rss"] / 2 ** 20,
+                "CPU(cores)": (totals["cpu_seconds"] / duration
+                               if duration else 0.0),
+                "CPUTime(s)": totals["cpu_seconds"],
+                "ReadBytes": totals["read_bytes"],
+                "WriteBytes": totals["write_bytes"],
+                "VoluntaryCtxSwitches": totals["vcsw"],
+                "InvoluntaryCtxSwitches": totals["nvcsw"],
+            }
+        return summary
+
+    def to_dict(self) -> dict[str]:
+        return {
+            "hz": 1 / self.interval,
+            "started": self.started,
+            "summary": self.summary(),
+            "series": self.series,
+        }
+
+
+def overall(summary, throughput) -> dict[str, float]:
+    """
+    Cluster-wide figures for the result: peak RSS of the largest replica,
+    total CPU cores used and throughput per core.
+
+    :param summary: Per-replica summary, see ResourceSampler.summary.
+    :type summary: dict[str, dict]
+    :param throughput: Achieved throughput of the run in ops/sec.
+    :type throughput: float
+    :rtype: dict[str, float]
+    """
+    cores = sum(r["CPU(cores)"] for r in summary.values())
+    return {
+        "Replicas": len(summary),
+        "MaxPeakRSS(MB)": max((r["PeakRSS(MB)"] for r in summary.values()),
+                              default=0.0),
+        "CPU(cores)": cores,
+        "Throughput/Core(ops/sec)": throughput / cores if cores else None,
+    }
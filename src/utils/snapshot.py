@@ -0,0 +1,168 @@
+"""
+Snapshots of loaded cluster state, to skip the load phase of later runs.
+
+After a first load the cluster is stopped without wiping its data, every
+replica's data directory is copied into SNAPSHOT_DIR and the cluster is
+started again on the same data. Later runs of the same SUT, protocol,
+engine, workload file content and record count restore the snapshot
+before starting the cluster and go straight to the run phase.
+
+Directories are copied file by file with reflinks (FICLONE) when the
+snapshot and the data directories live on one filesystem that supports
+them (btrfs, XFS...), which costs no data copy and keeps both sides
+copy-on-write. Otherwise every directory is stored as a tar archive.
+Hard links are never used: etcd's bbolt file and RocksDB's WAL and
+MANIFEST are modified in place, which would corrupt the snapshot.
+
+The run.py of a SUT supports snapshots by providing:
+- DATA_DIRS: dict[str, Path], node name mapped to its data directory
+- start(protocol_name, keep_data) and stop(keep_data), which leave the
+  data directories in place when keep_data is True
+"""
+import errno
+import fcntl
+import json
+import os
+import re
+import shutil
+import tarfile
+import time
+from pathlib import Path
+
+SNAPSHOT_DIR = Path("snapshots.local")
+MANIFEST = "manifest.json"
+# ioctl cloning a whole file, from linux/fs.h
+FICLONE = 0x40049409
+UNSUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+               errno.ENOSYS, errno.EPERM)
+
+
+def supports_snapshots(module) -> bool:
+    return hasattr(module, "DATA_DIRS")
+
+
+def key(sut, protocol, engine, workload, record_count, digest) -> Path:
+    """
+    :param workload: Workload file name.
+    :type workload: str
+    :param digest: SHA-256 of the workload file's content, so an edited
+                   file (field length, key distribution...) gets a new
+                   snapshot, see fingerprint.file_digest.
+    :type digest: str
+    :return: Path of the snapshot relative to SNAPSHOT_DIR. Every part that
+             changes the loaded data is in it, so a stale snapshot is never
+             restored.
+    :rtype: Path
+    """
+    def safe(part):
+        return re.sub(r"[^\w.-]", "_", str(part))
+    return Path(safe(sut), safe(protocol),
+                f"{safe(engine)}-{safe(workload)}-{int(record_count)}"
+                f"-{safe(digest)[:12]}")
+
+
+def exists(snapshot_key) -> bool:
+    return (SNAPSHOT_DIR / snapshot_key / MANIFEST).exists()
+
+
+def _reflink(src, dst) -> None:
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def supports_reflink(src, dst_dir) -> bool:
+    """
+    :return: Whether files under src can be cloned into dst_dir.
+    :rtype: bool
+    """
+    if os.stat(src).st_dev != os.stat(dst_dir).st_dev:
+        return False
+    probe = Path(dst_dir) / ".reflink-probe"
+    try:
+        probe.write_bytes(b"probe")
+        _reflink(probe, probe.with_suffix(".clone"))
+        return True
+    except OSError as e:
+        if e.errno in UNSUPPORTED:
+            return False
+        raise
+    finally:
+        probe.unlink(missing_ok=True)
+        probe.with_suffix(".clone").unlink(missing_ok=True)
+
+
+def take(snapshot_key, data_dirs) -> dict[str]:
+    """
+    Copies the data directories of a stopped cluster into a new snapshot.
+    The snapshot only becomes visible once complete.
+
+    :param snapshot_key: See key.
+    :type snapshot_key: Path
+    :param data_dirs: Node name mapped to its data directory.
+    :type data_dirs: dict[str, Path]
+    :return: The snapshot manifest.
+    :rtype: dict[str...]
+    """
+    target = SNAPSHOT_DIR / snapshot_key
+    partial = target.with_name(target.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+
+    missing = [node for node, d in data_dirs.items() if not Path(d).is_dir()]
+    if missing:
+        raise ValueError(f"No data directory for {', '.join(missing)}")
+    partial.mkdir(parents=True)
+
+    start = time.monotonic()
+    mode = "reflink" if all(supports_reflink(d, partial)
+                            for d in data_dirs.values()) else "tar"
+    for node, data_dir in data_dirs.items():
+        if mode == "reflink":
+            shutil.copytree(data_dir, partial / node, symlinks=True,
+                            copy_function=_reflink)
+        else:
+            with tarfile.open(partial / f"{node}.tar", "w") as tar:
+                tar.add(data_dir, arcname=".")
+
+    manifest = {"created": time.time(), "mode": mode,
+                "nodes": {node: str(d) for node, d in data_dirs.items()}}
+    (partial / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    shutil.rmtree(target, ignore_errors=True)
+    partial.rename(target)
+    print(f"Snapshot {snapshot_key} taken ({mode}, {len(data_dirs)} nodes) "
+          f"in {time.monotonic() - start:.2f}s")
+    return manifest
+
+
+def restore(snapshot_key, data_dirs) -> None:
+    """
+    Replaces the data directories with the content of a snapshot.
+
+    :param snapshot_key: See key.
+    :type snapshot_key: Path
+    :param data_dirs: Node name mapped to its data directory.
+    :type data_dirs: dict[str, Path]
+    """
+    source = SNAPSHOT_DIR / snapshot_key
+    manifest = json.loads((source / MANIFEST).read_text())
+    if set(manifest["nodes"]) != set(data_dirs):
+        raise ValueError(f"Snapshot {snapshot_key} holds nodes "
+                         f"{sorted(manifest['nodes'])}, expected "
+                         f"{sorted(data_dirs)}")
+
+    start = time.monotonic()
+    for node, data_dir in data_dirs.items():
+        data_dir = Path(data_dir)
+        shutil.rmtree(data_dir, ignore_errors=True)
+        if manifest["mode"] == "reflink" and supports_reflink(
+                source / node, data_dir.parent):
+            shutil.copytree(source / node, data_dir, symlinks=True,
+                            copy_function=_reflink)
+        elif manifest["mode"] == "reflink":
+            shutil.copytree(source / node, data_dir, symlinks=True)
+        else:
+            data_dir.mkdir(parents=True)
+            with tarfile.open(source / f"{node}.tar") as tar:
+                tar.extractall(data_dir, filter="tar")
+    print(f"Snapshot {snapshot_key} restored in "
+          f"{time.monotonic() - start:.2f}s")
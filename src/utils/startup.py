@@ -0,0 +1,135 @@
+"""
+Readiness probes shared by the SUT run.py scripts.
+
+Instead of sleeping for a fixed time after starting replicas, a run.py
+builds one probe per replica and calls wait_ready. All probes are polled
+concurrently with exponential backoff, and wait_ready returns as soon as
+every replica answers. It raises StartupError with a per-node report when
+the hard timeout expires or a replica process exits.
+
+A probe is any callable that returns when the replica is ready and raises
+otherwise, e.g. tcp_probe("127.0.0.1", 2379) or
+http_probe("http://127.0.0.1:2379/health", check=...).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import time
+import urllib.request
+
+STARTUP_TIMEOUT = 30
+ATTEMPT_TIMEOUT = 1
+INITIAL_BACKOFF = 0.05
+MAX_BACKOFF = 1.0
+
+
+class StartupError(Exception):
+    """
+    Raised when some replicas did not become ready.
+
+    :param report: Per-node report, see wait_ready.
+    :type report: dict[str, dict]
+    """
+
+    def __init__(self, report):
+        failed = [name for name, node in report.items() if not node["ready"]]
+        super().__init__(f"Replicas not ready: {', '.join(failed)}")
+        self.report = report
+
+
+def tcp_probe(host, port):
+    """
+    Ready once a TCP connection to host:port is accepted.
+    """
+    def probe():
+        with socket.create_connection((host, port), timeout=ATTEMPT_TIMEOUT):
+            pass
+    return probe
+
+
+def http_probe(url, method="GET", body=None, check=None):
+    """
+    Ready once url answers with a 2xx status and, if given, check returns
+    True for the response body.
+
+    :param url: URL to request.
+    :type url: str
+    :param method: HTTP method.
+    :type method: str
+    :param body: Request body.
+    :type body: bytes | None
+    :param check: Predicate on the response body.
+    :type check: Callable[bytes, bool] | None
+    """
+    def probe():
+        req = urllib.request.Request(url, data=body, method=method)
+        with urllib.request.urlopen(req, timeout=ATTEMPT_TIMEOUT) as resp:
+            data = resp.read()
+        if check and not check(data):
+            raise ValueError(f"unexpected response {data[:100]!r}")
+    return probe
+
+
+def _poll(probe, deadline, process):
+    start = time.monotonic()
+    delay = INITIAL_BACKOFF
+    attempts = 0
+    error = None
+    while True:
+        attempts += 1
+        if process is not None and process.poll() is not None:
+            error = f"process exited with code {process.returncode}"
+            break
+        try:
+            probe()
+            return {"ready": True, "attempts": attempts,
+                    "elapsed": time.monotonic() - start, "error": None}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        if time.monotonic() + delay > deadline:
+            error = f"timed out: {error}"
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_BACKOFF)
+
+    return {"ready": False, "attempts": attempts,
+            "elapsed": time.monotonic() - start, "error": error}
+
+
+def wait_ready(probes, timeout=STARTUP_TIMEOUT, processes=None) -> dict:
+    """
+    Polls every probe concurrently until all succeed.
+
+    :param probes: Node name mapped to its probe.
+    :type probes: dict[str, Callable]
+    :param timeout: Hard timeout in seconds for the whole cluster.
+    :type timeout: float
+    :param processes: Node name mapped to its Popen, a node fails
+                      immediately when its process exits.
+    :type processes: dict[str, subprocess.Popen] | None
+    :return: Node name mapped to {ready, attempts, elapsed, error}.
+    :rtype: dict[str, dict]
+    :raises StartupError: If any node is not ready in time.
+    """
+    processes = processes or {}
+    deadline = time.monotonic() + timeout
+    with ThreadPoolExecutor(max_workers=max(1, len(probes))) as pool:
+        futures = {name: pool.submit(_poll, probe, deadline,
+                                     processes.get(name))
+                   for name, probe in probes.items()}
+        report = {name: future.result() for name, future in futures.items()}
+
+    print_report(report)
+    if not all(node["ready"] for node in report.values()):
+        raise StartupError(report)
+    return report
+
+
+def print_report(report) -> None:
+    for name, node in report.items():
+        if node["ready"]:
+            print(f"{name}: ready after {node['elapsed']:.2f}s "
+                  f"({node['attempts']} probes)")
+        else:
+            print(f"{name}: NOT ready after {node['elapsed']:.2f}s - "
+                  f"{node['error']}")
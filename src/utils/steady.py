@@ -0,0 +1,187 @@
+"""
+Warm-up trimming and steady-state detection on the time series of a run.
+
+The first seconds of a run measure JIT warm-up, leader election settling
+and storage start-up rather than the protocol, and short runs are
+dominated by them. The end of the warm-up is found with MSER-5 (White,
+1997): the per-interval throughput and latency are averaged in batches of
+BATCH intervals, and the truncation point is the number of leading
+batches d that minimises
+
+    variance of batches d..n-1 / (n - d)
+
+i.e. the one whose remaining series has the tightest confidence interval
+around its mean. With the few batches of a short run, noise alone moves
+the minimum later, so the earliest d within TOLERANCE of it is taken. The
+search is limited to the first half of the run; a truncation point at its
+edge means the series is still drifting, and the run is not stable. The
+later of the throughput and latency truncation points starts the
+steady-state window, which ends before the last interval, the tail of the
+run where clients finish their last operations.
+
+Percentiles need a histogram of the window, which the time series has
+not; the window reports throughput and per-operation counts, averages
+and maxima.
+"""
+import math
+
+BATCH = 5
+# Fewer intervals than this are not batched
+MIN_BATCHED = 4 * BATCH
+# Earliest truncation point whose statistic is within this factor of the
+# minimum
+TOLERANCE = 1.5
+# Runs are extended at most this many times, see extended_count
+MAX_EXTENSIONS = 3
+# Extra run length asked for when extending, on top of the estimate
+MARGIN = 1.2
+# Sections of a data point that are not operations
+SKIPPED_SECTIONS = ("CLEANUP",)
+
+
+def _operations(point) -> dict[str, dict]:
+    return {k: v for k, v in point.items()
+            if isinstance(v, dict) and "Count" in v and "Avg" in v
+            and not k.startswith("Intended-") and k not in SKIPPED_SECTIONS}
+
+
+def _latency(point) -> float | None:
+    """
+    :return: Average latency of all operations completed in the interval,
+             None without any.
+    """
+    ops = _operations(point).values()
+    count = sum(s["Count"] for s in ops)
+    if not count:
+        return None
+    return sum(s["Avg"] * s["Count"] for s in ops) / count
+
+
+def mser(values, batch=BATCH) -> tuple[int, bool]:
+    """
+    :param values: Per-interval values in time order.
+    :type values: list[float]
+    :param batch: Intervals averaged into one batch.
+    :type batch: int
+    :return: Leading values to drop, and whether they are fewer than
+             half of the batches (the series has settled).
+    :rtype: tuple[int, bool]
+    """
+    batches = [sum(values[i:i + batch]) / batch
+               for i in range(0, len(values) - batch + 1, batch)]
+    n = len(batches)
+    if n < 2:
+        return 0, False
+    # suffix sums make every candidate O(1)
+    total = total_sq = 0.0
+    suffix = [None] * n
+    for i in range(n - 1, -1, -1):
+        total += batches[i]
+        total_sq += batches[i] * batches[i]
+        suffix[i] = (total, total_sq)
+    limit = n // 2
+    statistics = []
+    for d in range(limit + 1):
+        size = n - d
+        s, sq = suffix[d]
+        statistics.append(max(sq / size - (s / size) ** 2, 0.0) / size)
+    best = min(statistics)
+    d = next(d for d, statistic in enumerate(statistics)
+             if statistic <= best * TOLERANCE)
+    return d * batch, d < limit
+
+
+def analyse(timeseries, min_window=0) -> dict[str] | None:
+    """
+    Finds the steady-state window of a run and measures it.
+
+    :param timeseries: Points with "time", "interval", "ops/sec" and a
+                       section per operation with "Count", "Avg" and "Max".
+    :type timeseries: list[dict]
+    :param min_window: Seconds the window must last for the run to count
+                       as stable.
+    :type min_window: float
+    :return: Summary in the result section format, None when the series
+             is too short to tell.
+    :rtype: dict[str...] | None
+    """
+    points = (timeseries or [])[:-1]
+    if len(points) < 2:
+        return None
+    batch = BATCH if len(points) >= MIN_BATCHED else 1
+    throughput = [p["ops/sec"] for p in points]
+    latencies = [_latency(p) for p in points]
+    # an interval without completions has the latency of the next one
+    known = next((v for v in latencies if v is not None), 0.0)
+    for i in range(len(latencies) - 1, -1, -1):
+        if latencies[i] is None:
+            latencies[i] = known
+        known = latencies[i]
+
+    trim_throughput, settled_throughput = mser(throughput, batch)
+    trim_latency, settled_latency = mser(latencies, batch)
+    trim = max(trim_throughput, trim_latency)
+    window = points[trim:]
+
+    start = window[0]["time"] - window[0]["interval"]
+    end = window[-1]["time"]
+    duration = sum(p["interval"] for p in window)
+    operations = {}
+    for p in window:
+        for op, stats in _operations(p).items():
+            total = operations.setdefault(op, {"Operations": 0,
+                                               "AverageLatency(us)": 0.0,
+                                               "MaxLatency(us)": 0})
+            total["Operations"] += stats["Count"]
+            total["AverageLatency(us)"] += stats["Avg"] * stats["Count"]
+            total["MaxLatency(us)"] = max(total["MaxLatency(us)"],
+                                          stats.get("Max", 0))
+    for total in operations.values():
+        if total["Operations"]:
+            total["AverageLatency(us)"] /= total["Operations"]
+
+    return {
+        "Stable": (settled_throughput and settled_latency
+                   and duration >= min_window),
+        "WarmupTrimmed(s)": round(start, 3),
+        "Window(s)": [round(start, 3), round(end, 3)],
+        "Duration(s)": round(duration, 3),
+        "Throughput(ops/sec)": (sum(p["ops/sec"] * p["interval"]
+                                    for p in window) / duration),
+        "Operations": operations,
+    }
+
+
+def extended_count(operation_count, section, runtime, min_window) -> int:
+    """
+    Estimates the operations a run needs for a steady-state window of
+    min_window seconds, from a run that was too short.
+
+    :param operation_count: Operations of the last run.
+    :type operation_count: int
+    :param section: Steady-state summary of the last run, see analyse.
+    :type section: dict[str...] | None
+    :param runtime: Seconds the last run took.
+    :type runtime: float
+    :param min_window: Seconds of steady state wanted.
+    :type min_window: float
+    :return: Operations of the next run, at least twice as many when the
+             last one did not settle.
+    :rtype: int
+    """
+    if not section or not runtime:
+        return operation_count * 2
+    wanted = section["WarmupTrimmed(s)"] + min_window + (
+        runtime - section["Window(s)"][1])
+    factor = wanted * MARGIN / runtime
+    if not section["Stable"] and section["Duration(s)"] >= min_window:
+        factor = max(factor, 2)
+    return math.ceil(operation_count * max(factor, 1.5))
+
+
+def print_report(section) -> None:
+    state = "stable" if section["Stable"] else "NOT stable"
+    print(f"Steady state {section['Window(s)'][0]:.1f}s-"
+          f"{section['Window(s)'][1]:.1f}s ({state}): "
+          f"{section['Throughput(ops/sec)']:.0f} ops/sec, "
+          f"{section['WarmupTrimmed(s)']:.1f}s of warm-up trimmed")
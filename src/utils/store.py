@@ -0,0 +1,407 @@
+"""
+Results store backed by SQLite.
+
+Every benchmark run is appended as one row with its timestamp, the
+SUT/protocol/workload keys, the configuration it ran with and its metrics.
+Inserts are single transactions in WAL mode, so a crash never corrupts
+earlier runs, and the key columns are indexed so lookups stay fast as the
+history grows.
+
+The web UI in src/ still reads the flat JSON list format, export_json
+writes the latest single run of every key in that format: sweep steps,
+pipelined runs and runs with a fault are left out, their results are
+not comparable with a plain run of the same key.
+
+Usage:
+    python -m src.utils.store import data.local.json
+    python -m src.utils.store export data.json
+"""
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+RESULTS_DB = "results.local.db"
+
+# Columns that identify a configuration and can be queried on
+KEYS = ("project", "protocol", "language", "workload", "engine")
+# Runs that are no sweep step, pipelined run or run with a fault
+SINGLE_RUN = ("json_extract(config, '$.sweep') IS NULL "
+              "AND json_extract(config, '$.pipeline') IS NULL "
+              "AND json_extract(config, '$.fault') IS NULL")
+JSON_COLUMNS = ("config", "result", "timeseries", "histograms", "events",
+                "resources")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    project TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    language TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    engine TEXT NOT NULL DEFAULT 'ycsb',
+    throughput REAL,
+    runtime_ms INTEGER,
+    fingerprint TEXT,
+    config TEXT,
+    result TEXT NOT NULL,
+    timeseries TEXT,
+    histograms TEXT,
+    events TEXT,
+    resources TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_key
+    ON runs (project, protocol, workload, language, engine, timestamp);
+CREATE INDEX IF NOT EXISTS runs_protocol ON runs (protocol, timestamp);
+CREATE INDEX IF NOT EXISTS runs_workload ON runs (workload, timestamp);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    project TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    language TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    engine TEXT NOT NULL DEFAULT 'ycsb',
+    saturation REAL,
+    report TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sweeps_key
+    ON sweeps (project, protocol, workload, language, engine, timestamp);
+
+CREATE TABLE IF NOT EXISTS baselines (
+    name TEXT NOT NULL,
+    project TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    language TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    engine TEXT NOT NULL DEFAULT 'ycsb',
+    timestamp REAL NOT NULL,
+    samples TEXT NOT NULL,
+    PRIMARY KEY (name, project, protocol, workload, language, engine)
+);
+"""
+
+
+class ResultStore:
+    """
+    Append-only store of benchmark runs.
+
+    :param path: Path to the SQLite database file, created if missing.
+    :type path: str | Path
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """
+        Adds columns introduced after a store was created.
+        """
+        existing = {row["name"] for row in
+                    self.conn.execute("PRAGMA table_info(runs)")}
+        with self.conn:
+            for column in ("fingerprint", *JSON_COLUMNS):
+                if column not in existing:
+                    self.conn.execute(
+                        f"ALTER TABLE runs ADD COLUMN {column} TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS runs_fingerprint "
+                              "ON runs (fingerprint, timestamp)")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def insert(self, run) -> int:
+        """
+        Appends one run.
+
+        :param run: Run data with the KEYS, "result" and optionally
+                    "timestamp", "fingerprint" (see
+                    src/utils/fingerprint.py) and any of the other
+                    JSON_COLUMNS.
+        :type run: dict[str...]
+        :return: Id of the new row.
+        :rtype: int
+        """
+        return self.insert_many([run])[0]
+
+    def insert_many(self, runs) -> list[int]:
+        """
+        Appends several runs in a single transaction.
+
+        :param runs: Runs, see insert.
+        :type runs: Iterable[dict[str...]]
+        :rtype: list[int]
+        """
+        ids = []
+        with self.conn:
+            for run in runs:
+                overall = run["result"].get("OVERALL", {})
+                row = {
+                    "timestamp": run.get("timestamp", time.time()),
+                    "project": run["project"],
+                    "protocol": run["protocol"],
+                    "language": run["language"],
+                    "workload": run["workload"],
+                    "engine": run.get("engine", "ycsb"),
+                    "throughput": overall.get("Throughput(ops/sec)"),
+                    "runtime_ms": overall.get("RunTime(ms)"),
+                    "fingerprint": run.get("fingerprint"),
+                }
+                for column in JSON_COLUMNS:
+                    value = run.get(column)
+                    row[column] = (json.dumps(value, separators=(",", ":"))
+                                   if value is not None else None)
+
+                columns = ", ".join(row)
+                params = ", ".join(f":{c}" for c in row)
+                cur = self.conn.execute(
+                    f"INSERT INTO runs ({columns}) VALUES ({params})", row)
+                ids.append(cur.lastrowid)
+        return ids
+
+    def _where(self, filters):
+        clauses = []
+        params = []
+        for key, value in filters.items():
+            if key not in KEYS:
+                raise ValueError(f"Unknown key '{key}', expected one of "
+                                 f"{KEYS}")
+            if value is None:
+                continue
+            clauses.append(f"{key} = ?")
+            params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _decode(self, row) -> dict[str]:
+        run = dict(row)
+        for column in JSON_COLUMNS:
+            if run.get(column) is not None:
+                run[column] = json.loads(run[column])
+        return run
+
+    def query(self, since=None, until=None, limit=None,
+              **filters) -> list[dict]:
+        """
+        Returns runs matching every given key, oldest first.
+
+        Example: store.query(project="ailidani.paxi", workload="read-heavy")
+
+        :param since: Only runs at or after this Unix timestamp.
+        :type since: float | None
+        :param until: Only runs before this Unix timestamp.
+        :type until: float | None
+        :param limit: Return at most this many of the most recent runs.
+        :type limit: int | None
+        :param filters: Values for any of KEYS.
+        :rtype: list[dict[str...]]
+        """
+        where, params = self._where(filters)
+        if since is not None:
+            where += (" AND" if where else " WHERE") + " timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            where += (" AND" if where else " WHERE") + " timestamp < ?"
+            params.append(until)
+
+        sql = f"SELECT * FROM runs{where} ORDER BY timestamp DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self.conn.execute(sql, params).fetchall()
+        return [self._decode(row) for row in reversed(rows)]
+
+    def latest(self, single=False, **filters) -> list[dict]:
+        """
+        Returns the most recent run of every configuration (combination of
+        KEYS) matching filters.
+
+        :param single: Only consider SINGLE_RUN runs.
+        :type single: bool
+        :param filters: Values for any of KEYS.
+        :rtype: list[dict[str...]]
+        """
+        where, params = self._where(filters)
+        if single:
+            where += (" AND" if where else " WHERE") + f" {SINGLE_RUN}"
+        keys = ", ".join(KEYS)
+        sql = (f"SELECT * FROM runs WHERE id IN ("
+               f"SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+               f"PARTITION BY {keys} ORDER BY timestamp DESC, id DESC) AS n "
+               f"FROM runs{where}) WHERE n = 1) ORDER BY {keys}")
+        rows = self.conn.execute(sql, params).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def insert_sweep(self, sweep) -> int:
+        """
+        Appends the report of a throughput-latency sweep. The runs of its
+        steps are stored separately, the report lists their ids.
+
+        :param sweep: Sweep data with the KEYS and "report", see
+                      src/utils/sweep.py.
+        :type sweep: dict[str...]
+        :return: Id of the new row.
+        :rtype: int
+        """
+        saturation = sweep["report"].get("saturation")
+        row = {k: sweep.get(k, "ycsb" if k == "engine" else None)
+               for k in KEYS}
+        row["timestamp"] = sweep.get("timestamp", time.time())
+        row["saturation"] = saturation["throughput"] if saturation else None
+        row["report"] = json.dumps(sweep["report"], separators=(",", ":"))
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO sweeps (timestamp, project, protocol, language, "
+                "workload, engine, saturation, report) VALUES (:timestamp, "
+                ":project, :protocol, :language, :workload, :engine, "
+                ":saturation, :report)", row)
+        return cur.lastrowid
+
+    def query_sweeps(self, **filters) -> list[dict]:
+        """
+        Returns sweeps matching every given key, oldest first.
+
+        :param filters: Values for any of KEYS.
+        :rtype: list[dict[str...]]
+        """
+        where, params = self._where(filters)
+        rows = self.conn.execute(
+            f"SELECT * FROM sweeps{where} ORDER BY timestamp, id",
+            params).fetchall()
+        sweeps = []
+        for row in rows:
+            sweep = dict(row)
+            sweep["report"] = json.loads(sweep["report"])
+            sweeps.append(sweep)
+        return sweeps
+
+    def save_baseline(self, name, key, samples) -> None:
+        """
+        Saves the trial samples of a configuration under a baseline name,
+        replacing what that baseline held for it.
+
+        :param name: Baseline name, e.g. a SUT commit.
+        :type name: str
+        :param key: Values of all KEYS.
+        :type key: dict[str, str]
+        :param samples: Metric mapped to its value in every trial, see
+                        src/utils/trials.py.
+        :type samples: dict[str, list[float]]
+        """
+        row = {k: key.get(k, "ycsb" if k == "engine" else None) for k in KEYS}
+        row.update(name=name, timestamp=time.time(),
+                   samples=json.dumps(samples, separators=(",", ":")))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO baselines (name, project, protocol, "
+                "language, workload, engine, timestamp, samples) VALUES "
+                "(:name, :project, :protocol, :language, :workload, :engine, "
+                ":timestamp, :samples)", row)
+
+    def baseline(self, name, **filters) -> dict[str, list[float]] | None:
+        """
+        :param name: Baseline name given to save_baseline.
+        :type name: str
+        :param filters: Values for all KEYS.
+        :return: The samples of the configuration, None if the baseline
+                 does not hold it.
+        :rtype: dict[str, list[float]] | None
+        """
+        where, params = self._where(filters)
+        where += (" AND" if where else " WHERE") + " name = ?"
+        row = self.conn.execute(f"SELECT samples FROM baselines{where}",
+                                [*params, name]).fetchone()
+        return json.loads(row["samples"]) if row else None
+
+    def fingerprinted(self, fingerprint) -> list[dict]:
+        """
+        :param fingerprint: Key of a run fingerprint, see
+                            src/utils/fingerprint.py.
+        :type fingerprint: str
+        :return: Runs with that fingerprint, oldest first.
+        :rtype: list[dict[str...]]
+        """
+        rows = self.conn.execute(
+            "SELECT * FROM runs WHERE fingerprint = ? ORDER BY timestamp, id",
+            [fingerprint]).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def count(self, **filters) -> int:
+        where, params = self._where(filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM runs{where}",
+                                 params).fetchone()[0]
+
+    def import_json(self, path) -> int:
+        """
+        Imports runs from the legacy flat JSON list (data.local.json). The
+        file has no timestamps, so its modification time is used.
+
+        :param path: Path to the JSON file.
+        :type path: str | Path
+        :return: Number of imported runs.
+        :rtype: int
+        """
+        path = Path(path)
+        with open(path, "r") as f:
+            data = json.load(f)
+        mtime = path.stat().st_mtime
+        runs = [dict(item, timestamp=item.get("timestamp", mtime))
+                for item in data]
+        return len(self.insert_many(runs))
+
+    def export_json(self, path) -> int:
+        """
+        Writes the latest single run (see SINGLE_RUN) of every
+        configuration as a flat JSON list, the format the web UI reads.
+
+        :param path: Output path.
+        :type path: str | Path
+        :return: Number of exported runs.
+        :rtype: int
+        """
+        data = []
+        for run in self.latest(single=True):
+            data.append({
+                "project": run["project"],
+                "protocol": run["protocol"],
+                "language": run["language"],
+                "workload": run["workload"],
+                "engine": run["engine"],
+                "result": run["result"],
+            })
+        with open(path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        return len(data)
+
+
+def main(argv) -> None:
+    if len(argv) != 3 or argv[1] not in ("import", "export"):
+        print(__doc__)
+        sys.exit(1)
+
+    with ResultStore() as store:
+        if argv[1] == "import":
+            count = store.import_json(argv[2])
+            print(f"Imported {count} runs from {argv[2]} into {store.path}")
+        else:
+            count = store.export_json(argv[2])
+            print(f"Exported {count} runs from {store.path} into {argv[2]}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
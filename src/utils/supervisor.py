@@ -0,0 +1,237 @@
+"""
+Process supervisor shared by the SUT run.py scripts.
+
+A run.py creates one Supervisor at module level and spawns its replicas
+through it. Every replica runs in its own session (and process group), so
+signals reach the processes it forks too, e.g. the etcd members started
+by goreman. All replicas of all supervisors are driven by a single asyncio
+event loop in one background thread: their output is copied to a log file
+(or the console) asynchronously and their exit is noticed without a
+thread per process.
+
+A replica pinned with pin_restarts (see src/utils/isolation.py) is
+started again on the same CPUs by restart, rather than on those of the
+harness, which is pinned to the client CPUs meanwhile.
+
+stop terminates the whole cluster at once: SIGTERM goes to every process
+group, then all replicas are awaited against one shared deadline and the
+ones still running when it expires are killed.
+"""
+import asyncio
+import atexit
+from functools import partial
+import os
+import signal
+import sys
+import threading
+
+# Seconds the whole cluster gets to exit after SIGTERM
+STOP_TIMEOUT = 5
+CHUNK_SIZE = 65536
+
+_loop = None
+_loop_lock = threading.Lock()
+_supervisors = []
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="supervisor",
+                             daemon=True).start()
+    return _loop
+
+
+def _call(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+
+
+def _signal_group(pid, sig) -> None:
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class Replica:
+    """
+    One supervised process. Offers poll() and returncode like Popen, so it
+    can be passed to startup.wait_ready.
+    """
+
+    def __init__(self, name, cmd, cwd=None, env=None, log_path=None):
+        self.name = name
+        self.cmd = [str(arg) for arg in cmd]
+        self.cwd = cwd
+        self.env = env
+        self.log_path = log_path
+        self.pid = None
+        self.returncode = None
+        self.process = None
+        self.exited = None
+        # CPUs restart starts it on, see pin_restarts
+        self.cpus = None
+
+    def poll(self) -> int | None:
+        return self.returncode
+
+    def running(self) -> bool:
+        return self.pid is not None and self.returncode is None
+
+
+class Supervisor:
+    """
+    Starts, tracks and stops the replicas of one cluster.
+    """
+
+    def __init__(self):
+        self.replicas = {}
+        _supervisors.append(self)
+
+    def spawn(self, name, cmd, cwd=None, env=None, log_path=None,
+              append=False, cpus=None) -> Replica:
+        """
+        Starts a replica in its own process group.
+
+        :param name: Node name, used by pids and restart.
+        :type name: str
+        :param cmd: Command line arguments.
+        :type cmd: list
+        :param cwd: Working directory.
+        :type cwd: Path | None
+        :param env: Variables added to the environment.
+        :type env: dict[str, str] | None
+        :param log_path: File receiving stdout and stderr, the console
+                         when None.
+        :type log_path: Path | None
+        :param append: Append to the log file instead of truncating it.
+        :type append: bool
+        :param cpus: CPUs to start it on, those of the harness when None.
+        :type cpus: list[int] | None
+        :rtype: Replica
+        """
+        replica = Replica(name, cmd, cwd, env, log_path)
+        replica.cpus = cpus
+        print(f"Starting: {' '.join(replica.cmd)}")
+        _call(self._spawn(replica, append))
+        self.replicas[name] = replica
+        return replica
+
+    async def _spawn(self, replica, append) -> None:
+        env = None
+        if replica.env:
+            env = {**os.environ, **replica.env}
+        pin = None
+        if replica.cpus is not None:
+            pin = partial(os.sched_setaffinity, 0, replica.cpus)
+        replica.process = await asyncio.create_subprocess_exec(
+            *replica.cmd, cwd=replica.cwd, env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True, preexec_fn=pin)
+        replica.pid = replica.process.pid
+        log = None
+        if replica.log_path is not None:
+            log = open(replica.log_path, "ab" if append else "wb")
+        replica.exited = asyncio.ensure_future(self._follow(replica, log))
+
+    async def _follow(self, replica, log) -> None:
+        """
+        Copies the output of a replica until it exits.
+        """
+        sink = log or sys.stdout.buffer
+        try:
+            while chunk := await replica.process.stdout.read(CHUNK_SIZE):
+                sink.write(chunk)
+                sink.flush()
+        finally:
+            if log:
+                log.close()
+            replica.returncode = await replica.process.wait()
+
+    def pids(self) -> dict[str, int]:
+        """
+        :return: Node name mapped to the pid of every running replica.
+        :rtype: dict[str, int]
+        """
+        return {name: replica.pid for name, replica in self.replicas.items()
+                if replica.running()}
+
+    def command(self, name) -> list[str]:
+        return self.replicas[name].cmd
+
+    def restart(self, name) -> Replica:
+        """
+        Starts a replica again with the command it last ran, appending to
+        its log file, on the CPUs it was pinned to.
+
+        :param name: Node name given to spawn.
+        :type name: str
+        :rtype: Replica
+        """
+        old = self.replicas[name]
+        if old.running():
+            raise RuntimeError(f"{name} is still running")
+        return self.spawn(name, old.cmd, old.cwd, old.env, old.log_path,
+                          append=True, cpus=old.cpus)
+
+    def stop(self, timeout=STOP_TIMEOUT) -> None:
+        """
+        Terminates every replica concurrently: SIGTERM to all process
+        groups, then SIGKILL to whatever is left at the deadline.
+
+        :param timeout: Seconds the whole cluster gets to exit.
+        :type timeout: float
+        """
+        if self.replicas:
+            _call(self._stop(timeout))
+        self.replicas.clear()
+
+    async def _stop(self, timeout) -> None:
+        running = [r for r in self.replicas.values() if r.running()]
+        for replica in running:
+            print(f"Terminating: {' '.join(replica.cmd)}")
+            _signal_group(replica.pid, signal.SIGTERM)
+            # a replica frozen by the fault injector must run to exit
+            _signal_group(replica.pid, signal.SIGCONT)
+        if not running:
+            return
+
+        _, pending = await asyncio.wait([r.exited for r in running],
+                                        timeout=timeout)
+        for replica in running:
+            if replica.exited in pending:
+                print(f"Force killing: {' '.join(replica.cmd)}")
+                _signal_group(replica.pid, signal.SIGKILL)
+        if pending:
+            await asyncio.wait(pending)
+        # children of a replica that exited on SIGTERM may linger
+        for replica in running:
+            _signal_group(replica.pid, signal.SIGKILL)
+
+
+def pin_restarts(pid, cpus) -> None:
+    """
+    Makes restart start the replica running as pid on cpus; nothing to
+    do for processes no supervisor spawned, e.g. the members goreman
+    starts.
+
+    :param pid: Process id of a running replica.
+    :type pid: int
+    :param cpus: CPUs the replica is pinned to, None to unpin.
+    :type cpus: list[int] | None
+    """
+    for supervisor in _supervisors:
+        for replica in supervisor.replicas.values():
+            if replica.pid == pid:
+                replica.cpus = cpus
+
+
+@atexit.register
+def _stop_all() -> None:
+    # Replicas do not share the terminal's process group, so Ctrl-C no
+    # longer reaches them; leave no cluster behind on exit
+    for supervisor in _supervisors:
+        supervisor.stop()
@@ -0,0 +1,146 @@
+"""
+Throughput-latency sweeps.
+
+A sweep runs the same workload at increasing offered load (YCSB -target or
+the native generator's rate). After each step the achieved throughput and
+latency percentiles are recorded, and the sweep stops as soon as latency
+diverges, the SUT can no longer keep up with the offered load, or errors
+appear. The saturation point is the highest throughput reached while p99
+stays under the latency SLO.
+"""
+from src.utils import histogram
+
+START_RATE = 500
+MAX_RATE = 200000
+GROWTH = 1.5
+SLO_US = 10000
+# p99 above KNEE_FACTOR x the lowest p99 seen so far means latency diverges
+KNEE_FACTOR = 3.0
+# Achieved throughput below (1 - SHORTFALL) x offered means saturation
+SHORTFALL = 0.1
+
+
+def offered_loads(start=START_RATE, maximum=MAX_RATE, growth=GROWTH):
+    """
+    Geometric sequence of offered loads.
+
+    :param start: First rate in ops/sec.
+    :type start: float
+    :param maximum: Last rate is at most this.
+    :type maximum: float
+    :param growth: Ratio between two consecutive rates.
+    :type growth: float
+    :rtype: Iterator[int]
+    """
+    rate = start
+    while rate <= maximum:
+        yield int(rate)
+        rate *= growth
+
+
+def measure(result, histograms, offered) -> dict[str]:
+    """
+    Reduces the result of one step to a curve point. Latencies come from the
+    merged histogram of every operation, using response times (Intended-*)
+    when the engine reports them. Throughput is that of the steady-state
+    window when the run settled, see src/utils/steady.py.
+
+    :param result: Result in the shape of parse_ycsb_output.
+    :type result: dict[str, dict]
+    :param histograms: Encoded histogram per section.
+    :type histograms: dict[str, str]
+    :param offered: Target rate of the step.
+    :type offered: float
+    :rtype: dict[str, float]
+    """
+    intended = [v for k, v in histograms.items() if k.startswith("Intended-")]
+    merged = histogram.merge(intended or histograms.values())
+
+    errors = 0
+    for section, stats in result.items():
+        for key, value in stats.items():
+            if key.startswith("Return=") and key != "Return=OK":
+                errors += value
+
+    throughput = result.get("OVERALL", {}).get("Throughput(ops/sec)", 0.0)
+    window = result.get("STEADY_STATE")
+    if window and window["Stable"]:
+        throughput = window["Throughput(ops/sec)"]
+
+    return {
+        "offered": offered,
+        "throughput": throughput,
+        "p50": merged.value_at_percentile(50),
+        "p99": merged.value_at_percentile(99),
+        "p99.9": merged.value_at_percentile(99.9),
+        "errors": errors,
+    }
+
+
+def stop_reason(points) -> str | None:
+    """
+    :param points: Curve points so far, see measure.
+    :type points: list[dict]
+    :return: Why the sweep should stop after the last point, or None.
+    :rtype: str | None
+    """
+    last = points[-1]
+    if last["errors"]:
+        return f"{last['errors']} errors at {last['offered']} ops/sec"
+    if last["throughput"] < (1 - SHORTFALL) * last["offered"]:
+        return (f"achieved {last['throughput']:.0f} of "
+                f"{last['offered']} ops/sec offered")
+    best = min(p["p99"] for p in points)
+    if best and last["p99"] > KNEE_FACTOR * best:
+        return f"p99 {last['p99']}us diverged from {best}us"
+    return None
+
+
+def analyse(points, slo_us=SLO_US, stopped=None) -> dict[str]:
+    """
+    Finds the saturation point and the knee of the curve.
+
+    :param points: Curve points, see measure.
+    :type points: list[dict]
+    :param slo_us: p99 latency SLO in microseconds.
+    :type slo_us: int
+    :param stopped: Reason the sweep stopped, if it did.
+    :type stopped: str | None
+    :return: {saturation, knee, slo_us, stopped, points}, where saturation
+             and knee are curve points (or None).
+    :rtype: dict[str...]
+    """
+    within_slo = [p for p in points if p["p99"] <= slo_us and not p["errors"]]
+    saturation = max(within_slo, key=lambda p: p["throughput"], default=None)
+
+    # The knee is the last point before latency or throughput diverged
+    knee = None
+    for i in range(len(points)):
+        if stop_reason(points[:i + 1]):
+            break
+        knee = points[i]
+
+    return {
+        "saturation": saturation,
+        "knee": knee,
+        "slo_us": slo_us,
+        "stopped": stopped,
+        "points": points,
+    }
+
+
+def print_report(report) -> None:
+    print(f"{'offered':>10} {'achieved':>10} {'p50(us)':>9} "
+          f"{'p99(us)':>9} {'p99.9(us)':>10} {'errors':>7}")
+    for p in report["points"]:
+        print(f"{p['offered']:>10} {p['throughput']:>10.0f} {p['p50']:>9} "
+              f"{p['p99']:>9} {p['p99.9']:>10} {p['errors']:>7}")
+    if report["stopped"]:
+        print(f"Stopped: {report['stopped']}")
+    if report["saturation"]:
+        print(f"Saturation: {report['saturation']['throughput']:.0f} ops/sec "
+              f"with p99 <= {report['slo_us']}us")
+    else:
+        print(f"No step met the p99 <= {report['slo_us']}us SLO")
+    if report["knee"]:
+        print(f"Knee: {report['knee']['offered']} ops/sec offered")
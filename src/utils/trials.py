@@ -0,0 +1,198 @@
+"""
+Repeated trials and regression detection against baselines.
+
+With trials = K, every cell is run K times, each time on a freshly started
+(or restored) cluster, and every trial is stored as its own run with
+config["trials"] = {group, index, of}. The trials of a cell are reduced
+to samples of throughput and latency percentiles, one value per trial,
+summarised by their mean and a Student t confidence interval.
+
+A baseline is a named set of samples per configuration, saved in the
+results store. Comparing against it uses Welch's t-test, which does not
+assume both sides have the same variance: a change is only reported as a
+regression or an improvement when it is significant at ALPHA, so a 5%
+throughput difference within the noise of the trials is "no change".
+"""
+import math
+import statistics
+
+from src.utils import sweep
+
+CONFIDENCE = 0.95
+ALPHA = 0.05
+# Metrics compared between trials and baselines, see sweep.measure
+METRICS = ("throughput", "p50", "p99", "p99.9")
+HIGHER_IS_BETTER = {"throughput"}
+
+
+def _betacf(a, b, x) -> float:
+    """
+    Continued fraction of the incomplete beta function (modified Lentz).
+    """
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        for numerator in (m * (b - m) * x / ((a + m2 - 1) * (a + m2)),
+                          -(a + m) * (a + b + m) * x
+                          / ((a + m2) * (a + m2 + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a, b, x) -> float:
+    """
+    Regularized incomplete beta function I_x(a, b).
+    """
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def t_pvalue(t, df) -> float:
+    """
+    :return: Two-sided p-value of t under Student's t with df degrees of
+             freedom.
+    :rtype: float
+    """
+    if math.isinf(t):
+        return 0.0
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def t_quantile(confidence, df) -> float:
+    """
+    :return: t such that P(|T| <= t) = confidence, by bisection.
+    :rtype: float
+    """
+    low, high = 0.0, 1e3
+    for _ in range(200):
+        mid = (low + high) / 2
+        if t_pvalue(mid, df) > 1 - confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def summarize(values, confidence=CONFIDENCE) -> dict[str, float]:
+    """
+    :param values: One value per trial.
+    :type values: list[float]
+    :return: n, mean, stdev and the confidence interval of the mean
+             (ci_low, ci_high), which collapses to the mean with one trial.
+    :rtype: dict[str, float]
+    """
+    n = len(values)
+    mean = statistics.fmean(values)
+    stdev = statistics.stdev(values) if n > 1 else 0.0
+    margin = 0.0
+    if n > 1:
+        margin = t_quantile(confidence, n - 1) * stdev / math.sqrt(n)
+    return {"n": n, "mean": mean, "stdev": stdev,
+            "ci_low": mean - margin, "ci_high": mean + margin}
+
+
+def welch(a, b) -> tuple[float, float, float]:
+    """
+    Welch's unequal variances t-test of mean(b) - mean(a).
+
+    :return: t statistic, degrees of freedom and two-sided p-value.
+    :rtype: tuple[float, float, float]
+    """
+    va = statistics.variance(a) / len(a)
+    vb = statistics.variance(b) / len(b)
+    diff = statistics.fmean(b) - statistics.fmean(a)
+    if va + vb == 0:
+        return (0.0 if diff == 0 else math.copysign(math.inf, diff),
+                len(a) + len(b) - 2, 1.0 if diff == 0 else 0.0)
+    t = diff / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (va ** 2 / (len(a) - 1) + vb ** 2 / (len(b) - 1))
+    return t, df, t_pvalue(t, df)
+
+
+def samples(runs) -> dict[str, list[float]]:
+    """
+    :param runs: Stored runs of the trials, with "result" and "histograms".
+    :type runs: list[dict]
+    :return: Every metric of METRICS mapped to its value in every trial.
+    :rtype: dict[str, list[float]]
+    """
+    points = [sweep.measure(run["result"], run["histograms"] or {}, None)
+              for run in runs]
+    return {metric: [float(p[metric]) for p in points] for metric in METRICS}
+
+
+def compare(baseline, current, alpha=ALPHA) -> dict[str, dict]:
+    """
+    Compares the samples of the current trials against a baseline.
+
+    :param baseline: Baseline samples, see samples.
+    :type baseline: dict[str, list[float]]
+    :param current: Samples of the current trials.
+    :type current: dict[str, list[float]]
+    :param alpha: Significance level.
+    :type alpha: float
+    :return: Every metric mapped to its baseline and current means, the
+             relative change, the p-value and a verdict: "regression",
+             "improvement", "no change" or "too few trials".
+    :rtype: dict[str, dict]
+    """
+    comparison = {}
+    for metric in METRICS:
+        a, b = baseline.get(metric, []), current.get(metric, [])
+        if not a or not b:
+            continue
+        before, after = statistics.fmean(a), statistics.fmean(b)
+        entry = {"baseline": before, "current": after,
+                 "change": (after - before) / before if before else None,
+                 "p": None, "verdict": "too few trials"}
+        if len(a) > 1 and len(b) > 1:
+            _, _, entry["p"] = welch(a, b)
+            if entry["p"] >= alpha or after == before:
+                entry["verdict"] = "no change"
+            elif (after > before) == (metric in HIGHER_IS_BETTER):
+                entry["verdict"] = "improvement"
+            else:
+                entry["verdict"] = "regression"
+        comparison[metric] = entry
+    return comparison
+
+
+def print_report(summary, comparison=None) -> None:
+    """
+    :param summary: Every metric mapped to its summarize output.
+    :type summary: dict[str, dict]
+    :param comparison: See compare.
+    :type comparison: dict[str, dict] | None
+    """
+    print(f"{'metric':<12} {'mean':>12} {f'{CONFIDENCE:.0%} CI':>25} "
+          f"{'stdev':>10}")
+    for metric, s in summary.items():
+        interval = f"[{s['ci_low']:.1f}, {s['ci_high']:.1f}]"
+        print(f"{metric:<12} {s['mean']:>12.1f} {interval:>25} "
+              f"{s['stdev']:>10.1f}")
+    if not comparison:
+        return
+    print(f"\n{'metric':<12} {'baseline':>12} {'current':>12} {'change':>8} "
+          f"{'p':>7}  verdict")
+    for metric, c in comparison.items():
+        change = f"{c['change']:+.1%}" if c["change"] is not None else "-"
+        p = f"{c['p']:.3f}" if c["p"] is not None else "-"
+        print(f"{metric:<12} {c['baseline']:>12.1f} {c['current']:>12.1f} "
+              f"{change:>8} {p:>7}  {c['verdict']}")
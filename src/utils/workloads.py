@@ -0,0 +1,415 @@
+"""
+Workload library: key distributions, operation mixes, value sizes and
+conflict rates, with operation streams precomputed by NumPy.
+
+A workload spec is a dict (or a TOML file under WORKLOAD_DIR, named after
+its stem)::
+
+    recordcount = 10000
+    operationcount = 100000
+    mix = { read = 0.5, update = 0.3, rmw = 0.2 }  # also insert, scan
+    keys = { distribution = "zipfian", theta = 1.2 }
+    values = { distribution = "uniform", min = 64, max = 1024 }
+    conflict = 0.25                 # omitted: no client key partitioning
+    conflict_keys = 16
+
+Key distributions:
+- uniform
+- zipfian: any theta (YCSB fixes 0.99), scrambled over the key space
+  unless scramble = false
+- hotspot: hot_fraction of the keys get hot_ops of the operations
+- latest: zipfian over the most recently inserted keys
+- normal: mu and sigma in keys, as in paxi's benchmark config
+- moving: normal whose mean moves speed keys every 1000 operations, like
+  paxi's Move/Speed
+
+Value sizes: constant (size), uniform (min, max), normal (mean, sigma) or
+zipfian (min, max, theta), in bytes.
+
+With conflict set, every client owns a private slice of the key space and
+a fraction conflict of its operations goes to the conflict_keys keys all
+clients share, as paxi's Conflicts does: conflict 0 has clients never
+touch the same key, conflict 1 has them all fight over a few. This is the
+contention that separates leaderless protocols (EPaxos...) from
+leader-based ones.
+
+Every client's stream of (operation, key, value size) is sampled in one
+vectorized pass and cached in STREAM_DIR under a hash of the spec, client
+and seed, so every SUT and every repetition replays the same operations.
+For YCSB, property_file writes the equivalent CoreWorkload properties;
+what YCSB cannot express (see ycsb_unsupported) needs the native engine,
+which reads the spec back from the property file.
+"""
+import functools
+import hashlib
+import json
+import os
+import struct
+import tomllib
+from pathlib import Path
+
+WORKLOAD_DIR = Path("plans/workloads")
+GENERATED_DIR = Path("workloads.local")
+STREAM_DIR = Path("streams.local")
+# Property of the generated file holding the spec, for the native engine
+SPEC_PROPERTY = "distrobench.spec"
+
+READ = "READ"
+UPDATE = "UPDATE"
+INSERT = "INSERT"
+READ_MODIFY_WRITE = "READ-MODIFY-WRITE"
+SCAN = "SCAN"
+OPERATIONS = (READ, UPDATE, INSERT, READ_MODIFY_WRITE, SCAN)
+MIX_KEYS = {"read": READ, "update": UPDATE, "insert": INSERT,
+            "rmw": READ_MODIFY_WRITE, "scan": SCAN}
+
+MAGIC = b"DBOPS\0\0\0"
+VERSION = 1
+# magic, version, record count
+HEADER = struct.Struct("<8sIQ")
+# op, value size, key
+FIELDS = [("op", "u1"), ("pad", "V3"), ("size", "<u4"), ("key", "<u8")]
+# Odd multiplier of the scrambling permutation, see _scramble
+SCRAMBLE = 2654435761
+
+DEFAULTS = {
+    "recordcount": 1000,
+    "operationcount": 1000,
+    "mix": {"read": 0.95, "update": 0.05},
+    "keys": {"distribution": "uniform"},
+    "values": {"distribution": "constant", "size": 100},
+    "conflict": None,
+    "conflict_keys": 16,
+    "maxscanlength": 100,
+    "seed": 0,
+}
+
+LIBRARY = {
+    "uniform-50": {"mix": {"read": 0.5, "update": 0.5}},
+    "zipfian-0.99": {"mix": {"read": 0.5, "update": 0.5},
+                     "keys": {"distribution": "zipfian", "theta": 0.99}},
+    "zipfian-1.2": {"mix": {"read": 0.5, "update": 0.5},
+                    "keys": {"distribution": "zipfian", "theta": 1.2}},
+    "hotspot": {"mix": {"read": 0.5, "update": 0.5},
+                "keys": {"distribution": "hotspot", "hot_fraction": 0.01,
+                         "hot_ops": 0.9}},
+    "latest": {"mix": {"read": 0.9, "insert": 0.1},
+               "keys": {"distribution": "latest"}},
+    "moving": {"mix": {"read": 0.5, "update": 0.5},
+               "keys": {"distribution": "moving", "sigma": 50,
+                        "speed": 10}},
+    "rmw": {"mix": {"read": 0.5, "rmw": 0.5},
+            "keys": {"distribution": "zipfian", "theta": 0.99}},
+    "scan": {"mix": {"scan": 0.95, "insert": 0.05},
+             "keys": {"distribution": "zipfian", "theta": 0.99}},
+    "large-values": {"mix": {"read": 0.5, "update": 0.5},
+                     "values": {"distribution": "uniform", "min": 1024,
+                                "max": 65536}},
+    **{f"contention-{percent}": {"mix": {"read": 0.5, "update": 0.5},
+                                 "conflict": percent / 100}
+       for percent in (0, 10, 25, 50, 100)},
+}
+
+
+def names() -> list[str]:
+    """
+    :return: Names of the library workloads and of the TOML specs in
+             WORKLOAD_DIR.
+    :rtype: list[str]
+    """
+    files = sorted(p.stem for p in WORKLOAD_DIR.glob("*.toml"))
+    return [*LIBRARY, *(name for name in files if name not in LIBRARY)]
+
+
+def spec(name) -> dict[str]:
+    """
+    :param name: Library workload or TOML spec name, see names.
+    :type name: str
+    :return: The spec with every default filled in.
+    :rtype: dict[str...]
+    :raises ValueError: On unknown names, operations or distributions.
+    """
+    path = WORKLOAD_DIR / f"{name}.toml"
+    if path.exists():
+        with open(path, "rb") as f:
+            overrides = tomllib.load(f)
+    elif name in LIBRARY:
+        overrides = LIBRARY[name]
+    else:
+        raise ValueError(f"Unknown workload '{name}'")
+    full = {**DEFAULTS, **overrides}
+    unknown = set(full["mix"]) - set(MIX_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {', '.join(unknown)}")
+    return full
+
+
+def ycsb_unsupported(full) -> list[str]:
+    """
+    :param full: Spec, see spec.
+    :type full: dict[str...]
+    :return: Features of the spec YCSB's CoreWorkload cannot run.
+    :rtype: list[str]
+    """
+    keys, values = full["keys"], full["values"]
+    unsupported = []
+    if keys["distribution"] in ("normal", "moving"):
+        unsupported.append(f"{keys['distribution']} key distribution")
+    if keys["distribution"] in ("zipfian", "latest") and \
+            keys.get("theta", 0.99) != 0.99:
+        unsupported.append("zipfian theta other than 0.99")
+    if not keys.get("scramble", True):
+        unsupported.append("unscrambled zipfian keys")
+    if values["distribution"] == "normal":
+        unsupported.append("normal value sizes")
+    if full["conflict"] is not None:
+        unsupported.append("conflict rate")
+    return unsupported
+
+
+def ycsb_properties(full) -> dict[str, str]:
+    """
+    :param full: Spec, see spec.
+    :type full: dict[str...]
+    :return: CoreWorkload properties of the spec, as close as YCSB allows.
+    :rtype: dict[str, str]
+    """
+    total = sum(full["mix"].values())
+    props = {
+        "workload": "site.ycsb.workloads.CoreWorkload",
+        "recordcount": full["recordcount"],
+        "operationcount": full["operationcount"],
+        "fieldcount": 1,
+        "maxscanlength": full["maxscanlength"],
+    }
+    for key in MIX_KEYS:
+        name = "readmodifywrite" if key == "rmw" else key
+        props[f"{name}proportion"] = full["mix"].get(key, 0) / total
+
+    keys = full["keys"]
+    distribution = keys["distribution"]
+    props["requestdistribution"] = (
+        distribution if distribution in ("uniform", "zipfian", "hotspot",
+                                         "latest") else "uniform")
+    if distribution == "hotspot":
+        props["hotspotdatafraction"] = keys.get("hot_fraction", 0.2)
+        props["hotspotopnfraction"] = keys.get("hot_ops", 0.8)
+
+    values = full["values"]
+    if values["distribution"] == "constant":
+        props["fieldlength"] = values["size"]
+        props["fieldlengthdistribution"] = "constant"
+    elif values["distribution"] == "normal":
+        props["fieldlength"] = int(values["mean"])
+        props["fieldlengthdistribution"] = "constant"
+    else:
+        props["minfieldlength"] = values.get("min", 1)
+        props["fieldlength"] = values["max"]
+        props["fieldlengthdistribution"] = values["distribution"]
+    return {k: str(v) for k, v in props.items()}
+
+
+def property_file(name) -> Path:
+    """
+    Writes the YCSB property file of a workload, which also carries the
+    spec for the native engine.
+
+    :param name: Workload name, see names.
+    :type name: str
+    :return: Absolute path of the file, named after the workload.
+    :rtype: Path
+    """
+    full = spec(name)
+    GENERATED_DIR.mkdir(exist_ok=True)
+    path = GENERATED_DIR / name
+    lines = [f"# Generated from the '{name}' workload, see "
+             f"src/utils/workloads.py"]
+    lines += [f"{k}={v}" for k, v in ycsb_properties(full).items()]
+    lines.append(f"{SPEC_PROPERTY}={json.dumps(full, sort_keys=True)}")
+    path.write_text("\n".join(lines) + "\n")
+    return path.resolve()
+
+
+@functools.lru_cache(maxsize=8)
+def _zipf_cdf(items, theta):
+    import numpy as np
+    weights = np.arange(1, items + 1, dtype=np.float64) ** -theta
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def _zipf(rng, items, theta, size):
+    """
+    :return: Zipfian ranks in [0, items), rank 0 the most popular, by
+             inverting the CDF: works for any theta, unlike YCSB's
+             approximation which needs theta < 1.
+    """
+    import numpy as np
+    ranks = np.searchsorted(_zipf_cdf(items, theta), rng.random(size))
+    return np.minimum(ranks, items - 1).astype(np.uint64)
+
+
+def _scramble(ranks, items):
+    """
+    Spreads popular ranks over the key space, as YCSB's
+    ScrambledZipfianGenerator does, with a bijection of [0, items).
+    """
+    import numpy as np
+    if items % SCRAMBLE == 0:
+        return ranks
+    return (ranks * np.uint64(SCRAMBLE)) % np.uint64(items)
+
+
+def sample_keys(rng, keys, items, size, inserted=None):
+    """
+    :param rng: NumPy generator.
+    :type rng: np.random.Generator
+    :param keys: Key distribution of the spec.
+    :type keys: dict[str...]
+    :param items: Keys to choose from, [0, items).
+    :type items: int
+    :param size: Number of keys.
+    :type size: int
+    :param inserted: Keys inserted before every operation, for latest.
+    :type inserted: np.ndarray | None
+    :rtype: np.ndarray
+    """
+    import numpy as np
+    distribution = keys["distribution"]
+    if distribution == "uniform":
+        return rng.integers(0, items, size, dtype=np.uint64)
+    if distribution == "zipfian":
+        ranks = _zipf(rng, items, keys.get("theta", 0.99), size)
+        return _scramble(ranks, items) if keys.get("scramble", True) else ranks
+    if distribution == "latest":
+        ranks = _zipf(rng, items, keys.get("theta", 0.99), size)
+        newest = items - 1 + (inserted if inserted is not None else 0)
+        return np.maximum(newest - ranks.astype(np.int64), 0).astype(np.uint64)
+    if distribution == "hotspot":
+        hot = max(1, int(items * keys.get("hot_fraction", 0.2)))
+        is_hot = rng.random(size) < keys.get("hot_ops", 0.8)
+        cold = rng.integers(hot, max(items, hot + 1), size)
+        return np.where(is_hot, rng.integers(0, hot, size),
+                        np.minimum(cold, items - 1)).astype(np.uint64)
+    if distribution in ("normal", "moving"):
+        mu = keys.get("mu", items / 2)
+        sigma = keys.get("sigma", items / 20)
+        if distribution == "moving":
+            mu = mu + keys.get("speed", 10) * np.arange(size) / 1000
+        drawn = np.rint(rng.normal(mu, sigma, size)).astype(np.int64)
+        if distribution == "moving":
+            return (drawn % items).astype(np.uint64)
+        return np.clip(drawn, 0, items - 1).astype(np.uint64)
+    raise ValueError(f"Unknown key distribution '{distribution}'")
+
+
+def sample_sizes(rng, values, size):
+    """
+    :param rng: NumPy generator.
+    :type rng: np.random.Generator
+    :param values: Value size distribution of the spec.
+    :type values: dict[str...]
+    :param size: Number of values.
+    :type size: int
+    :return: Value sizes in bytes, at least 1.
+    :rtype: np.ndarray
+    """
+    import numpy as np
+    distribution = values["distribution"]
+    if distribution == "constant":
+        sizes = np.full(size, values["size"])
+    elif distribution == "uniform":
+        sizes = rng.integers(values.get("min", 1), values["max"] + 1, size)
+    elif distribution == "normal":
+        sizes = np.rint(rng.normal(values["mean"], values.get("sigma", 0),
+                                   size))
+    elif distribution == "zipfian":
+        low = values.get("min", 1)
+        sizes = low + _zipf(rng, values["max"] - low + 1,
+                            values.get("theta", 0.99), size).astype(np.int64)
+    else:
+        raise ValueError(f"Unknown value size distribution '{distribution}'")
+    return np.maximum(sizes, 1).astype(np.uint32)
+
+
+def generate(full, client=0, clients=1):
+    """
+    Samples the operation stream of one client.
+
+    :param full: Spec, see spec.
+    :type full: dict[str...]
+    :param client: Index of the client.
+    :type client: int
+    :param clients: Number of clients running the workload together.
+    :type clients: int
+    :return: Structured array of op (index in OPERATIONS), size and key.
+    :rtype: np.ndarray
+    """
+    import numpy as np
+    count = int(full["operationcount"])
+    records = int(full["recordcount"])
+    rng = np.random.default_rng([full["seed"], client])
+    stream = np.zeros(count, dtype=np.dtype(FIELDS))
+
+    mix = full["mix"]
+    ops = [OPERATIONS.index(MIX_KEYS[k]) for k in mix]
+    weights = np.array([mix[k] for k in mix], dtype=np.float64)
+    stream["op"] = rng.choice(ops, count, p=weights / weights.sum())
+    stream["size"] = sample_sizes(rng, full["values"], count)
+
+    inserts = stream["op"] == OPERATIONS.index(INSERT)
+    # inserts of all clients interleave above the loaded keys
+    inserted = np.cumsum(inserts) - inserts
+    keys = full["keys"]
+    if full["conflict"] is None:
+        chosen = sample_keys(rng, keys, records, count,
+                             inserted * clients + client)
+    else:
+        shared = min(int(full["conflict_keys"]), records)
+        private = max((records - shared) // clients, 1)
+        own = shared + client * private + sample_keys(
+            rng, keys, private, count, inserted)
+        conflicting = rng.random(count) < full["conflict"]
+        chosen = np.where(conflicting,
+                          rng.integers(0, shared, count, dtype=np.uint64),
+                          np.minimum(own, records - 1))
+    stream["key"] = np.where(
+        inserts, records + inserted * clients + client, chosen)
+    return stream
+
+
+def stream_path(full, client=0, clients=1) -> Path:
+    digest = hashlib.sha256(json.dumps(
+        [full, client, clients, VERSION], sort_keys=True).encode())
+    return STREAM_DIR / f"{digest.hexdigest()[:24]}.ops"
+
+
+def stream(full, client=0, clients=1):
+    """
+    Maps the cached stream of a client, generating it the first time.
+
+    :param full: Spec, see spec.
+    :type full: dict[str...]
+    :param client: Index of the client.
+    :type client: int
+    :param clients: Number of clients running the workload together.
+    :type clients: int
+    :return: See generate.
+    :rtype: np.ndarray
+    """
+    import numpy as np
+    path = stream_path(full, client, clients)
+    if not path.exists():
+        STREAM_DIR.mkdir(exist_ok=True)
+        records = generate(full, client, clients)
+        partial = path.with_suffix(f".{os.getpid()}.part")
+        with open(partial, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(records)))
+            records.tofile(f)
+        partial.replace(path)
+    with open(path, "rb") as f:
+        magic, version, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} stream file")
+    return np.memmap(path, dtype=np.dtype(FIELDS), mode="r",
+                     offset=HEADER.size, shape=(count,))
@@ -0,0 +1,205 @@
+"""
+Helpers to run the YCSB binary and consume its output while it runs.
+
+With ``-s`` YCSB prints a status line on stderr every ``status.interval``
+seconds, e.g.::
+
+    2025-01-01 10:00:03:120 3 sec: 2087 operations; 695.67 current ops/sec;
+    est completion in 2 second [READ: Count=660, Max=39871, Min=703,
+    Avg=1368.65, 90=1911, 99=2847, 99.9=39871, 99.99=39871]
+
+Those lines are parsed into a time series as they arrive, while the final
+``[SECTION], key, value`` summary lines are kept for parse_ycsb_output.
+"""
+import re
+import subprocess
+
+STATUS_INTERVAL = 1
+MAX_POINTS = 3600
+SKIPPED = ("[INFO]", "[DEBUG]", "[WARNING]")
+
+STATUS_RE = re.compile(
+    r"(?P<sec>\d+) sec: (?P<ops>\d+) operations; "
+    r"(?P<rate>[\d.,]+|\?) current ops/sec;(?P<rest>.*)$")
+SECTION_RE = re.compile(r"\[([\w-]+): ([^\]]*)\]")
+LEGACY_SECTION_RE = re.compile(r"\[([\w-]+) AverageLatency\(us\)=([\d.]+)\]")
+
+
+def _number(text):
+    text = text.replace(",", "")
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_status_line(line) -> dict[str] | None:
+    """
+    Parses one YCSB status line.
+
+    :param line: A line of YCSB output.
+    :type line: str
+    :return: The interval data point, or None if line is not a status line.
+             Example: {"time": 3, "operations": 2087, "ops/sec": 695.67,
+             "READ": {"Count": 660, "Avg": 1368.65, "99": 2847, ...}}
+    :rtype: dict[str...] | None
+    """
+    match = STATUS_RE.search(line)
+    if not match:
+        return None
+
+    rate = match.group("rate")
+    point = {
+        "time": int(match.group("sec")),
+        "operations": int(match.group("ops")),
+        "ops/sec": 0.0 if rate == "?" else float(rate.replace(",", "")),
+    }
+
+    rest = match.group("rest")
+    for section, body in SECTION_RE.findall(rest):
+        stats = {}
+        for pair in body.split(","):
+            key, _, value = pair.strip().partition("=")
+            if not value:
+                continue
+            try:
+                stats[key] = _number(value)
+            except ValueError:
+                pass
+        point[section] = stats
+    for section, avg in LEGACY_SECTION_RE.findall(rest):
+        point[section] = {"Avg": float(avg)}
+
+    return point
+
+
+def _merge_points(a, b) -> dict[str]:
+    """
+    Merges two consecutive data points into one covering both intervals.
+    Counts add up and averages are count-weighted; percentiles cannot be
+    merged exactly from summaries, so the larger one is kept.
+    """
+    dt_a = a.get("interval", 1)
+    dt_b = b.get("interval", 1)
+    merged = {
+        "time": b["time"],
+        "interval": dt_a + dt_b,
+        "operations": b["operations"],
+        "ops/sec": (a["ops/sec"] * dt_a + b["ops/sec"] * dt_b) / (dt_a + dt_b),
+    }
+    for section in set(a) | set(b):
+        if not isinstance(a.get(section, b.get(section)), dict):
+            continue
+        sa, sb = a.get(section, {}), b.get(section, {})
+        ca, cb = sa.get("Count", 0), sb.get("Count", 0)
+        stats = {}
+        for key in set(sa) | set(sb):
+            va, vb = sa.get(key), sb.get(key)
+            if va is None or vb is None:
+                stats[key] = vb if va is None else va
+            elif key in ("Count", "Errors"):
+                stats[key] = va + vb
+            elif key == "Min":
+                stats[key] = min(va, vb)
+            elif key == "Avg" and ca + cb:
+                stats[key] = (va * ca + vb * cb) / (ca + cb)
+            else:
+                stats[key] = max(va, vb)
+        merged[section] = stats
+    return merged
+
+
+class TimeSeries:
+    """
+    Per-interval data points of one run with bounded memory. Once
+    max_points is reached, adjacent points are merged pairwise so the whole
+    run stays covered at half the resolution.
+
+    :param max_points: Maximum number of points kept.
+    :type max_points: int
+    """
+
+    def __init__(self, max_points=MAX_POINTS):
+        self.max_points = max_points
+        self.points = []
+
+    def append(self, point) -> None:
+        if self.points:
+            # the last status line can come after a shorter interval
+            point.setdefault("interval",
+                             max(1, point["time"] - self.points[-1]["time"]))
+        else:
+            point.setdefault("interval", max(1, point["time"]))
+        self.points.append(point)
+
+        if len(self.points) > self.max_points:
+            pairs = zip(self.points[0::2], self.points[1::2])
+            compacted = [_merge_points(a, b) for a, b in pairs]
+            if len(self.points) % 2:
+                compacted.append(self.points[-1])
+            self.points = compacted
+
+    def to_list(self) -> list[dict]:
+        return self.points
+
+
+def histogram_args(directory) -> list[str]:
+    """
+    YCSB properties that record every operation in an HdrHistogram and
+    write the interval logs as <directory>/<OPERATION>.hdr.
+
+    :param directory: Absolute path of the output directory.
+    :type directory: Path
+    :rtype: list[str]
+    """
+    return ["-p", "measurementtype=hdrhistogram",
+            "-p", "hdrhistogram.fileoutput=true",
+            "-p", f"hdrhistogram.output.path={directory}/"]
+
+
+def stream_ycsb(cmd, cwd, on_status=None, echo=True):
+    """
+    Runs a YCSB command and consumes its stdout and stderr line by line as
+    the benchmark runs. Status lines go into a TimeSeries; the summary
+    lines are returned for parse_ycsb_output. Other output is discarded
+    once printed so memory stays bounded on long runs.
+
+    :param cmd: YCSB command line, status reporting is added if missing.
+    :type cmd: list
+    :param cwd: Working directory of the YCSB binary.
+    :type cwd: Path
+    :param on_status: Called with every parsed data point.
+    :type on_status: Callable[dict] | None
+    :param echo: Print every line as it arrives.
+    :type echo: bool
+    :return: The summary lines and the time series.
+    :rtype: tuple[list[str], TimeSeries]
+    """
+    cmd = list(cmd)
+    if "-s" not in cmd:
+        cmd += ["-s", "-p", f"status.interval={STATUS_INTERVAL}"]
+
+    summary = []
+    series = TimeSeries()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True, bufsize=1)
+    try:
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            if echo:
+                print(line)
+
+            if line.startswith("[") and not line.startswith(SKIPPED):
+                summary.append(line)
+                continue
+
+            point = parse_status_line(line)
+            if point is not None:
+                series.append(point)
+                if on_status:
+                    on_status(point)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+    return summary, series
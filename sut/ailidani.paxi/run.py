@@ -1,17 +1,44 @@
 from pathlib import Path
-import subprocess
-import threading
-import os
+import json
+from urllib.parse import urlsplit
 
 from src.utils import helper
+from src.utils import startup
+from src.utils import supervisor
 
 CURR_DIR = Path("./sut/ailidani.paxi")
 PAXI_BIN = CURR_DIR / "paxi" / "bin"
+CONFIG = CURR_DIR / "config.json"
+
+# What the results depend on, see src/utils/fingerprint.py
+BINARIES = [PAXI_BIN / "server"]
+CONFIG_FILES = [CONFIG]
+
+# Replicas started, see src/utils/replicas.py; config.json lists
+# DEFAULT_SIZE of them and is the template of the other sizes
+with open(CONFIG, "r") as f:
+    DEFAULT_SIZE = len(json.load(f)["address"])
+SIZE = DEFAULT_SIZE
+# config.json with the addresses of SIZE replicas
+SIZED_CONFIG = CURR_DIR / "sized" / "config.json"
+
+# HTTP client endpoints of the replicas, used by the native load generator
+HTTP_ADDRESS = {}
+ENDPOINTS = []
+
+# Replica-to-replica listen addresses, see src/utils/netem.py
+PEER_ADDRESSES = {}
+# Set by the harness to route peer traffic through src/utils/netem.py
+peer_routes = {}
+# Per-replica configs with routed peer addresses
+ROUTED_CONFIG_DIR = CURR_DIR / "netem"
 
 OPTIONS = [{"num": 0, "text": "Start Paxi"},
            {"num": 1, "text": "Stop Paxi"},
            {"num": 2, "text": "Run Benchmark"}]
 
+INTERFACE = "paxi"
+
 PROTOCOLS = [{"num": 1, "text": "paxos"},
              {"num": 2, "text": "epaxos"},
              {"num": 3, "text": "sdpaxos"},
@@ -28,24 +55,58 @@ PROTOCOLS = [{"num": 1, "text": "paxos"},
              {"num": 14, "text": "hpaxos"}]
 
 
-# Shared list to store job info
-jobs = []
+# Replicas of the running cluster, by node id
+cluster = supervisor.Supervisor()
+
 
+def cluster_config() -> dict[str]:
+    """
+    config.json with SIZE replicas. Node ids are "zone.node": the replicas
+    are spread as evenly as possible over the zones of config.json, the
+    first zones taking the extra ones, and numbered on from its first
+    peer and HTTP ports. The threshold, a majority of the replicas in
+    config.json, stays a majority of SIZE.
 
-def run_command(cmd) -> None:
+    :rtype: dict[str...]
     """
-    Runs a command in a new subprocess which will be tracked inside jobs list.
+    with open(CONFIG, "r") as f:
+        config = json.load(f)
+    if SIZE == DEFAULT_SIZE:
+        return config
+    zones = sorted({node_id.split(".")[0] for node_id in config["address"]},
+                   key=int)
+    counts = [SIZE // len(zones) + (z < SIZE % len(zones))
+              for z in range(len(zones))]
+    node_ids = [f"{zone}.{n}" for zone, count in zip(zones, counts)
+                for n in range(1, count + 1)]
+    peer = urlsplit(next(iter(config["address"].values())))
+    http = urlsplit(next(iter(config["http_address"].values())))
+    config["address"] = {node_id: f"tcp://{peer.hostname}:{peer.port + i}"
+                         for i, node_id in enumerate(node_ids)}
+    config["http_address"] = {
+        node_id: f"http://{http.hostname}:{http.port + i}"
+        for i, node_id in enumerate(node_ids)}
+    config["threshold"] = SIZE // 2 + 1
+    return config
+
 
-    :param cmd: Command line arguments
-    :type cmd: str[]
+def resize(size) -> None:
+    """
+    :param size: Number of replicas the next start runs, see cluster_config.
+    :type size: int
     """
-    proc = subprocess.Popen(cmd)
-    jobs.append({
-        'cmd': cmd,
-        'process': proc,
-        'thread': threading.current_thread()
-    })
-    proc.wait()
+    global SIZE
+    SIZE = size
+    config = cluster_config()
+    HTTP_ADDRESS.clear()
+    HTTP_ADDRESS.update(config["http_address"])
+    ENDPOINTS[:] = HTTP_ADDRESS.values()
+    PEER_ADDRESSES.clear()
+    PEER_ADDRESSES.update({node_id: urlsplit(url).netloc
+                           for node_id, url in config["address"].items()})
+
+
+resize(DEFAULT_SIZE)
 
 
 def main(run_ycsb) -> None:
@@ -66,63 +127,142 @@ def main(run_ycsb) -> None:
         match val:
             case 0:
                 prot_num = helper.get_option(1, len(PROTOCOLS), PROTOCOLS)
-                selected_protocol = {
-                    "name": PROTOCOLS[prot_num-1]["text"],
-                    "language": "Go",
-                }
-                start_paxi(PAXI_BIN, selected_protocol)
+                selected_protocol = get_protocol(PROTOCOLS[prot_num-1]["text"])
+                try:
+                    start_paxi(PAXI_BIN, selected_protocol)
+                except startup.StartupError as e:
+                    print(f"Error: {e}")
+                    stop_paxi()
             case 1:
                 stop_paxi()
             case 2:
-                run_ycsb(selected_protocol, "paxi")
+                run_ycsb(selected_protocol, INTERFACE)
+
+
+def get_protocol(name) -> dict[str, str]:
+    """
+    :param name: Protocol name from PROTOCOLS.
+    :type name: str
+    :return: Protocol data {name, language} used to store results.
+    :rtype: dict[str, str]
+    """
+    return {"name": name, "language": "Go"}
+
+
+def start(protocol_name) -> None:
+    """
+    Non-interactive start used by the batch runner in main.py.
+    """
+    start_paxi(PAXI_BIN, get_protocol(protocol_name))
+
+
+def stop() -> None:
+    """
+    Non-interactive stop used by the batch runner in main.py.
+    """
+    stop_paxi()
+
+
+def find_leader() -> str:
+    """
+    paxi exposes no leader query, so the leader is found by convention:
+    the first replica, which start_paxi sends the first request to and
+    which therefore runs the first election.
+
+    :return: Node id of the leader.
+    :rtype: str
+    """
+    return next(iter(HTTP_ADDRESS))
+
+
+def pids() -> dict[str, int]:
+    """
+    :return: Node id mapped to the pid of its running server.
+    :rtype: dict[str, int]
+    """
+    return cluster.pids()
+
+
+def restart(node_id) -> None:
+    """
+    Starts a crashed replica again with the protocol it ran before.
+
+    :param node_id: Node id from config.json, e.g. "1.1".
+    :type node_id: str
+    """
+    cluster.restart(node_id)
+
+
+def node_config(node_id) -> Path:
+    """
+    Without peer_routes every replica uses config.json, or SIZED_CONFIG
+    for another cluster size. With them, each replica gets a copy that
+    keeps its own address (which it listens on) and reaches the others at
+    their routes.
+
+    :param node_id: Node id from config.json, e.g. "1.1".
+    :type node_id: str
+    :return: Config file to start the replica with.
+    :rtype: Path
+    """
+    config = cluster_config()
+    if not peer_routes:
+        if SIZE == DEFAULT_SIZE:
+            return CONFIG
+        SIZED_CONFIG.parent.mkdir(exist_ok=True)
+        with open(SIZED_CONFIG, "w") as f:
+            json.dump(config, f, indent=4)
+        return SIZED_CONFIG
+    for other in config["address"]:
+        if other != node_id:
+            config["address"][other] = f"tcp://{peer_routes[other]}"
+    ROUTED_CONFIG_DIR.mkdir(exist_ok=True)
+    path = ROUTED_CONFIG_DIR / f"config.{node_id}.json"
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+    return path
 
 
 def start_paxi(path, protocol) -> None:
     """
-    Runs the paxi instances with the specified protocol in different
-    threads concurrently. Currently only supports local startup.
+    Runs the paxi instances with the specified protocol concurrently under
+    the cluster supervisor, then waits until every HTTP port accepts
+    connections and the first replica serves a request (which also gets
+    a leader elected). Currently only supports local startup.
 
     :param path: Path to bin/ directory inside the paxi repository.
     :type path: Path
     :param protocol: Protocol data that is being started.
     :type protocol: dict[str, str]
+    :raises startup.StartupError: If the replicas are not serving in time.
     """
     server = path / "server"
-    config = CURR_DIR / "config.json"
-
-    commands = [
-        [server, "-id", "1.1", f"-algorithm={protocol['name']}", "-config", config],
-        [server, "-id", "1.2", f"-algorithm={protocol['name']}", "-config", config],
-        [server, "-id", "1.3", f"-algorithm={protocol['name']}", "-config", config],
-        [server, "-id", "2.1", f"-algorithm={protocol['name']}", "-config", config],
-        [server, "-id", "2.2", f"-algorithm={protocol['name']}", "-config", config],
-    ]
-
-    # Start each command in its own thread
-    for cmd in commands:
-        print(f"Starting: {' '.join(map(str, cmd))}")
-        t = threading.Thread(target=run_command, args=(cmd,))
-        t.start()
+
+    for node_id in HTTP_ADDRESS:
+        cluster.spawn(node_id, [server, "-id", node_id,
+                                f"-algorithm={protocol['name']}",
+                                "-config", node_config(node_id)])
+
+    probes = {}
+    for node_id, url in HTTP_ADDRESS.items():
+        parts = urlsplit(url)
+        probes[node_id] = startup.tcp_probe(parts.hostname, parts.port)
+    startup.wait_ready(probes, processes=cluster.replicas)
+
+    # Only one replica is asked, so proposers do not duel for leadership
+    first_id, first_url = next(iter(HTTP_ADDRESS.items()))
+    startup.wait_ready({first_id: startup.http_probe(f"{first_url}/0")})
     print(f"Paxi {protocol['name']} instances successfully started")
 
 
 def stop_paxi() -> None:
     """
-    Terminates all running instances of paxi that are still recorded inside
-    the jobs list, then removes all the logfiles created by the instances.
-    """
-    for job in jobs:
-        proc = job['process']
-        if proc.poll() is None:  # Still running
-            print(f"Terminating: {' '.join(map(str, job['cmd']))}")
-            proc.terminate()
-            try:
-                proc.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                print(f"Force killing: {' '.join(map(str, job['cmd']))}")
-                proc.kill()
-
-    os.system("rm server.*")
+    Terminates all running instances of paxi at once, then removes all the
+    logfiles created by the instances.
+    """
+    cluster.stop()
+    for log in Path().glob("server.*"):
+        log.unlink()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,6 @@
 #!/bin/bash
 
-rm -rf /tmp/etcd-node1
-rm -rf /tmp/etcd-node2
-rm -rf /tmp/etcd-node3
-rm -rf /tmp/etcd-node4
-rm -rf /tmp/etcd-node5
+rm -rf /tmp/etcd-node*
 
 rm -f *.log
 rm -f *.out
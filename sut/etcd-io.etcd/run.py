@@ -1,24 +1,81 @@
 from pathlib import Path
+import shlex
 import subprocess
-import time
-import os
+import json
 
 from src.utils import helper
+from src.utils import startup
+from src.utils import supervisor
 
 CURR_DIR = Path("./sut/etcd-io.etcd")
 ETCDCTL = CURR_DIR / "bin" / "etcdctl"
 
+# Members started, see src/utils/replicas.py; the Procfile runs
+# DEFAULT_SIZE of them
+DEFAULT_SIZE = 5
+SIZE = DEFAULT_SIZE
+
+# Client URLs from the Procfile, used by the native load generator
+ENDPOINTS = []
+
+# Member data directories from the Procfile, see src/utils/snapshot.py
+DATA_DIRS = {}
+
+# pprof handlers on the client URLs, see src/utils/profiling.py; members
+# serve them with ETCD_ENABLE_PPROF, the environment form of --enable-pprof
+PPROF_ENDPOINTS = {}
+
+# --listen-peer-urls of the Procfile, see src/utils/netem.py
+PEER_ADDRESSES = {}
+# Set by the harness to route peer traffic through src/utils/netem.py
+peer_routes = {}
+PROCFILE = "Procfile"
+# Procfile of SIZE members, when it is not DEFAULT_SIZE
+SIZED_PROCFILE = "Procfile.sized"
+# Procfile with the advertised peer URLs replaced by peer_routes
+ROUTED_PROCFILE = "Procfile.netem"
+
+# What the results depend on, see src/utils/fingerprint.py
+BINARIES = [CURR_DIR / "bin" / "etcd"]
+CONFIG_FILES = [CURR_DIR / PROCFILE]
+
 OPTIONS = [{"num": 0, "text": "Start etcd cluster"},
            {"num": 1, "text": "Stop etcd cluster"},
            {"num": 2, "text": "Run Benchmark"}]
 
-goreman_process = None
+INTERFACE = "etcd"
+
+# YCSB etcd binding property pointing a client at given members
+YCSB_ENDPOINT_PROPERTY = "etcd.endpoints"
+
+PROTOCOLS = [{"num": 1, "text": "raft"}]
+
+# goreman runs the members, they share its process group
+cluster = supervisor.Supervisor()
+
+def resize(size):
+    """
+    Lays out size members like the Procfile: node<i> serves clients on
+    port 2279 + i * 100 and peers on 2280 + i * 100, with its data in
+    /tmp/etcd-node<i>.
+    """
+    global SIZE
+    SIZE = size
+    nodes = range(1, size + 1)
+    ENDPOINTS[:] = [f"http://127.0.0.1:{2279 + i * 100}" for i in nodes]
+    DATA_DIRS.clear()
+    DATA_DIRS.update({f"node{i}": Path(f"/tmp/etcd-node{i}") for i in nodes})
+    PEER_ADDRESSES.clear()
+    PEER_ADDRESSES.update({f"node{i}": f"127.0.0.1:{2280 + i * 100}"
+                           for i in nodes})
+    PPROF_ENDPOINTS.clear()
+    PPROF_ENDPOINTS.update({f"node{i}": f"{url}/debug/pprof"
+                            for i, url in zip(nodes, ENDPOINTS)})
+
+resize(DEFAULT_SIZE)
 
 def main(run_ycsb):
-    selected_protocol = {
-        "name": "raft",
-        "language": "Go",
-    }
+    selected_protocol = get_protocol("raft")
     
     while True:
         val = helper.get_option(0, len(OPTIONS) - 1, OPTIONS)
@@ -26,30 +83,144 @@ def main(run_ycsb):
 
         match val:
             case 0:
-                start_etcd_cluster()
+                try:
+                    start_etcd_cluster()
+                except startup.StartupError as e:
+                    print(f"Error: {e}")
+                    stop_etcd_cluster()
             case 1:
                 stop_etcd_cluster()
             case 2:
-                run_ycsb(selected_protocol, "etcd")
+                run_ycsb(selected_protocol, INTERFACE)
 
-def start_etcd_cluster():
-    global goreman_process
-    
-    # Clean up first
-    os.system(f"cd {CURR_DIR} && ./clean.sh")
+def get_protocol(name):
+    return {"name": name, "language": "Go"}
+
+def start(protocol_name, keep_data=False):
+    start_etcd_cluster(keep_data)
+
+def stop(keep_data=False):
+    stop_etcd_cluster(keep_data)
+
+def find_leader():
+    """
+    Asks every member for its status and returns the name of the one whose
+    member id is the reported leader.
+    """
+    result = subprocess.run(
+        [ETCDCTL, f"--endpoints={','.join(ENDPOINTS)}", "endpoint", "status",
+         "--write-out=json"],
+        capture_output=True, text=True, timeout=5)
+    for endpoint in json.loads(result.stdout):
+        status = endpoint["Status"]
+        if status["header"]["member_id"] == status["leader"]:
+            return f"node{ENDPOINTS.index(endpoint['Endpoint']) + 1}"
+    raise RuntimeError("No etcd member reports itself as leader")
+
+def pids():
+    """
+    goreman starts the members, so they are found by their --name argument.
+    """
+    found = {}
+    for proc in Path("/proc").iterdir():
+        if not proc.name.isdigit():
+            continue
+        try:
+            args = (proc / "cmdline").read_bytes().split(b"\0")
+        except OSError:
+            continue
+        if args[0].endswith(b"etcd") and b"--name" in args:
+            found[args[args.index(b"--name") + 1].decode()] = int(proc.name)
+    return found
+
+def restart(node):
+    # goreman's RPC server restarts a single process of the Procfile
+    subprocess.run(["goreman", "run", "start", node], cwd=CURR_DIR)
+
+def clean():
+    subprocess.run(["./clean.sh"], cwd=CURR_DIR)
+
+def write_sized_procfile():
+    """
+    The Procfile runs DEFAULT_SIZE members; other sizes get one written
+    with the same flags for every member of the layout of resize.
+
+    :return: Name of the Procfile to run, relative to CURR_DIR.
+    """
+    if SIZE == DEFAULT_SIZE:
+        return PROCFILE
+    initial_cluster = ",".join(f"{node}=http://{address}"
+                               for node, address in PEER_ADDRESSES.items())
+    lines = []
+    for node, client_url in zip(PEER_ADDRESSES, ENDPOINTS):
+        peer_url = f"http://{PEER_ADDRESSES[node]}"
+        args = ["./bin/etcd", "--name", node,
+                "--data-dir", str(DATA_DIRS[node]),
+                "--listen-client-urls", client_url,
+                "--advertise-client-urls", client_url,
+                "--listen-peer-urls", peer_url,
+                "--initial-advertise-peer-urls", peer_url,
+                "--initial-cluster", initial_cluster,
+                "--initial-cluster-token", "etcd-cluster-1",
+                "--initial-cluster-state", "new"]
+        lines.append(f"{node}: {shlex.join(args)}")
+    (CURR_DIR / SIZED_PROCFILE).write_text("\n\n".join(lines) + "\n")
+    return SIZED_PROCFILE
+
+def write_routed_procfile(procfile):
+    """
+    Members keep listening on --listen-peer-urls but advertise, and find
+    each other in --initial-cluster at, their peer_routes.
+
+    :param procfile: Name of the Procfile to route, relative to CURR_DIR.
+    :return: Name of the Procfile to run, relative to CURR_DIR.
+    """
+    if not peer_routes:
+        return procfile
+    urls = {f"http://{PEER_ADDRESSES[node]}": f"http://{route}"
+            for node, route in peer_routes.items()}
+    lines = []
+    for line in (CURR_DIR / procfile).read_text().splitlines():
+        if ":" not in line:
+            lines.append(line)
+            continue
+        name, command = line.split(":", 1)
+        args = shlex.split(command)
+        for flag in ("--initial-advertise-peer-urls", "--initial-cluster"):
+            if flag in args:
+                # a list of URLs, or of name=URL for --initial-cluster
+                i = args.index(flag) + 1
+                entries = []
+                for entry in args[i].split(","):
+                    member, sep, url = entry.rpartition("=")
+                    entries.append(member + sep + urls.get(url, url))
+                args[i] = ",".join(entries)
+        lines.append(f"{name}: {shlex.join(args)}")
+    (CURR_DIR / ROUTED_PROCFILE).write_text("\n".join(lines) + "\n")
+    return ROUTED_PROCFILE
+
+def start_etcd_cluster(keep_data=False):
+    # Clean up first, members with a data directory ignore --initial-cluster
+    if not keep_data:
+        clean()
     
     print("Starting etcd cluster with goreman...")
-    goreman_process = subprocess.Popen(
-        ["goreman", "start"],
-        cwd=CURR_DIR,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
+    procfile = write_routed_procfile(write_sized_procfile())
+    goreman = cluster.spawn("goreman", ["goreman", "-f", procfile, "start"],
+                            cwd=CURR_DIR,
+                            env={"ETCD_ENABLE_PPROF": "true"},
+                            log_path=CURR_DIR / "goreman.log")
     
-    # Wait for cluster to form
+    # Wait for cluster to form: /health only reports true once the member
+    # sees a leader
     print("Waiting for cluster to initialize...")
-    time.sleep(5)
-    
+    probes = {}
+    for i, url in enumerate(ENDPOINTS, start=1):
+        probes[f"node{i}"] = startup.http_probe(
+            f"{url}/health",
+            check=lambda body: json.loads(body).get("health") == "true")
+    startup.wait_ready(probes, processes={name: goreman for name in probes})
+
     # Verify cluster is running
     try:
         result = subprocess.run(
@@ -74,28 +245,20 @@ def start_etcd_cluster():
         print(f"Error verifying cluster: {e}")
         stop_etcd_cluster()
 
-def stop_etcd_cluster():
-    global goreman_process
-    
-    if goreman_process and goreman_process.poll() is None:
+def stop_etcd_cluster(keep_data=False):
+    if cluster.pids():
         print("Stopping etcd cluster...")
-        goreman_process.terminate()
-        try:
-            goreman_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            print("Force killing etcd cluster...")
-            goreman_process.kill()
-            goreman_process.wait()
-        
-        goreman_process = None
+        cluster.stop()
         print("etcd cluster stopped")
     
     # Clean up
-    os.system(f"cd {CURR_DIR} && ./clean.sh")
-    print("Cleanup completed")
+    if not keep_data:
+        clean()
+        print("Cleanup completed")
 
 if __name__ == "__main__":
     def mock_run_ycsb(protocol, interface):
-        print(f"Would run YCSB with protocol: {protocol}, interface: {interface}")
+        print(f"Would run YCSB with protocol: {protocol}, "
+              f"interface: {interface}")
     
     main(mock_run_ycsb)
\ No newline at end of file
@@ -1,11 +1,10 @@
 from pathlib import Path
-import subprocess
-import threading
-import os
-import time
+import json
 import shutil
 
 from src.utils import helper
+from src.utils import startup
+from src.utils import supervisor
 
 CURR_DIR = Path("./sut/holipaxos-artifect.holipaxos")
 BIN_DIR = CURR_DIR / "bin"
@@ -16,6 +15,8 @@ OPTIONS = [{"num": 0, "text": "Start HoliPaxos cluster"},
            {"num": 1, "text": "Stop HoliPaxos cluster"},
            {"num": 2, "text": "Run Benchmark"}]
 
+INTERFACE = "holipaxos"
+
 PROTOCOLS = [{"num": 1, "text": "holipaxos"},
              {"num": 2, "text": "multipaxos"},
              {"num": 3, "text": "omnipaxos"}]
@@ -38,64 +39,137 @@ PROTOCOL_CONFIGS = {
     }
 }
 
-NODES = [0, 1, 2, 3, 4]
+# Replicants started, see src/utils/replicas.py; config/ describes
+# DEFAULT_SIZE of them
+DEFAULT_SIZE = 5
+SIZE = DEFAULT_SIZE
+# Node configs of SIZE replicants, generated from config_node0.json
+SIZED_CONFIG_DIR = CURR_DIR / "sized"
+
+NODES = []
+
+# What the results depend on, see src/utils/fingerprint.py
+BINARIES = {name: [BIN_DIR / config["binary"]]
+            for name, config in PROTOCOL_CONFIGS.items()}
+CONFIG_FILES = [CONFIG_DIR / f"config_node{node_id}.json"
+                for node_id in range(DEFAULT_SIZE)]
+
+# Consensus ports of the replicants (peers in config/), see src/utils/netem.py
+PEER_ADDRESSES = {}
+# Set by the harness to route peer traffic through src/utils/netem.py
+peer_routes = {}
+# Per-node configs with routed peers
+ROUTED_CONFIG_DIR = CURR_DIR / "netem"
 
-# Shared list to store job info
-jobs = []
+# RocksDB directories (db_path in config/), see src/utils/snapshot.py
+DATA_DIRS = {}
 
+# Replicants of the running cluster, by node name
+cluster = supervisor.Supervisor()
 
-def run_command(cmd, env=None, log_file=None) -> None:
+
+def resize(size) -> None:
     """
-    :param cmd: Command line arguments
-    :type cmd: str[]
-    :param env: Environment variables
-    :type env: dict
-    :param log_file: Path to log file for stdout/stderr redirection
-    :type log_file: str
+    Lays out size replicants like config/: node i listens for consensus
+    on port 10000 + i * 1000, for clients on the port after it, and keeps
+    its RocksDB in /tmp/presistent_node<i>.
+
+    :param size: Number of replicants the next start runs.
+    :type size: int
     """
-    proc_env = os.environ.copy()
-    if env:
-        proc_env.update(env)
-    
-    # Redirect stdout and stderr to log file if provided
-    log_handle = None
-    if log_file:
-        log_handle = open(log_file, 'w')
-        proc = subprocess.Popen(cmd, env=proc_env, stdout=log_handle, stderr=subprocess.STDOUT)
-    else:
-        proc = subprocess.Popen(cmd, env=proc_env)
-    
-    jobs.append({
-        'cmd': cmd,
-        'process': proc,
-        'log_file': log_handle,
-        'thread': threading.current_thread()
-    })
+    global SIZE
+    SIZE = size
+    NODES[:] = range(size)
+    PEER_ADDRESSES.clear()
+    PEER_ADDRESSES.update({
+        f"node{node_id}": f"127.0.0.1:{10000 + node_id * 1000}"
+        for node_id in NODES})
+    DATA_DIRS.clear()
+    DATA_DIRS.update({f"node{node_id}": Path(f"/tmp/presistent_node{node_id}")
+                      for node_id in NODES})
+
+
+resize(DEFAULT_SIZE)
 
 
 def build_command(protocol_name, node_id):
     """
-    :param protocol_name: Name of the protocol (holipaxos, multipaxos, omnipaxos)
+    :param protocol_name: Name of the protocol (holipaxos, multipaxos,
+                          omnipaxos)
     :type protocol_name: str
-    :param node_id: Node ID (0-4)
+    :param node_id: Node ID
     :type node_id: int
     :return: Command array and environment variables
     :rtype: tuple[list[str], dict]
     """
     config = PROTOCOL_CONFIGS[protocol_name]
     binary_path = BIN_DIR / config["binary"]
-    config_file = CONFIG_DIR / f"config_node{node_id}.json"
+    config_file = node_config(node_id)
     
     if config["args_format"] == "posix":
         # holipaxos and multipaxos: -id X -c config -d
-        cmd = [str(binary_path), "-id", str(node_id), "-c", str(config_file), "-d"]
+        cmd = [str(binary_path), "-id", str(node_id), "-c", str(config_file),
+               "-d"]
     else: 
         # omnipaxos: --id X --config-path config
-        cmd = [str(binary_path), "--id", str(node_id), "--config-path", str(config_file)]
+        cmd = [str(binary_path), "--id", str(node_id),
+               "--config-path", str(config_file)]
     
     return cmd, config["env"]
 
 
+def sized_config(node_id) -> Path:
+    """
+    config/ holds the configs of DEFAULT_SIZE replicants; for other sizes
+    the node's config is config_node0.json with the peers and db_path of
+    the layout of resize, and a threshold of SIZE: config/ sets it to the
+    number of replicants.
+
+    :param node_id: Node ID
+    :type node_id: int
+    :return: Config file of the node for SIZE replicants.
+    :rtype: Path
+    """
+    if SIZE == DEFAULT_SIZE:
+        return CONFIG_DIR / f"config_node{node_id}.json"
+    with open(CONFIG_DIR / "config_node0.json", "r") as f:
+        config = json.load(f)
+    config["peers"] = [f"0.0.0.0:{10000 + other * 1000}" for other in NODES]
+    config["db_path"] = str(DATA_DIRS[f"node{node_id}"])
+    config["threshold"] = SIZE
+    SIZED_CONFIG_DIR.mkdir(exist_ok=True)
+    path = SIZED_CONFIG_DIR / f"config_node{node_id}.json"
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+    return path
+
+
+def node_config(node_id) -> Path:
+    """
+    A replicant listens on its own entry of peers and connects to the
+    others, so with peer_routes every other entry is replaced by its route
+    in a copy of the node's config.
+
+    :param node_id: Node ID
+    :type node_id: int
+    :return: Config file to start the replicant with.
+    :rtype: Path
+    """
+    config_file = sized_config(node_id)
+    if not peer_routes:
+        return config_file
+    with open(config_file, "r") as f:
+        config = json.load(f)
+    config["peers"] = [
+        peer if other == node_id else peer_routes[f"node{other}"]
+        for other, peer in zip(NODES, config["peers"])]
+    ROUTED_CONFIG_DIR.mkdir(exist_ok=True)
+    routed = ROUTED_CONFIG_DIR / config_file.name
+    with open(routed, "w") as f:
+        json.dump(config, f, indent=4)
+    return routed
+
+
 def main(run_ycsb) -> None:
     selected_protocol = None
     while True:
@@ -106,65 +180,111 @@ def main(run_ycsb) -> None:
             case 0:
                 prot_num = helper.get_option(1, len(PROTOCOLS), PROTOCOLS)
                 protocol_name = PROTOCOLS[prot_num-1]["text"]
-                selected_protocol = {
-                    "name": protocol_name,
-                    "language": "Go" if protocol_name != "omnipaxos" else "Rust",
-                }
-                start_holipaxos_cluster(protocol_name)
+                selected_protocol = get_protocol(protocol_name)
+                try:
+                    start_holipaxos_cluster(protocol_name)
+                except startup.StartupError as e:
+                    print(f"Error: {e}")
+                    stop_holipaxos_cluster()
             case 1:
                 stop_holipaxos_cluster()
             case 2:
                 if selected_protocol:
-                    run_ycsb(selected_protocol, "holipaxos")
+                    run_ycsb(selected_protocol, INTERFACE)
                 else:
                     print("Please start a cluster first")
 
 
-def start_holipaxos_cluster(protocol_name) -> None:
+def get_protocol(name) -> dict[str, str]:
+    """
+    :param name: Protocol name from PROTOCOLS.
+    :type name: str
+    :return: Protocol data {name, language} used to store results.
+    :rtype: dict[str, str]
+    """
+    return {
+        "name": name,
+        "language": "Go" if name != "omnipaxos" else "Rust",
+    }
+
+
+def start(protocol_name, keep_data=False) -> None:
+    """
+    Non-interactive start used by the batch runner in main.py.
+    """
+    start_holipaxos_cluster(protocol_name, keep_data)
+
+
+def stop(keep_data=False) -> None:
+    """
+    Non-interactive stop used by the batch runner in main.py.
+    """
+    stop_holipaxos_cluster(keep_data)
+
+
+def find_leader() -> str:
+    """
+    The replicants expose no leader query, so the leader is found by
+    convention: node 0, which the YCSB binding sends its requests to.
+
+    :return: Name of the leader node.
+    :rtype: str
+    """
+    return f"node{NODES[0]}"
+
+
+def pids() -> dict[str, int]:
+    """
+    :return: Node name mapped to the pid of its running replicant.
+    :rtype: dict[str, int]
+    """
+    return cluster.pids()
+
+
+def restart(node) -> None:
+    """
+    Starts a crashed replicant again, appending to its log file. Its
+    RocksDB directory is kept so it recovers from its own state.
+
+    :param node: Node name, e.g. "node0".
+    :type node: str
+    """
+    cluster.restart(node)
+
+
+def start_holipaxos_cluster(protocol_name, keep_data=False) -> None:
     LOG_DIR.mkdir(exist_ok=True)
     
-    stop_holipaxos_cluster()
+    stop_holipaxos_cluster(keep_data)
     
     print(f"Starting {protocol_name} cluster with {len(NODES)} nodes...")
-    
+
+    probes = {}
     for node_id in NODES:
         cmd, env = build_command(protocol_name, node_id)
         consensus_port = 10000 + node_id * 1000
         client_port = consensus_port + 1
         log_file = LOG_DIR / f"node_{node_id}.log"
         
-        print(f"Starting Node {node_id}: consensus=localhost:{consensus_port}, client=localhost:{client_port}")
-        print(f"Command: {' '.join(cmd)}")
-        
-        t = threading.Thread(target=run_command, args=(cmd, env, str(log_file)))
-        t.start()
-        time.sleep(1) 
-    
+        print(f"Starting Node {node_id}: consensus=localhost:"
+              f"{consensus_port}, client=localhost:{client_port}")
+
+        cluster.spawn(f"node{node_id}", cmd, env=env, log_path=log_file)
+        probes[f"node{node_id}"] = startup.tcp_probe("localhost", client_port)
+
+    startup.wait_ready(probes, processes=cluster.replicas)
+
     print(f"{protocol_name} cluster started successfully")
 
 
-def stop_holipaxos_cluster() -> None:
+def stop_holipaxos_cluster(keep_data=False) -> None:
     print("Stopping cluster...")
+    cluster.stop()
+    if keep_data:
+        print("Cluster stopped")
+        return
     
-    for job in jobs:
-        proc = job['process']
-        if proc.poll() is None: 
-            print(f"Terminating: {' '.join(map(str, job['cmd']))}")
-            proc.terminate()
-            try:
-                proc.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                print(f"Force killing: {' '.join(map(str, job['cmd']))}")
-                proc.kill()
-        
-        # Close log file handle if it exists
-        if job.get('log_file'):
-            job['log_file'].close()
-    
-    jobs.clear()
-    
-    for node_id in NODES:
-        data_dir = Path(f"/tmp/presistent_node{node_id}")
+    for data_dir in DATA_DIRS.values():
         if data_dir.exists():
             shutil.rmtree(data_dir)
     
@@ -173,7 +293,8 @@ def stop_holipaxos_cluster() -> None:
 
 if __name__ == "__main__":
     def mock_run_ycsb(protocol, interface):
-        print(f"Would run YCSB with protocol: {protocol}, interface: {interface}")
+        print(f"Would run YCSB with protocol: {protocol}, "
+              f"interface: {interface}")
     
     main(mock_run_ycsb)
 
@@ -1,35 +1,67 @@
 from pathlib import Path
-import subprocess
-import threading
-import time
-import os
-import signal
+from urllib.parse import urlsplit
+import json
+import shutil
 
 from src.utils import helper
+from src.utils import startup
+from src.utils import supervisor
 
 CURR_DIR = Path("./sut/otoolep.hraftd")
 HRAFTD_BIN = CURR_DIR / "hraftd"
 
+# What the results depend on, see src/utils/fingerprint.py; the nodes are
+# configured on their command lines in this file
+BINARIES = [HRAFTD_BIN]
+CONFIG_FILES = []
+
+# Nodes started, see src/utils/replicas.py
+DEFAULT_SIZE = 5
+SIZE = DEFAULT_SIZE
+
+# -haddr of every node, used by the native load generator
+ENDPOINTS = []
+
+# Raft log and snapshots of every node, see src/utils/snapshot.py
+DATA_DIRS = {}
+
+# -raddr of every node, see src/utils/netem.py
+PEER_ADDRESSES = {}
+# Set by the harness to route peer traffic through src/utils/netem.py
+peer_routes = {}
+
+# Written through the leader once, then read back from every follower
+PROBE_KEY = "distrobench-ready"
+
 OPTIONS = [{"num": 0, "text": "Start hraftd cluster"},
            {"num": 1, "text": "Stop hraftd cluster"},
            {"num": 2, "text": "Run Benchmark"}]
 
-jobs = []
+INTERFACE = "hraftd"
+
+PROTOCOLS = [{"num": 1, "text": "raft"}]
 
-def run_command(cmd, cwd=None):
-    proc = subprocess.Popen(cmd, cwd=cwd)
-    jobs.append({
-        'cmd': cmd,
-        'process': proc,
-        'thread': threading.current_thread()
-    })
-    proc.wait()
+cluster = supervisor.Supervisor()
+
+def resize(size):
+    """
+    Lays out size nodes: node<i> serves HTTP on port 11000 + i and Raft on
+    12000 + i, and keeps its data in /tmp/hraftd-node<i>.
+    """
+    global SIZE
+    SIZE = size
+    nodes = range(1, size + 1)
+    ENDPOINTS[:] = [f"http://localhost:{11000 + i}" for i in nodes]
+    DATA_DIRS.clear()
+    DATA_DIRS.update({f"node{i}": Path(f"/tmp/hraftd-node{i}") for i in nodes})
+    PEER_ADDRESSES.clear()
+    PEER_ADDRESSES.update({f"node{i}": f"localhost:{12000 + i}"
+                           for i in nodes})
+
+resize(DEFAULT_SIZE)
 
 def main(run_ycsb):
-    selected_protocol = {
-        "name": "raft",
-        "language": "Go",
-    }
+    selected_protocol = get_protocol("raft")
     
     while True:
         val = helper.get_option(0, len(OPTIONS) - 1, OPTIONS)
@@ -37,61 +69,108 @@ def main(run_ycsb):
 
         match val:
             case 0:
-                start_hraftd_cluster()
+                try:
+                    start_hraftd_cluster()
+                except startup.StartupError as e:
+                    print(f"Error: {e}")
+                    stop_hraftd_cluster()
             case 1:
                 stop_hraftd_cluster()
             case 2:
-                run_ycsb(selected_protocol, "hraftd")
+                run_ycsb(selected_protocol, INTERFACE)
+
+def get_protocol(name):
+    return {"name": name, "language": "Go"}
+
+def start(protocol_name, keep_data=False):
+    # The nodes never wipe their data directories on start
+    start_hraftd_cluster()
+
+def stop(keep_data=False):
+    stop_hraftd_cluster(keep_data)
+
+def find_leader():
+    """
+    hraftd has no status API, but only the leader accepts writes: every
+    other node answers a write with an error. The probe key is written to
+    each node in turn until one succeeds.
+    """
+    for i, url in enumerate(ENDPOINTS, start=1):
+        try:
+            startup.http_probe(f"{url}/key", method="POST",
+                               body=json.dumps({PROBE_KEY: "1"}).encode())()
+            return f"node{i}"
+        except Exception:
+            continue
+    raise RuntimeError("No hraftd node accepted a write")
+
+def pids():
+    return cluster.pids()
+
+def restart(node):
+    # The data directory is kept, so the node rejoins with its log
+    cluster.restart(node)
 
 def start_hraftd_cluster():
-    for i in range(1, 6):
-        os.makedirs(f"/tmp/hraftd-node{i}", exist_ok=True)
-    
-    commands = [
-        [HRAFTD_BIN, "-id", "node1", "-haddr", "localhost:11001", 
-         "-raddr", "localhost:12001", "/tmp/hraftd-node1"],
-        
-        [HRAFTD_BIN, "-id", "node2", "-haddr", "localhost:11002", 
-         "-raddr", "localhost:12002", "-join", "localhost:11001", "/tmp/hraftd-node2"],
-        
-        [HRAFTD_BIN, "-id", "node3", "-haddr", "localhost:11003", 
-         "-raddr", "localhost:12003", "-join", "localhost:11001", "/tmp/hraftd-node3"],
-        
-        [HRAFTD_BIN, "-id", "node4", "-haddr", "localhost:11004", 
-         "-raddr", "localhost:12004", "-join", "localhost:11001", "/tmp/hraftd-node4"],
-        
-        [HRAFTD_BIN, "-id", "node5", "-haddr", "localhost:11005", 
-         "-raddr", "localhost:12005", "-join", "localhost:11001", "/tmp/hraftd-node5"],
-    ]
+    for data_dir in DATA_DIRS.values():
+        data_dir.mkdir(exist_ok=True)
     
-    print(f"Starting: {' '.join(map(str, commands[0]))}")
-    t = threading.Thread(target=run_command, args=(commands[0],))
-    t.start()
-    
-    time.sleep(3)
+    # node1 bootstraps the cluster, the others join through it
+    leader_addr = urlsplit(ENDPOINTS[0]).netloc
+    commands = []
+    for i, (node, url) in enumerate(zip(DATA_DIRS, ENDPOINTS)):
+        cmd = [HRAFTD_BIN, "-id", node, "-haddr", urlsplit(url).netloc,
+               "-raddr", PEER_ADDRESSES[node]]
+        if i > 0:
+            cmd += ["-join", leader_addr]
+        commands.append(cmd + [str(DATA_DIRS[node])])
     
+    cluster.spawn("node1", commands[0])
+
+    # Joins are handled by node1 and fail unless it is already the leader,
+    # which a successful write proves.
+    startup.wait_ready({"node1": startup.http_probe(
+        f"{ENDPOINTS[0]}/key", method="POST",
+        body=json.dumps({PROBE_KEY: "1"}).encode())},
+        processes=cluster.replicas)
+
     for cmd in commands[1:]:
-        print(f"Starting: {' '.join(map(str, cmd))}")
-        t = threading.Thread(target=run_command, args=(cmd,))
-        t.start()
-        time.sleep(1)
-    
+        cluster.spawn(cmd[2], cmd)
+
+    # A follower has joined and caught up once it returns the probe key
+    probes = {}
+    for i, url in enumerate(ENDPOINTS[1:], start=2):
+        probes[f"node{i}"] = startup.http_probe(
+            f"{url}/key/{PROBE_KEY}",
+            check=lambda body: json.loads(body).get(PROBE_KEY) == "1")
+    startup.wait_ready(probes, processes=cluster.replicas)
+
+    if peer_routes:
+        route_followers()
+
     print("hraftd cluster successfully started")
 
-def stop_hraftd_cluster():
-    for job in jobs:
-        proc = job['process']
-        if proc.poll() is None:
-            print(f"Terminating: {' '.join(map(str, job['cmd']))}")
-            proc.terminate()
-            try:
-                proc.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                print(f"Force killing: {' '.join(map(str, job['cmd']))}")
-                proc.kill()
-    
-    os.system("rm -rf /tmp/hraftd-node*")
-    jobs.clear()
+def route_followers():
+    """
+    hraftd advertises its -raddr, which it also binds, so the followers
+    join with their real address first. Joining again with their route
+    makes the leader replace them in the configuration with the routed
+    address. node1 bootstrapped the cluster with its own -raddr, so
+    traffic towards node1 is not routed.
+    """
+    for node, route in peer_routes.items():
+        if node == "node1":
+            continue
+        startup.wait_ready({node: startup.http_probe(
+            f"{ENDPOINTS[0]}/join", method="POST",
+            body=json.dumps({"addr": route, "id": node}).encode())},
+            processes=cluster.replicas)
+
+def stop_hraftd_cluster(keep_data=False):
+    cluster.stop()
+    if not keep_data:
+        for data_dir in Path("/tmp").glob("hraftd-node*"):
+            shutil.rmtree(data_dir, ignore_errors=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file